@@ -0,0 +1,117 @@
+# -*- coding: UTF-8
+# bench_answers_loader
+# ********************
+#
+# Compares the loading of the questionnaire answers of synthetic tips with
+# deeply nested and repeated field groups done walking the ORM references
+# of each group with the one done by db_get_questionnaire_answers_tree.
+#
+# Usage: python benchmarks/bench_answers_loader.py [tips] [depth] [entries]
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks import models
+from globaleaks.handlers.submission import db_get_questionnaire_answers_tree, db_save_questionnaire_answers
+from globaleaks.orm import transact
+from globaleaks.settings import GLSettings
+from globaleaks.utils.sqltracers import QueryStats, install_query_counter, set_current_transaction
+
+
+def make_answers(depth, entries):
+    answers = {u'leaf_%d' % i: u'value %d' % i for i in range(entries)}
+
+    if depth > 0:
+        answers[u'group'] = [make_answers(depth - 1, entries) for _ in range(entries)]
+
+    return answers
+
+
+def walk_references(answers):
+    ret = {}
+
+    for answer in answers:
+        if answer.is_leaf:
+            ret[answer.key] = answer.value
+        else:
+            ret[answer.key] = [walk_references(group.fieldanswers)
+                               for group in answer.groups.order_by(models.FieldAnswerGroup.number)]
+
+    return ret
+
+
+@transact
+def create_schema(store):
+    with open(GLSettings.db_schema) as f:
+        for query in f.read().split(';'):
+            store.execute(query + ';')
+
+
+@transact
+def create_tips(store, tips, answers):
+    for i in range(tips):
+        db_save_questionnaire_answers(store, u'tip_%d' % i, answers)
+
+
+@transact
+def load_answers(store, tips, keys, loader):
+    query_stats = QueryStats(loader)
+    set_current_transaction(loader, query_stats)
+
+    for i in range(tips):
+        if loader == 'references':
+            walk_references(store.find(models.FieldAnswer,
+                                       models.FieldAnswer.internaltip_id == u'tip_%d' % i,
+                                       models.FieldAnswer.fieldanswergroup_id == None))
+        else:
+            db_get_questionnaire_answers_tree(store, u'tip_%d' % i, keys)
+
+    return query_stats.count
+
+
+@inlineCallbacks
+def run(tips, depth, entries):
+    install_query_counter()
+
+    answers = make_answers(depth, entries)
+
+    yield create_schema()
+    yield create_tips(tips, answers)
+
+    for loader in ['references', 'tree']:
+        start = time.time()
+        queries = yield load_answers(tips, set(answers.keys()), loader)
+        elapsed = time.time() - start
+
+        print("%s: tips: %d queries: %d elapsed: %.3fs (%.1f tips/s)" %
+              (loader, tips, queries, elapsed, tips / elapsed))
+
+
+def main():
+    tips = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    entries = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    tmpdir = tempfile.mkdtemp()
+    GLSettings.eval_paths()
+
+    # the synthetic answers are not bound to actual tips
+    GLSettings.db_uri = 'sqlite:' + os.path.join(tmpdir, 'bench.db') + '?journal_mode=WAL'
+
+    d = run(tips, depth, entries)
+    d.addErrback(lambda failure: failure.printTraceback())
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+
+    shutil.rmtree(tmpdir, True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# -*- coding: UTF-8
+# bench_answers_writer
+# ********************
+#
+# Measures the latency of the transaction saving the answers of a
+# submission against the size of the questionnaire, comparing the ORM
+# objects based writer with the bulk one of db_save_questionnaire_answers.
+#
+# Usage: python benchmarks/bench_answers_writer.py [submissions] [sizes]
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks import models
+from globaleaks.handlers.submission import db_save_questionnaire_answers
+from globaleaks.orm import transact
+from globaleaks.settings import GLSettings
+from globaleaks.utils.utility import uuid4
+
+
+def make_answers(size):
+    """
+    Returns answers made of size leaves; half of them are leaves of
+    groups of five entries
+    """
+    answers = {u'leaf_%d' % i: u'value %d' % i for i in range(size / 2)}
+
+    for i in range(size / 10):
+        answers[u'group_%d' % i] = [{u'leaf': u'value %d' % j} for j in range(5)]
+
+    return answers
+
+
+def add_answers(store, internaltip_id, entries):
+    ret = []
+
+    for key, value in entries.iteritems():
+        field_answer = models.FieldAnswer({
+            'internaltip_id': internaltip_id,
+            'key': key
+        })
+        store.add(field_answer)
+        if isinstance(value, list):
+            field_answer.is_leaf = False
+            field_answer.value = ""
+            for n, group_entries in enumerate(value):
+                group = models.FieldAnswerGroup({
+                  'fieldanswer_id': field_answer.id,
+                  'number': n
+                })
+                store.add(group)
+                for group_elem in add_answers(store, internaltip_id, group_entries):
+                    group.fieldanswers.add(group_elem)
+        else:
+            field_answer.is_leaf = True
+            field_answer.value = unicode(value)
+        ret.append(field_answer)
+
+    return ret
+
+
+@transact
+def create_schema(store):
+    with open(GLSettings.db_schema) as f:
+        for query in f.read().split(';'):
+            store.execute(query + ';')
+
+
+@transact
+def save_answers(store, answers, writer):
+    if writer == 'objects':
+        add_answers(store, uuid4(), answers)
+    else:
+        db_save_questionnaire_answers(store, uuid4(), answers)
+
+
+@inlineCallbacks
+def run(submissions, sizes):
+    yield create_schema()
+
+    for size in sizes:
+        answers = make_answers(size)
+
+        for writer in ['objects', 'bulk']:
+            start = time.time()
+            for _ in range(submissions):
+                yield save_answers(answers, writer)
+            elapsed = time.time() - start
+
+            print("%s: answers: %d mean latency: %.2fms" %
+                  (writer, size, elapsed * 1000 / submissions))
+
+
+def main():
+    submissions = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    sizes = [int(x) for x in sys.argv[2].split(',')] if len(sys.argv) > 2 else [10, 100, 1000]
+
+    tmpdir = tempfile.mkdtemp()
+    GLSettings.eval_paths()
+
+    # the synthetic answers are not bound to actual tips
+    GLSettings.db_uri = 'sqlite:' + os.path.join(tmpdir, 'bench.db') + '?journal_mode=WAL'
+
+    d = run(submissions, sizes)
+    d.addErrback(lambda failure: failure.printTraceback())
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+
+    shutil.rmtree(tmpdir, True)
+
+
+if __name__ == '__main__':
+    main()
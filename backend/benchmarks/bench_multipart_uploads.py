@@ -0,0 +1,126 @@
+# -*- coding: UTF-8
+# bench_multipart_uploads
+# ***********************
+#
+# Measures the time and the peak memory of concurrent large multipart
+# uploads received by buffering the whole body before parsing it and by
+# encrypting the file parts to disk while they are received.
+#
+# Usage: python benchmarks/bench_multipart_uploads.py [uploads] [megabytes]
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cyclone.httpserver import HTTPConnection
+from twisted.test import proto_helpers
+
+from globaleaks.handlers.base import GLHTTPConnection
+from globaleaks.security import GLSecureTemporaryFile
+from globaleaks.settings import GLSettings
+from globaleaks.utils.uploads import upload_flows
+
+BOUNDARY = 'benchmark'
+
+# size of the segments of the bodies delivered to the connections
+SEGMENT_SIZE = 64 * 1024
+
+
+class RequestCollector(object):
+    settings = {}
+
+    def __init__(self, buffered):
+        self.buffered = buffered
+
+    def __call__(self, request):
+        upload = request.files['file'][0]
+
+        if self.buffered:
+            # the parsed body was then copied to the encrypted file
+            f = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
+            f.write(upload['body'])
+        else:
+            f = upload_flows.complete(upload['body'].flow)
+
+        f.close()
+
+
+def build_request(megabytes):
+    body = '--%s\r\nContent-Disposition: form-data; name="file"; filename="bench"\r\n' \
+           'Content-Type: application/octet-stream\r\n\r\n%s\r\n--%s--\r\n' % \
+           (BOUNDARY, os.urandom(1024) * 1024 * megabytes, BOUNDARY)
+
+    headers = 'POST /wbtip/upload HTTP/1.1\r\n' \
+              'Content-Type: multipart/form-data; boundary=%s\r\n' \
+              'Content-Length: %d\r\n\r\n' % (BOUNDARY, len(body))
+
+    return headers + body
+
+
+def run(buffered, uploads, data):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    collector = RequestCollector(buffered)
+
+    connections = []
+    for _ in range(uploads):
+        connection = HTTPConnection() if buffered else GLHTTPConnection()
+        connection.factory = collector
+        connection.makeConnection(proto_helpers.StringTransport())
+        connections.append(connection)
+
+    # the segments of the uploads are interleaved as they would be by the reactor
+    start = time.time()
+    for i in range(0, len(data), SEGMENT_SIZE):
+        for connection in connections:
+            connection.dataReceived(data[i:i + SEGMENT_SIZE])
+    elapsed = time.time() - start
+
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+
+
+def measure(buffered, uploads, data):
+    # each mode is run in a child so that the peak memory is not shared
+    r, w = os.pipe()
+
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        os.write(w, '%f %d' % run(buffered, uploads, data))
+        os._exit(0)
+
+    os.close(w)
+    result = os.read(r, 1024)
+    os.close(r)
+    os.waitpid(pid, 0)
+
+    elapsed, peak = result.split()
+
+    return float(elapsed), int(peak)
+
+
+def main():
+    uploads = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    megabytes = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    tmpdir = tempfile.mkdtemp()
+    GLSettings.tmp_upload_path = GLSettings.ramdisk_path = tmpdir
+    GLSettings.memory_copy.maximum_filesize = megabytes + 1
+
+    data = build_request(megabytes)
+
+    for mode, buffered in [('buffered', True), ('streamed', False)]:
+        elapsed, peak = measure(buffered, uploads, data)
+
+        print("%s: uploads: %d size: %dMB elapsed: %.3fs (%.1f MB/s) peak memory: +%.1fMB" %
+              (mode, uploads, megabytes, elapsed, uploads * megabytes / elapsed, peak / 1024.0))
+
+    shutil.rmtree(tmpdir, True)
+
+
+if __name__ == '__main__':
+    main()
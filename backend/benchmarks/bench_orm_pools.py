@@ -0,0 +1,80 @@
+# -*- coding: UTF-8
+# bench_orm_pools
+# ***************
+#
+# Measures the throughput of concurrent readonly and read/write
+# transactions served by the ORM thread pools.
+#
+# Usage: python benchmarks/bench_orm_pools.py [readers] [transactions]
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredList, inlineCallbacks
+
+from globaleaks.models import Mail
+from globaleaks.orm import transact, transact_ro, get_orm_stats
+from globaleaks.settings import GLSettings
+
+
+@transact
+def create_schema(store):
+    with open(GLSettings.db_schema) as f:
+        for query in f.read().split(';'):
+            store.execute(query + ';')
+
+
+@transact
+def write_mail(store):
+    store.add(Mail({'address': u'bench@globaleaks.org', 'subject': u'', 'body': u''}))
+
+
+@transact_ro
+def read_mails(store):
+    return [m.id for m in store.find(Mail)[:100]]
+
+
+@inlineCallbacks
+def run(readers, transactions):
+    GLSettings.orm_ro_tp.adjustPoolsize(0, readers)
+
+    yield create_schema()
+    yield DeferredList([write_mail() for _ in range(100)])
+
+    start = time.time()
+    dl = []
+    for i in range(transactions):
+        dl.append(write_mail() if i % 10 == 0 else read_mails())
+    yield DeferredList(dl)
+    elapsed = time.time() - start
+
+    print("readers: %d transactions: %d elapsed: %.3fs (%.1f tx/s)" %
+          (readers, transactions, elapsed, transactions / elapsed))
+
+    for pool, stats in get_orm_stats().iteritems():
+        print("%s: %s" % (pool, stats))
+
+
+def main():
+    readers = int(sys.argv[1]) if len(sys.argv) > 1 else GLSettings.orm_readers
+    transactions = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    tmpdir = tempfile.mkdtemp()
+    GLSettings.eval_paths()
+    GLSettings.db_uri = GLSettings.make_db_uri(os.path.join(tmpdir, 'bench.db'))
+
+    d = run(readers, transactions)
+    d.addErrback(lambda failure: failure.printTraceback())
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+
+    shutil.rmtree(tmpdir, True)
+
+
+if __name__ == '__main__':
+    main()
@@ -113,7 +113,8 @@ class AlarmClass(object):
 
     Class variables:
         @stress_levels
-            Contain the ALARM [0 to 2] threshold for disk and activities.
+            Contain the ALARM [0 to 2] threshold for disk, activities and
+            uploads, the latter kept updated by the upload admission.
     """
     __metaclass__ = Singleton
 
@@ -141,7 +142,8 @@ class AlarmClass(object):
         self.stress_levels = {
             'disk_space': 0,
             'disk_message': None,
-            'activity': 0
+            'activity': 0,
+            'uploads': 0
         }
 
     @defer.inlineCallbacks
@@ -328,7 +330,7 @@ class AlarmClass(object):
                 "False" if old_accept_submissions else "True"))
 
             # Invalidate the cache of node avoiding accesses to the db from here
-            GLApiCache.invalidate()
+            GLApiCache.invalidate('node')
 
 # Alarm is a singleton class exported once
 Alarm = AlarmClass()
@@ -0,0 +1,35 @@
+# -*- encoding: utf-8 -*-
+#
+# The migration does not alter the tables but recreates the database from
+# the current schema adding the indexes on the columns used by the lookups
+# of the handlers and the polling of the scheduled jobs.
+#
+# The rewrite of the database file is also needed to enable the incremental
+# auto_vacuum on the databases created without it.
+
+from globaleaks.db.migrations.update import MigrationBase
+
+
+class MigrationScript(MigrationBase):
+    def migrate_model_without_constructor(self, model_name):
+        """
+        Copies the rows of the models whose constructor requires arguments
+        """
+        model_to = self.model_to[model_name]
+
+        for old_obj in self.store_old.find(self.model_from[model_name]):
+            new_obj = model_to.__new__(model_to)
+
+            for _, v in new_obj._storm_columns.iteritems():
+                self.migrate_model_key(old_obj, new_obj, v.name)
+
+            self.store_new.add(new_obj)
+
+    def migrate_Config(self):
+        self.migrate_model_without_constructor('Config')
+
+    def migrate_ConfigL10N(self):
+        self.migrate_model_without_constructor('ConfigL10N')
+
+    def migrate_EnabledLanguage(self):
+        self.migrate_model_without_constructor('EnabledLanguage')
@@ -0,0 +1,27 @@
+# -*- encoding: utf-8 -*-
+#
+# The migration adds to the InternalFile the SHA-256 digest of the plaintext
+# of the file computed while it is uploaded; the digest of the files
+# uploaded before is left empty and their integrity is not verified.
+
+from storm.locals import Int, Unicode, DateTime
+
+from globaleaks.db.migrations.update_35 import MigrationScript as MigrationScript_v_35
+from globaleaks.models import ModelWithID
+
+
+class InternalFile_v_35(ModelWithID):
+    __storm_table__ = 'internalfile'
+    creation_date = DateTime()
+    internaltip_id = Unicode()
+    name = Unicode()
+    file_path = Unicode()
+    content_type = Unicode()
+    size = Int()
+    new = Int()
+    submission = Int()
+    processing_attempts = Int()
+
+
+class MigrationScript(MigrationScript_v_35):
+    pass
@@ -1,5 +1,5 @@
 PRAGMA foreign_keys = ON;
-PRAGMA auto_vacuum = FULL;
+PRAGMA auto_vacuum = INCREMENTAL;
 
 CREATE TABLE enabledlanguage (
     name TEXT NOT NULL,
@@ -108,6 +108,7 @@ CREATE TABLE internalfile (
     file_path TEXT,
     name TEXT NOT NULL,
     size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
     new INTEGER NOT NULL,
     submission INTEGER NOT NULL,
     processing_attempts INTEGER NOT NULL,
@@ -416,3 +417,17 @@ CREATE INDEX config_group_index ON config(var_group);
 CREATE INDEX config_item_index ON config(var_group, var_name);
 CREATE INDEX config_l10n_group_index ON config_l10n(var_group);
 CREATE INDEX config_l10n_item_index ON config_l10n(lang, var_group, var_name);
+CREATE INDEX receivertip__receiver_id_index ON receivertip(receiver_id);
+CREATE INDEX receivertip__internaltip_id_index ON receivertip(internaltip_id);
+CREATE INDEX receivertip__new_index ON receivertip(new);
+CREATE INDEX receiverfile__receivertip_id_index ON receiverfile(receivertip_id);
+CREATE INDEX receiverfile__internalfile_id_index ON receiverfile(internalfile_id);
+CREATE INDEX receiverfile__new_index ON receiverfile(new);
+CREATE INDEX internalfile__new_index ON internalfile(new);
+CREATE INDEX internaltip__expiration_date_index ON internaltip(expiration_date);
+CREATE INDEX internaltip__wb_last_access_index ON internaltip(wb_last_access);
+CREATE INDEX whistleblowertip__receipt_hash_index ON whistleblowertip(receipt_hash);
+CREATE INDEX comment__new_index ON comment(new);
+CREATE INDEX message__new_index ON message(new);
+CREATE INDEX stats__start_index ON stats(start);
+CREATE INDEX anomalies__date_index ON anomalies(date);
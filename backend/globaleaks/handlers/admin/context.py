@@ -10,10 +10,11 @@ from globaleaks import models
 from globaleaks.orm import transact, transact_ro
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.admin.step import db_create_step
+from globaleaks.handlers.assets import db_get_asset_url
 from globaleaks.handlers.admin.questionnaire import db_get_default_questionnaire_id
-from globaleaks.handlers.public import serialize_step
+from globaleaks.handlers.public import QuestionnaireTree, serialize_step
 from globaleaks.rest import errors, requests
-from globaleaks.rest.apicache import GLApiCache
+from globaleaks.rest.apicache import GLApiCache, QuestionnaireCache
 from globaleaks.settings import GLSettings
 from globaleaks.utils.structures import fill_localized_keys, get_localized_values
 from globaleaks.utils.utility import log, datetime_now, datetime_to_ISO8601
@@ -45,7 +46,7 @@ def admin_serialize_context(store, context, language):
         'show_receivers_in_alphabetical_order': context.show_receivers_in_alphabetical_order,
         'questionnaire_id': context.questionnaire.id,
         'receivers': [r.id for r in context.receivers],
-        'picture': context.picture.data if context.picture is not None else ''
+        'picture': db_get_asset_url(context.picture)
     }
 
     return get_localized_values(ret_dict, context, context.localized_keys, language)
@@ -100,7 +101,9 @@ def db_get_context_steps(store, context_id, language):
         log.err("Requested invalid context")
         raise errors.ContextIdNotFound
 
-    return [serialize_step(store, s, language) for s in context.questionnaire.steps]
+    tree = QuestionnaireTree(store, [context.questionnaire_id])
+
+    return [serialize_step(store, s, language, tree) for s in tree.steps[context.questionnaire_id]]
 
 
 @transact_ro
@@ -264,7 +267,8 @@ class ContextsCollection(BaseHandler):
 
         response = yield create_context(request, self.request.language)
 
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('contexts', 'questionnaires')
+        QuestionnaireCache.invalidate()
 
         self.set_status(201) # Created
         self.write(response)
@@ -304,7 +308,8 @@ class ContextInstance(BaseHandler):
                                         requests.AdminContextDesc)
 
         response = yield update_context(context_id, request, self.request.language)
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('contexts', 'questionnaires')
+        QuestionnaireCache.invalidate()
 
         self.set_status(202) # Updated
         self.write(response)
@@ -321,4 +326,5 @@ class ContextInstance(BaseHandler):
         Errors: InvalidInputFormat, ContextIdNotFound
         """
         yield delete_context(context_id)
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('contexts', 'questionnaires')
+        QuestionnaireCache.invalidate()
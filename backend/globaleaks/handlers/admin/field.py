@@ -13,9 +13,9 @@ from twisted.internet.defer import inlineCallbacks
 from globaleaks import models
 from globaleaks.orm import transact, transact_ro
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.handlers.public import serialize_field
+from globaleaks.handlers.public import QuestionnaireTree, serialize_field
 from globaleaks.rest import errors, requests
-from globaleaks.rest.apicache import GLApiCache
+from globaleaks.rest.apicache import GLApiCache, QuestionnaireCache
 from globaleaks.utils.structures import fill_localized_keys
 from globaleaks.utils.utility import log
 
@@ -305,12 +305,12 @@ def get_fieldtemplate_list(store, language, request_type=None):
     """
     language = language if request_type != 'export' else None
 
-    ret = []
-    for f in store.find(models.Field, And(models.Field.instance == u'template',
-                                          models.Field.fieldgroup_id == None)):
-        ret.append(serialize_field(store, f, language))
+    templates = list(store.find(models.Field, And(models.Field.instance == u'template',
+                                                  models.Field.fieldgroup_id == None)))
 
-    return ret
+    tree = QuestionnaireTree(store, field_ids=[f.id for f in templates])
+
+    return [serialize_field(store, f, language, tree) for f in templates]
 
 
 class FieldTemplatesCollection(BaseHandler):
@@ -324,10 +324,10 @@ class FieldTemplatesCollection(BaseHandler):
         :return: the list of field templates registered on the node.
         :rtype: list
         """
-        response = yield GLApiCache.get('fieldtemplates', self.request.language,
+        response = yield GLApiCache.get('fieldtemplates', self.request.language, ['fields'],
                                         get_fieldtemplate_list, self.request.language, self.request.request_type)
 
-        self.write(response)
+        self.write_cached_response(response)
 
     @BaseHandler.transport_security_check('admin')
     @BaseHandler.authenticated('admin')
@@ -385,7 +385,8 @@ class FieldTemplateInstance(BaseHandler):
                                       self.request.language,
                                       self.request.request_type)
 
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('fields')
+        QuestionnaireCache.invalidate()
 
         self.set_status(202) # Updated
         self.write(response)
@@ -402,7 +403,8 @@ class FieldTemplateInstance(BaseHandler):
         """
         yield delete_field(field_id)
 
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('fields')
+        QuestionnaireCache.invalidate()
 
 
 class FieldCollection(BaseHandler):
@@ -429,7 +431,8 @@ class FieldCollection(BaseHandler):
                                       self.request.language,
                                       self.request.request_type)
 
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('fields')
+        QuestionnaireCache.invalidate()
 
         self.set_status(201)
         self.write(response)
@@ -458,7 +461,8 @@ class FieldInstance(BaseHandler):
                                    self.request.language,
                                    self.request.request_type)
 
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('fields')
+        QuestionnaireCache.invalidate()
 
         self.write(response)
 
@@ -483,7 +487,8 @@ class FieldInstance(BaseHandler):
                                       self.request.language,
                                       self.request.request_type)
 
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('fields')
+        QuestionnaireCache.invalidate()
 
         self.set_status(202) # Updated
         self.write(response)
@@ -501,4 +506,5 @@ class FieldInstance(BaseHandler):
         """
         yield delete_field(field_id)
 
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('fields')
+        QuestionnaireCache.invalidate()
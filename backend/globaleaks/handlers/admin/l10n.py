@@ -15,14 +15,8 @@ from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.orm import transact, transact_ro
-from globaleaks.rest.apicache import GLApiCache
-
-
-@transact_ro
-def get_custom_texts(store, lang):
-    texts = store.find(models.CustomTexts, models.CustomTexts.lang == lang).one()
-    return texts.texts if texts is not None else {}
+from globaleaks.handlers.l10n import get_custom_texts, l10n_bundles
+from globaleaks.orm import transact
 
 
 @transact
@@ -60,7 +54,7 @@ class AdminL10NHandler(BaseHandler):
 
         yield update_custom_texts(lang, request)
 
-        GLApiCache.invalidate()
+        l10n_bundles.set_custom_texts(lang, request)
 
         self.set_status(202)  # Updated
 
@@ -70,4 +64,4 @@ class AdminL10NHandler(BaseHandler):
     def delete(self, lang):
         yield delete_custom_texts(lang)
 
-        GLApiCache.invalidate()
+        l10n_bundles.set_custom_texts(lang, {})
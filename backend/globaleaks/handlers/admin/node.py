@@ -11,6 +11,7 @@ from globaleaks import models, utils, LANGUAGES_SUPPORTED_CODES, LANGUAGES_SUPPO
 from globaleaks.db import db_refresh_memory_variables
 from globaleaks.db.appdata import load_appdata
 from globaleaks.handlers.base import BaseHandler
+from globaleaks.handlers.public import warm_public_resources
 from globaleaks.models.config import NodeFactory, PrivateFactory
 from globaleaks.models.l10n import EnabledLanguage, NodeL10NFactory
 from globaleaks.orm import transact, transact_ro
@@ -134,7 +135,10 @@ class NodeInstance(BaseHandler):
                                         requests.AdminNodeDesc)
 
         node_description = yield update_node(request, self.request.language)
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('node')
+
+        # the languages enabled could have been changed
+        yield warm_public_resources()
 
         self.set_status(202) # Updated
         self.write(node_description)
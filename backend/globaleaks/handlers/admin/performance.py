@@ -0,0 +1,56 @@
+# -*- coding: UTF-8
+#
+#   performance
+#   ***********
+#
+# Implementation of the handler exposing to the admin the runtime
+# performance counters collected by the backend.
+
+from globaleaks.handlers.base import BaseHandler, static_file_cache
+from globaleaks.handlers.l10n import l10n_bundles
+from globaleaks.handlers.submission import archived_schema_cache
+from globaleaks.jobs.vacuum_sched import get_vacuum_report
+from globaleaks.orm import get_orm_stats
+from globaleaks.rest.apicache import GLApiCache
+from globaleaks.utils.compression import compression_stats
+from globaleaks.utils.sqltracers import get_index_advisor_report, get_query_counter_report, \
+    get_slow_query_log
+from globaleaks.utils.uploads import upload_flows
+
+
+def get_performance_report():
+    return {
+        'orm': get_orm_stats(),
+        'vacuum': get_vacuum_report(),
+        'index_advisor': get_index_advisor_report(),
+        'query_counter': get_query_counter_report(),
+        'archived_schema_cache': archived_schema_cache.get_stats(),
+        'api_cache': GLApiCache.get_stats(),
+        'l10n_bundles': l10n_bundles.get_stats(),
+        'static_file_cache': static_file_cache.get_stats(),
+        'static_compression': compression_stats.get_report(),
+        'upload_flows': upload_flows.get_stats()
+    }
+
+
+class PerformanceInstance(BaseHandler):
+    """
+    This handler exposes the performance counters of the backend
+    /admin/performance
+    """
+    @BaseHandler.transport_security_check("admin")
+    @BaseHandler.authenticated("admin")
+    def get(self):
+        self.write(get_performance_report())
+
+
+class SlowQueriesCollection(BaseHandler):
+    """
+    This handler exposes the most recent queries that exceeded the
+    configured slow query threshold
+    /admin/performance/slowqueries
+    """
+    @BaseHandler.transport_security_check("admin")
+    @BaseHandler.authenticated("admin")
+    def get(self):
+        self.write(get_slow_query_log())
@@ -10,10 +10,10 @@ from twisted.internet.defer import inlineCallbacks
 from globaleaks import models
 from globaleaks.handlers.admin.step import db_create_step
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.handlers.public import serialize_step, serialize_questionnaire
+from globaleaks.handlers.public import QuestionnaireTree, serialize_step, serialize_questionnaire
 from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import errors, requests
-from globaleaks.rest.apicache import GLApiCache
+from globaleaks.rest.apicache import GLApiCache, QuestionnaireCache
 from globaleaks.utils.structures import fill_localized_keys
 from globaleaks.utils.utility import log
 
@@ -27,8 +27,12 @@ def get_questionnaire_list(store, language):
     :param language: the language in which to localize data.
     :return: a dictionary representing the serialization of the questionnaires.
     """
-    return [serialize_questionnaire(store, questionnaire, language)
-        for questionnaire in store.find(models.Questionnaire)]
+    questionnaires = list(store.find(models.Questionnaire))
+
+    tree = QuestionnaireTree(store, [q.id for q in questionnaires])
+
+    return [serialize_questionnaire(store, questionnaire, language, tree)
+        for questionnaire in questionnaires]
 
 
 @transact_ro
@@ -61,7 +65,9 @@ def db_get_questionnaire_steps(store, questionnaire_id, language):
         log.err("Requested invalid questionnaire")
         raise errors.QuestionnaireIdNotFound
 
-    return [serialize_step(store, s, language) for s in questionnaire.steps]
+    tree = QuestionnaireTree(store, [questionnaire.id])
+
+    return [serialize_step(store, s, language, tree) for s in tree.steps[questionnaire.id]]
 
 
 @transact_ro
@@ -178,10 +184,10 @@ class QuestionnairesCollection(BaseHandler):
         Response: adminQuestionnaireList
         Errors: None
         """
-        response = yield GLApiCache.get('questionnaires', self.request.language,
+        response = yield GLApiCache.get('questionnaires', self.request.language, ['fields'],
                                         get_questionnaire_list, self.request.language)
 
-        self.write(response)
+        self.write_cached_response(response)
 
     @BaseHandler.transport_security_check('admin')
     @BaseHandler.authenticated('admin')
@@ -200,7 +206,8 @@ class QuestionnairesCollection(BaseHandler):
 
         response = yield create_questionnaire(request, self.request.language)
 
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('questionnaires')
+        QuestionnaireCache.invalidate()
 
         self.set_status(201)
         self.write(response)
@@ -241,7 +248,8 @@ class QuestionnaireInstance(BaseHandler):
 
         response = yield update_questionnaire(questionnaire_id, request, self.request.language)
 
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('questionnaires')
+        QuestionnaireCache.invalidate()
 
         self.set_status(202)
         self.write(response)
@@ -258,4 +266,5 @@ class QuestionnaireInstance(BaseHandler):
         Errors: InvalidInputFormat, QuestionnaireIdNotFound
         """
         yield delete_questionnaire(questionnaire_id)
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('questionnaires')
+        QuestionnaireCache.invalidate()
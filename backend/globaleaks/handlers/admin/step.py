@@ -13,7 +13,7 @@ from globaleaks.handlers.admin.field import db_create_field, db_update_field
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.public import serialize_step
 from globaleaks.rest import requests, errors
-from globaleaks.rest.apicache import GLApiCache
+from globaleaks.rest.apicache import GLApiCache, QuestionnaireCache
 from globaleaks.utils.structures import fill_localized_keys
 
 
@@ -134,7 +134,8 @@ class StepCollection(BaseHandler):
 
         response = yield create_step(request, self.request.language)
 
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('questionnaires')
+        QuestionnaireCache.invalidate()
 
         self.set_status(201)
         self.write(response)
@@ -182,7 +183,8 @@ class StepInstance(BaseHandler):
 
         response = yield update_step(step_id, request, self.request.language)
 
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('questionnaires')
+        QuestionnaireCache.invalidate()
 
         self.set_status(202) # Updated
         self.write(response)
@@ -201,4 +203,5 @@ class StepInstance(BaseHandler):
         """
         yield delete_step(step_id)
 
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('questionnaires')
+        QuestionnaireCache.invalidate()
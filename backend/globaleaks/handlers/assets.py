@@ -0,0 +1,96 @@
+# -*- coding: UTF-8
+# assets
+#   ****
+#
+# Implementation of the content addressed access to the files uploaded by
+# the admin (logo, favicon, css, homepage, script and the pictures of users
+# and contexts) that the serializations reference by url.
+
+import base64
+import hashlib
+
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks import models
+from globaleaks.handlers.base import BaseHandler
+from globaleaks.orm import transact_ro
+from globaleaks.rest import errors
+
+node_assets = {
+    u'logo': 'image/png',
+    u'favicon': 'image/x-icon',
+    u'css': 'text/css',
+    u'homepage': 'text/html',
+    u'script': 'application/javascript'
+}
+
+# maps the hash of the assets referenced by the serializations to the id
+# and content type of the file holding them
+assets_index = {}
+
+
+def db_get_asset_url(file_obj, content_type='image/png'):
+    """
+    Returns the url of the asset held by the given file registering it in
+    the index of the assets served by AssetInstance.
+
+    The url depends only on the content of the file so that it changes on
+    every upload and could be kept indefinitely by the clients.
+    """
+    if file_obj is None:
+        return ''
+
+    asset_id = hashlib.sha256(file_obj.data).hexdigest()
+
+    assets_index[asset_id] = (file_obj.id, content_type)
+
+    return 'assets/' + asset_id
+
+
+def db_get_node_asset_url(store, key):
+    file_obj = store.find(models.File, models.File.id == key).one()
+
+    return db_get_asset_url(file_obj, node_assets[key])
+
+
+@transact_ro
+def get_asset(store, asset_id):
+    if asset_id not in assets_index:
+        return None
+
+    file_id, content_type = assets_index[asset_id]
+
+    file_obj = store.find(models.File, models.File.id == file_id).one()
+
+    # the file has been changed or removed after the serialization
+    if file_obj is None or hashlib.sha256(file_obj.data).hexdigest() != asset_id:
+        assets_index.pop(asset_id, None)
+        return None
+
+    return content_type, base64.b64decode(file_obj.data)
+
+
+class AssetInstance(BaseHandler):
+    @BaseHandler.transport_security_check("unauth")
+    @BaseHandler.unauthenticated
+    @inlineCallbacks
+    def get(self, asset_id):
+        """
+        Get the asset with the given hash
+        """
+        asset = yield get_asset(asset_id)
+        if asset is None:
+            raise errors.FileIdNotFound
+
+        content_type, data = asset
+
+        # the content of an url never changes
+        self.set_cache_headers(immutable=True)
+        self.set_header('Etag', '"%s"' % asset_id)
+
+        if self.request.headers.get('If-None-Match') == '"%s"' % asset_id:
+            self.set_status(304)
+            return
+
+        self.set_header('Content-Type', content_type)
+        self.write(data)
@@ -6,15 +6,17 @@ our needs.
 
 import base64
 import collections
+import email.utils
 import json
 import mimetypes
 import os
 import re
+import stat
 import sys
 import time
 from StringIO import StringIO
-from twisted.internet import fdesc, reactor
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet import fdesc, reactor, threads
+from twisted.internet.defer import Deferred, inlineCallbacks
 from twisted.python.failure import Failure
 
 from cyclone import httputil, web, template
@@ -25,13 +27,17 @@ from globaleaks.event import track_handler
 from globaleaks.rest import errors, requests
 from globaleaks.security import GLSecureTemporaryFile, directory_traversal_check, generateRandomKey
 from globaleaks.settings import GLSettings
+from globaleaks.utils.compression import compression_stats, find_variants, precompress_files, select_encoding
+from globaleaks.utils.lrucache import LRUCache
 from globaleaks.utils.mailutils import mail_exception_handler, send_exception_email
+from globaleaks.utils.multipart import MultipartError, MultipartParser
+from globaleaks.utils.sqltracers import QueryStats, record_query_stats, run_with_query_stats
 from globaleaks.utils.tempdict import TempDict
+from globaleaks.utils.uploads import UploadError, UploadPending, upload_admission, upload_flows
 from globaleaks.utils.utility import log, datetime_now, deferred_sleep
 
 HANDLER_EXEC_TIME_THRESHOLD = 30
 
-GLUploads = {}
 GLSessions = TempDict(timeout=GLSettings.authentication_lifetime)
 
 # https://github.com/globaleaks/GlobaLeaks/issues/1601
@@ -60,6 +66,11 @@ class GLSession(object):
 class GLHTTPConnection(HTTPConnection):
     def __init__(self):
         self.uploaded_file = {}
+        self._multipart = None
+        self._uploads = []
+        self._admission = None
+        self._flows = []
+        self._rest = ''
 
     def _on_headers(self, data):
         try:
@@ -96,7 +107,11 @@ class GLHTTPConnection(HTTPConnection):
                 if headers.get("Expect") == "100-continue":
                     self.transport.write("HTTP/1.1 100 (Continue)\r\n\r\n")
 
-                if content_length < 100000:
+                # the uploaded files are encrypted to disk while they are received
+                content_type = headers.get("Content-Type", "")
+                if method in ("POST", "PUT") and content_type.startswith("multipart/form-data"):
+                    self._multipart = self.create_multipart_parser(content_type)
+                elif content_length < 100000:
                     self._contentbuffer = StringIO()
                 else:
                     self._contentbuffer = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
@@ -110,12 +125,285 @@ class GLHTTPConnection(HTTPConnection):
             log.msg("Exception while handling HTTP request from %s: %s" % (self._remote_ip, e))
             self.transport.loseConnection()
 
+    def create_multipart_parser(self, content_type):
+        for field in content_type.split(";"):
+            k, _, v = field.strip().partition("=")
+            if k == "boundary" and v:
+                return MultipartParser(v, self._request.arguments, self._request.files, self.open_upload)
+
+        raise _BadRequestException("Invalid multipart/form-data")
+
+    def open_upload(self, name, filename, content_type):
+        if getattr(self._request, 'upload_error', None) is not None:
+            return None
+
+        try:
+            if self._admission is None:
+                d = upload_admission.admit(self._request)
+                self._admission = d if d is not None else False
+
+                if d is not None:
+                    # the connection is not read until the upload is admitted
+                    self.transport.pauseProducing()
+                    d.addCallbacks(self.upload_admitted, self.upload_refused)
+
+            if self._admission:
+                raise UploadPending
+
+            chunk = upload_flows.open_chunk(self._request)
+        except errors.GLException as e:
+            # the content is discarded and the error is raised by the handler
+            self._request.upload_error = e
+            return None
+
+        self._uploads.append(chunk)
+        return chunk
+
+    def upload_admitted(self, _):
+        self._admission = False
+        self.transport.resumeProducing()
+        self.feed_multipart('')
+
+    def upload_refused(self, failure):
+        self._admission = False
+        self._request.upload_error = failure.value
+        self.transport.resumeProducing()
+        self.feed_multipart('')
+
+    def abort_uploads(self):
+        """
+        Discards the chunks of an interrupted request so that they could
+        be sent again.
+        """
+        for chunk in self._uploads:
+            chunk.abort()
+
+        if self._admission:
+            upload_admission.cancel(self._admission)
+
+        self._multipart = None
+        self._uploads = []
+        self._admission = None
+
+    def discard_uploads(self):
+        """
+        Discards the flows without flowIdentifier of the request whose file
+        has not been taken by the handler once the request is finished or
+        its connection is lost, so that the bytes they reserve are released
+        whatever the outcome of the request.
+        """
+        upload_flows.discard_unbound(self._flows)
+        self._flows = []
+
+    def connectionLost(self, reason):
+        if self._multipart is not None:
+            self.abort_uploads()
+
+        self.discard_uploads()
+
+        HTTPConnection.connectionLost(self, reason)
+
+    def _finish_request(self):
+        self.discard_uploads()
+
+        HTTPConnection._finish_request(self)
+
+    def rawDataReceived(self, data):
+        if self._multipart is None:
+            return HTTPConnection.rawDataReceived(self, data)
+
+        data, rest = data[:self.content_length], data[self.content_length:]
+        self.content_length -= len(data)
+        self._rest += rest
+
+        self.feed_multipart(data)
+
+    def feed_multipart(self, data):
+        try:
+            self._multipart.feed(data)
+
+            if self.content_length == 0:
+                self._multipart.close()
+        except UploadPending:
+            # the parsing is resumed once the upload is admitted
+            return
+        except (MultipartError, UploadError) as e:
+            log.msg("Exception while handling HTTP request from %s: %s" % (self._remote_ip, e))
+            self.abort_uploads()
+            self.transport.loseConnection()
+            return
+
+        if self.content_length == 0:
+            for chunk in self._uploads:
+                chunk.close()
+
+            self._flows = [chunk.flow for chunk in self._uploads]
+
+            rest, self._rest = self._rest, ''
+
+            self._multipart = None
+            self._uploads = []
+            self._admission = None
+            self.content_length = self._contentbuffer = None
+            self._request.body = ''
+            self.request_callback(self._request)
+            self.setLineMode(rest)
+
+
+class FileProducer(object):
+    """
+    Streaming producer writing a range of a file to the connection of a
+    request handler; the transport pauses it while its buffer is full so
+    that only a chunk at a time is read and kept in memory.
+    """
+    def __init__(self, handler, f, start, length):
+        self.handler = handler
+        self.f = f
+        self.length = length
+        self.remaining = length
+        self.paused = False
+        self.deferred = Deferred()
+
+        self.f.seek(start)
+
+    def start(self):
+        """
+        Starts the streaming returning a deferred fired at its end with
+        the number of bytes written, that is less than the length of the
+        range if the client disconnected before.
+        """
+        self.handler.request.connection.transport.registerProducer(self, True)
+        self.resumeProducing()
+        return self.deferred
+
+    def resumeProducing(self):
+        self.paused = False
+
+        while not self.paused and not self.deferred.called:
+            chunk = self.f.read(min(GLSettings.file_chunk_size, self.remaining))
+            self.remaining -= len(chunk)
+
+            if chunk:
+                self.handler.write(chunk)
+                self.handler.flush()
+
+            if not chunk or not self.remaining:
+                self.stopProducing()
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def stopProducing(self):
+        if self.deferred.called:
+            return
+
+        self.f.close()
+        self.handler.request.connection.transport.unregisterProducer()
+        self.deferred.callback(self.length - self.remaining)
+
+
+def parse_byte_range(value, size):
+    """
+    Parses the value of a Range header returning the first and the last
+    position of the requested bytes; None is returned when the header is
+    not a single byte range and should be ignored.
+
+    The range is unsatisfiable when the first position is not less than
+    the size of the file.
+    """
+    match = re.match(r'^bytes=(\d*)-(\d*)$', value.strip())
+    if match is None or match.groups() == ('', ''):
+        return None
+
+    first, last = match.groups()
+
+    if first == '':
+        suffix = int(last)
+
+        # an empty suffix of the file is unsatisfiable
+        return (max(size - suffix, 0) if suffix else size), size - 1
+
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+
+    if first > last and first < size:
+        return None
+
+    return first, last
+
+
+class StaticFile(object):
+    """
+    The validators and the metadata of a static file, along with its
+    content when the file is small enough to be kept in memory.
+    """
+    def __init__(self, path, st):
+        self.path = path
+        self.version = (st.st_mtime, st.st_size)
+        self.size = st.st_size
+        self.mtime = int(st.st_mtime)
+        self.etag = '"%x-%x"' % (self.mtime, self.size)
+        self.last_modified = email.utils.formatdate(self.mtime, usegmt=True)
+        self.mime_type = mimetypes.guess_type(path)[0]
+        self.data = None
+
+        # the precompressed variants of the file by content encoding
+        self.variants = find_variants(path, st, GLSettings.client_path, GLSettings.client_cache_path)
+        self.variants_data = {}
+
+    def get_etag(self, encoding):
+        return self.etag if encoding is None else '%s-%s"' % (self.etag[:-1], encoding)
+
+
+static_file_cache = LRUCache(GLSettings.static_file_cache_size)
+
+
+def get_static_file(path, st):
+    """
+    Returns the StaticFile of the given path, reading the content of the
+    small files only when they are not in the cache or changed on disk.
+    """
+    static_file = static_file_cache.get(path)
+    if static_file is not None and static_file.version == (st.st_mtime, st.st_size):
+        return static_file
+
+    static_file = StaticFile(path, st)
+
+    if static_file.size <= GLSettings.static_file_cache_threshold:
+        with open(path, 'rb') as f:
+            static_file.data = f.read()
+
+        for encoding, (variant_path, _) in static_file.variants.items():
+            with open(variant_path, 'rb') as f:
+                static_file.variants_data[encoding] = f.read()
+
+        size = static_file.size + sum(len(data) for data in static_file.variants_data.values())
+
+        static_file_cache.set(path, static_file, size)
+
+    return static_file
+
+
+def precompress_client_files():
+    """
+    Generates in background the missing precompressed variants of the
+    client files; the cached files are then dropped to pick them up.
+    """
+    d = threads.deferToThread(precompress_files, GLSettings.client_path, GLSettings.client_cache_path)
+    d.addCallback(lambda _: static_file_cache.invalidate())
+    d.addErrback(lambda failure: log.err("Unable to precompress the client files: %s" % failure.value))
+    return d
+
 
 class BaseHandler(RequestHandler):
     serialize_lists = True
     handler_exec_time_threshold = HANDLER_EXEC_TIME_THRESHOLD
     filehandler = False
 
+    # maximum number of queries that a request to the handler is expected to
+    # issue; exceeding it makes the request fail when query_budget_strict is set
+    query_budget = None
+
     def __init__(self, application, request, **kwargs):
         RequestHandler.__init__(self, application, request, **kwargs)
 
@@ -471,6 +759,11 @@ class BaseHandler(RequestHandler):
         if not self.validate_host(self.request.host):
             raise errors.InvalidHostSpecified
 
+    def _execute_handler(self, r, args, kwargs):
+        # the queries of the transactions started by the handler are
+        # accounted to the request
+        run_with_query_stats(self.query_stats, RequestHandler._execute_handler, self, r, args, kwargs)
+
     def on_finish(self):
         """
         Here is implemented:
@@ -499,18 +792,78 @@ class BaseHandler(RequestHandler):
         except Exception as excep:
             log.err("Unable to open %s: %s" % (GLSettings.httplogfile, excep))
 
-    @inlineCallbacks
-    def write_file(self, filepath):
-        with open(filepath, "rb") as f:
-            chunk = f.read(GLSettings.file_chunk_size)
-            if (len(chunk) != 0):
-                self.write(chunk)
-
-            chunk = f.read(GLSettings.file_chunk_size)
-            while(len(chunk) != 0):
-                yield deferred_sleep(0.001)
-                self.write(chunk)
-                chunk = f.read(GLSettings.file_chunk_size)
+    def write_cached_response(self, response):
+        """
+        Writes a CachedResponse of the GLApiCache answering with a 304 when
+        the client already has it and using its pre-compressed variant when
+        the client accepts gzip.
+        """
+        # the resources requested without a session are public and could be
+        # kept by the clients that should anyhow revalidate them every time
+        if self.request.headers.get('X-Session') is None:
+            self.set_header('Cache-control', 'no-cache')
+
+        gzipping = self.request.supports_http_1_1() and \
+            'gzip' in self.request.headers.get('Accept-Encoding', '')
+
+        self.set_header('Etag', response.gzip_etag if gzipping else response.etag)
+
+        inm = self.request.headers.get('If-None-Match')
+        if inm and response.match(inm):
+            self.set_status(304)
+            return
+
+        self.set_header('Content-Type', 'application/json; charset=UTF-8')
+
+        if gzipping:
+            self.set_header('Content-Encoding', 'gzip')
+            self.write(response.gzip_body)
+        else:
+            self.write(response.body)
+
+    def write_file(self, filepath, start=0, length=None):
+        """
+        Streams the file, or the given range of it, through a FileProducer
+        returning a deferred fired at the end of the transfer with the
+        number of bytes written.
+        """
+        f = open(filepath, 'rb')
+
+        if length is None:
+            length = os.fstat(f.fileno()).st_size - start
+
+        return FileProducer(self, f, start, length).start()
+
+    def get_byte_range(self, size, etag, last_modified):
+        """
+        Returns the first and the last position of the byte range requested
+        by the client for a file with the given size and validators, or
+        None when the whole file should be sent.
+        """
+        value = self.request.headers.get('Range')
+        if value is None:
+            return None
+
+        # the range is ignored if the file changed since the client got a part of it
+        if_range = self.request.headers.get('If-Range')
+        if if_range is not None and if_range.strip() not in (etag, last_modified):
+            return None
+
+        return parse_byte_range(value, size)
+
+    def set_cache_headers(self, immutable=False):
+        """
+        Replaces the default headers preventing the caching of the response
+        with the ones allowing the clients to keep it, revalidating it every
+        time or, when its url identifies its content, indefinitely.
+        """
+        self.clear_header('Pragma')
+        self.clear_header('Expires')
+
+        if immutable:
+            self.set_header('Cache-control', 'public, max-age=31536000, immutable')
+        else:
+            self.set_header('Cache-control', 'no-cache')
 
     def write_error(self, status_code, **kw):
         exception = kw.get('exception')
@@ -525,6 +878,9 @@ class BaseHandler(RequestHandler):
             else:
                 error_dict.update({'arguments': []})
 
+            if hasattr(exception, 'retry_after'):
+                self.set_header('Retry-After', str(exception.retry_after))
+
             self.set_status(status_code)
             self.write(error_dict)
         else:
@@ -559,37 +915,33 @@ class BaseHandler(RequestHandler):
         return False if self.request.headers.get('X-Tor2Web', None) is None else True
 
     def get_file_upload(self):
+        upload_error = getattr(self.request, 'upload_error', None)
+        if upload_error is not None:
+            raise upload_error
+
         try:
-            if len(self.request.files) != 1:
+            if len(self.request.files) != 1 or len(self.request.files['file']) != 1:
                 raise errors.InvalidInputFormat("cannot accept more than a file upload at once")
 
-            chunk_size = len(self.request.files['file'][0]['body'])
-            total_file_size = int(self.request.arguments['flowTotalSize'][0]) if 'flowTotalSize' in self.request.arguments else chunk_size
-            flow_identifier = self.request.arguments['flowIdentifier'][0] if 'flowIdentifier' in self.request.arguments else generateRandomKey(10)
-
-            if ((chunk_size / (1024 * 1024)) > GLSettings.memory_copy.maximum_filesize or
-                (total_file_size / (1024 * 1024)) > GLSettings.memory_copy.maximum_filesize):
-                log.err("File upload request rejected: file too big")
-                raise errors.FileTooBig(GLSettings.memory_copy.maximum_filesize)
+            # the chunk has been already encrypted to disk by GLHTTPConnection
+            flow = self.request.files['file'][0]['body'].flow
 
-            if flow_identifier not in GLUploads:
-                f = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
-                GLUploads[flow_identifier] = f
-            else:
-                f = GLUploads[flow_identifier]
+            # the file is returned by the request completing its flow that
+            # could be other than the one of the last chunk
+            if not flow.is_complete():
+                return None
 
-            f.write(self.request.files['file'][0]['body'])
+            sha256 = flow.get_sha256()
 
-            if 'flowChunkNumber' in self.request.arguments and 'flowTotalChunks' in self.request.arguments:
-                if self.request.arguments['flowChunkNumber'][0] != self.request.arguments['flowTotalChunks'][0]:
-                    return None
+            f = upload_flows.complete(flow)
 
             uploaded_file = {
                 'filename': self.request.files['file'][0]['filename'],
                 'content_type': self.request.files['file'][0]['content_type'],
-                'body_len': total_file_size,
+                'body_len': flow.received,
                 'body_filepath': f.filepath,
-                'body': f
+                'body': f,
+                'sha256': sha256
             }
 
             self.request._start_time = f.creation_date
@@ -597,11 +949,13 @@ class BaseHandler(RequestHandler):
 
             return uploaded_file
 
-        except errors.FileTooBig:
-            raise  # propagate the exception
-
         except Exception as exc:
             log.err("Error while handling file upload %s" % exc)
+
+            for upload in sum(self.request.files.values(), []):
+                if upload['body'] is not None:
+                    upload_flows.discard(upload['body'].flow)
+
             return None
 
     def _handle_request_exception(self, e):
@@ -622,6 +976,10 @@ class BaseHandler(RequestHandler):
     def handler_time_analysis_begin(self):
         self.start_time = time.time()
 
+        self.query_stats = None
+        if GLSettings.query_counter:
+            self.query_stats = QueryStats(self.name, self.query_budget)
+
     def handler_time_analysis_end(self):
         """
         If the software is running with the option -S --stats (GLSetting.log_timing_stats)
@@ -637,8 +995,11 @@ class BaseHandler(RequestHandler):
 
             send_exception_email(error)
 
+        if self.query_stats is not None:
+            record_query_stats(self.request.method, self.query_stats)
+
         if GLSettings.log_timing_stats:
-            TimingStatsHandler.log_measured_timing(self.request.method, self.request.uri, self.start_time, current_run_time)
+            TimingStatsHandler.log_measured_timing(self.request.method, self.request.uri, self.start_time, current_run_time, self.query_stats)
 
 
     def handler_request_logging_begin(self):
@@ -696,14 +1057,93 @@ class BaseStaticFileHandler(BaseHandler):
 
         directory_traversal_check(self.root, abspath)
 
-        if not os.path.exists(abspath) or not os.path.isfile(abspath):
+        try:
+            st = os.stat(abspath)
+        except OSError:
+            st = None
+
+        if st is None or not stat.S_ISREG(st.st_mode):
             raise HTTPError(404)
 
-        mime_type, encoding = mimetypes.guess_type(abspath)
-        if mime_type:
-            self.set_header("Content-Type", mime_type)
+        static_file = get_static_file(abspath, st)
+
+        if static_file.mime_type:
+            self.set_header("Content-Type", static_file.mime_type)
+
+        byte_range = self.get_byte_range(static_file.size, static_file.etag, static_file.last_modified)
+
+        # the file is compressed in advance in place of cyclone and the
+        # ranges are always served from the identity
+        encoding = None
+        if static_file.variants:
+            self._transforms = [t for t in self._transforms or [] if not isinstance(t, web.GZipContentEncoding)]
+            self.set_header('Vary', 'Accept-Encoding')
+
+            if byte_range is None:
+                encoding = select_encoding(self.request.headers.get('Accept-Encoding'), static_file.variants)
+
+        self.set_header('Etag', static_file.get_etag(encoding))
+        self.set_header('Last-Modified', static_file.last_modified)
+        self.set_header('Accept-Ranges', 'bytes')
+        self.set_cache_headers(GLSettings.static_fingerprint_regexp.search(path) is not None)
+
+        if self.is_not_modified(static_file, encoding):
+            self.set_status(304)
+            return
+
+        if encoding is not None:
+            compression_stats.record(abspath, static_file.size, static_file.variants, encoding)
+
+            self.set_header('Content-Encoding', encoding)
+
+            if encoding in static_file.variants_data:
+                self.write(static_file.variants_data[encoding])
+            else:
+                variant_path, variant_size = static_file.variants[encoding]
+                self.set_header('Content-Length', variant_size)
+                yield self.write_file(variant_path)
+
+            return
+
+        start, length = 0, static_file.size
+
+        if byte_range is not None:
+            start, last = byte_range
+
+            if start >= static_file.size:
+                self.set_header('Content-Range', 'bytes */%d' % static_file.size)
+                self.set_status(416)
+                return
+
+            length = last - start + 1
+
+            self.set_status(206)
+            self.set_header('Content-Range', 'bytes %d-%d/%d' % (start, last, static_file.size))
+
+            # a part of the file could not be compressed on the fly
+            self._transforms = [t for t in self._transforms or [] if not isinstance(t, web.GZipContentEncoding)]
+
+        if static_file.variants:
+            compression_stats.record(abspath, static_file.size, static_file.variants, None)
+
+        if static_file.data is not None:
+            self.write(static_file.data[start:start + length])
+        else:
+            self.set_header('Content-Length', length)
+            yield self.write_file(abspath, start, length)
+
+    def is_not_modified(self, static_file, encoding):
+        inm = self.request.headers.get('If-None-Match')
+        if inm is not None:
+            return inm.strip() == '*' or static_file.get_etag(encoding) in [etag.strip() for etag in inm.split(',')]
+
+        ims = self.request.headers.get('If-Modified-Since')
+        if ims is not None:
+            date = email.utils.parsedate_tz(ims)
+            return date is not None and email.utils.mktime_tz(date) >= static_file.mtime
+
+        return False
 
-        yield self.write_file(abspath)
 
 
 class BaseRedirectHandler(BaseHandler, RedirectHandler):
@@ -714,7 +1154,7 @@ class TimingStatsHandler(BaseHandler):
     TimingsTracker = []
 
     @staticmethod
-    def log_measured_timing(method, uri, start_time, run_time):
+    def log_measured_timing(method, uri, start_time, run_time, query_stats=None):
         if not GLSettings.log_timing_stats:
             return
 
@@ -740,15 +1180,19 @@ class TimingStatsHandler(BaseHandler):
             'method': method,
             'uri': uri,
             'start_time': start_time,
-            'run_time': run_time
+            'run_time': run_time,
+            'queries': query_stats.count if query_stats is not None else 0,
+            'sql_time': query_stats.time if query_stats is not None else 0
         })
 
     def get(self):
-        csv = "category,method,uri,start_time,run_time\n"
+        csv = "category,method,uri,start_time,run_time,queries,sql_time\n"
         for measure in TimingStatsHandler.TimingsTracker:
-            csv += "%s,%s,%s,%s,%d\n" % (measure['category'],
-                                         measure['method'],
-                                         measure['uri'],
-                                         measure['start_time'],
-                                         measure['run_time'])
+            csv += "%s,%s,%s,%s,%d,%d,%.4f\n" % (measure['category'],
+                                                 measure['method'],
+                                                 measure['uri'],
+                                                 measure['start_time'],
+                                                 measure['run_time'],
+                                                 measure['queries'],
+                                                 measure['sql_time'])
         self.write(csv)
@@ -46,12 +46,21 @@ def get_tip_export(store, user_id, rtip_id, language):
 
     export_dict['files'].append({'buf': export_template, 'name': "data.txt"})
 
+    sha256sums = u''
+
     for rf in store.find(models.ReceiverFile, models.ReceiverFile.receivertip_id == rtip_id):
         rf.downloads += 1
         file_dict = serialize_receiver_file(rf)
         file_dict['name'] = 'files/' + file_dict['name']
         export_dict['files'].append(copy.deepcopy(file_dict))
 
+        # the digests are those of the plaintext of the files as uploaded
+        if file_dict['sha256']:
+            sha256sums += u'%s  %s\n' % (file_dict['sha256'], rf.internalfile.name)
+
+    if sha256sums:
+        export_dict['files'].append({'buf': sha256sums.encode('utf-8'), 'name': "files/SHA256SUMS"})
+
     return export_dict
 
 
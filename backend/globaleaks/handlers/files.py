@@ -4,6 +4,7 @@
 #  *****
 #
 # API handling submissions file uploads and subsequent submissions attachments
+import email.utils
 import os
 import shutil
 from twisted.internet import threads
@@ -15,6 +16,7 @@ from globaleaks.models import ReceiverFile, InternalTip, InternalFile, Whistlebl
 from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import errors
 from globaleaks.settings import GLSettings
+from globaleaks.utils.tempdict import TempDict
 from globaleaks.utils.token import TokenList
 from globaleaks.utils.utility import log, datetime_to_ISO8601, datetime_now
 
@@ -36,6 +38,7 @@ def serialize_receiver_file(receiverfile):
         'content_type': internalfile.content_type,
         'name': ("%s.pgp" % internalfile.name) if receiverfile.status == u'encrypted' else internalfile.name,
         'size': receiverfile.size,
+        'sha256': internalfile.sha256,
         'downloads': receiverfile.downloads,
         'path': receiverfile.file_path,
     }
@@ -70,6 +73,7 @@ def register_file_db(store, uploaded_file, internaltip_id):
     new_file.name = uploaded_file['filename']
     new_file.content_type = uploaded_file['content_type']
     new_file.size = uploaded_file['body_len']
+    new_file.sha256 = uploaded_file['sha256']
     new_file.internaltip_id = internaltip_id
     new_file.submission = uploaded_file['submission']
     new_file.file_path = uploaded_file['encrypted_path']
@@ -221,11 +225,8 @@ class FileInstance(BaseHandler):
         self.set_status(201)  # Created
 
 
-@transact
-def download_file(store, user_id, rtip_id, file_id):
-    """
-    Auth temporary disabled, just Tip_id and File_id required
-    """
+@transact_ro
+def get_receiver_file(store, user_id, rtip_id, file_id):
     db_access_rtip(store, user_id, rtip_id)
 
     rfile = store.find(ReceiverFile,
@@ -234,30 +235,101 @@ def download_file(store, user_id, rtip_id, file_id):
     if not rfile or rfile.receivertip.receiver_id != user_id:
         raise errors.FileIdNotFound
 
+    return serialize_receiver_file(rfile)
+
+
+@transact
+def register_download(store, user_id, file_id):
+    rfile = store.find(ReceiverFile,
+                       ReceiverFile.id == unicode(file_id)).one()
+
+    if rfile is None:
+        return
+
     log.debug("Download of file %s by receiver %s (%d)" %
-              (rfile.internalfile_id, rfile.receivertip.receiver_id, rfile.downloads))
+              (rfile.internalfile_id, user_id, rfile.downloads))
 
     rfile.downloads += 1
 
-    return serialize_receiver_file(rfile)
+
+class DownloadProgress(object):
+    """
+    The bytes of a receiver file sent to a receiver since the last
+    transfer started from the beginning of the file.
+    """
+    def __init__(self, etag):
+        self.etag = etag
+        self.offset = 0
+        self.counted = False
+
+
+DownloadsProgress = TempDict(timeout=GLSettings.authentication_lifetime)
 
 
 class Download(BaseHandler):
+    """
+    Streams a receiver file with the pace of the client, supporting the
+    resume of the interrupted downloads by means of byte ranges.
+
+    A download starts with a transfer from the first byte of the file and
+    continues with the transfers resuming it; it is counted once, when its
+    bytes reach the end of the file, so that neither a download resumed
+    several times nor the ranges requested alone are counted more.
+    """
     handler_exec_time_threshold = 3600
 
     @BaseHandler.transport_security_check('receiver')
     @BaseHandler.authenticated('receiver')
     @inlineCallbacks
     def get(self, rtip_id, rfile_id):
-        rfile = yield download_file(self.current_user.user_id, rtip_id, rfile_id)
+        rfile = yield get_receiver_file(self.current_user.user_id, rtip_id, rfile_id)
 
         filelocation = os.path.join(GLSettings.submission_path, rfile['path'])
 
-        if os.path.exists(filelocation):
-            self.set_header('X-Download-Options', 'noopen')
-            self.set_header('Content-Type', 'application/octet-stream')
-            self.set_header('Content-Length', rfile['size'])
-            self.set_header('Content-Disposition', 'attachment; filename=\"%s\"' % rfile['name'])
-            yield self.write_file(filelocation)
-        else:
+        try:
+            st = os.stat(filelocation)
+        except OSError:
             self.set_status(404)
+            return
+
+        etag = '"%x-%x"' % (int(st.st_mtime), st.st_size)
+        last_modified = email.utils.formatdate(int(st.st_mtime), usegmt=True)
+
+        self.set_header('X-Download-Options', 'noopen')
+        self.set_header('Content-Type', 'application/octet-stream')
+        self.set_header('Content-Disposition', 'attachment; filename=\"%s\"' % rfile['name'])
+        self.set_header('Accept-Ranges', 'bytes')
+        self.set_header('Etag', etag)
+        self.set_header('Last-Modified', last_modified)
+
+        start, last = 0, st.st_size - 1
+
+        byte_range = self.get_byte_range(st.st_size, etag, last_modified)
+        if byte_range is not None:
+            start, last = byte_range
+
+            if start >= st.st_size:
+                self.set_header('Content-Range', 'bytes */%d' % st.st_size)
+                self.set_status(416)
+                return
+
+            self.set_status(206)
+            self.set_header('Content-Range', 'bytes %d-%d/%d' % (start, last, st.st_size))
+
+        self.set_header('Content-Length', last - start + 1)
+
+        key = (self.current_user.user_id, rfile_id)
+        if start == 0:
+            DownloadsProgress.set(key, DownloadProgress(etag))
+
+        progress = DownloadsProgress.get(key)
+        if progress is not None and (progress.etag != etag or start > progress.offset):
+            progress = None
+
+        sent = yield self.write_file(filelocation, start, last - start + 1)
+
+        if progress is not None and not progress.counted:
+            progress.offset = max(progress.offset, start + sent)
+            if progress.offset == st.st_size:
+                progress.counted = True
+                yield register_download(self.current_user.user_id, rfile_id)
@@ -6,12 +6,12 @@
 import json
 import os
 
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.orm import transact_ro
-from globaleaks.rest.apicache import GLApiCache
+from globaleaks.rest.apicache import CachedResponse
 from globaleaks.settings import GLSettings
 from globaleaks.security import directory_traversal_check
 
@@ -21,19 +21,91 @@ def langfile_path(lang):
 
 
 @transact_ro
-def get_l10n(store, lang):
-    path = langfile_path(lang)
-    directory_traversal_check(GLSettings.client_path, path)
+def get_custom_texts(store, lang):
+    texts = store.find(models.CustomTexts, models.CustomTexts.lang == unicode(lang)).one()
+    return texts.texts if texts is not None else {}
 
-    with open(path, 'rb') as f:
-        texts = json.loads(f.read())
 
-    custom_texts = store.find(models.CustomTexts, models.CustomTexts.lang == unicode(lang)).one()
-    custom_texts = custom_texts.texts if custom_texts is not None else {}
+class L10NBundles(object):
+    """
+    Keeps in memory the texts of the translation files of the client merged
+    with the custom texts of the admin and their CachedResponse for each
+    language.
+
+    A translation file is loaded on the first request of its language and
+    then reloaded only when it changes on disk, while the custom texts are
+    loaded once from the database and then kept updated by the admin l10n
+    handler; a bundle is built again only when one of the two changes.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.files = {}
+        self.custom_texts = {}
+        self.bundles = {}
+        self.hits = 0
+        self.builds = 0
+        self.reloads = 0
+
+    def load_file(self, lang):
+        path = langfile_path(lang)
+        directory_traversal_check(GLSettings.client_path, path)
+
+        stat = os.stat(path)
+        version = (stat.st_mtime, stat.st_size)
+
+        if lang in self.files:
+            if self.files[lang][0] == version:
+                return
+
+            self.reloads += 1
+
+        with open(path, 'rb') as f:
+            self.files[lang] = (version, json.loads(f.read()))
+
+        self.bundles.pop(lang, None)
+
+    def set_custom_texts(self, lang, texts):
+        self.custom_texts[lang] = texts
+        self.bundles.pop(lang, None)
 
-    texts.update(custom_texts)
+    @inlineCallbacks
+    def get(self, lang):
+        """
+        Returns the CachedResponse of the texts of the given language
+        """
+        self.load_file(lang)
+
+        if lang not in self.custom_texts:
+            custom_texts = yield get_custom_texts(lang)
+
+            # the texts could have been set by the admin in the meantime
+            self.custom_texts.setdefault(lang, custom_texts)
+
+        if lang in self.bundles:
+            self.hits += 1
+        else:
+            self.builds += 1
+
+            texts = dict(self.files[lang][1])
+            texts.update(self.custom_texts[lang])
 
-    return texts
+            self.bundles[lang] = CachedResponse(texts)
+
+        returnValue(self.bundles[lang])
+
+    def get_stats(self):
+        return {
+            'languages': len(self.bundles),
+            'size': sum(len(bundle.body) + len(bundle.gzip_body) for bundle in self.bundles.values()),
+            'hits': self.hits,
+            'builds': self.builds,
+            'reloads': self.reloads
+        }
+
+
+l10n_bundles = L10NBundles()
 
 
 class L10NHandler(BaseHandler):
@@ -45,9 +117,6 @@ class L10NHandler(BaseHandler):
     @BaseHandler.unauthenticated
     @inlineCallbacks
     def get(self, lang):
-        self.set_header('Content-Type', 'application/json')
-
-        l10n = yield GLApiCache.get('l10n', self.request.language,
-                                    get_l10n, self.request.language)
+        l10n = yield l10n_bundles.get(lang)
 
-        self.write(l10n)
+        self.write_cached_response(l10n)
@@ -5,11 +5,15 @@
 # Implementation of classes handling the HTTP request to /node, public
 # exposed API.
 
-from twisted.internet.defer import inlineCallbacks
+from collections import defaultdict
+
+from twisted.internet.defer import DeferredList, inlineCallbacks
 
 from globaleaks import models, LANGUAGES_SUPPORTED
-from globaleaks.handlers.admin.files import db_get_file
+from globaleaks.handlers.assets import db_get_asset_url, db_get_node_asset_url
 from globaleaks.handlers.base import BaseHandler
+from globaleaks.handlers.l10n import l10n_bundles
+from globaleaks.handlers.robots import get_cached_ahmia
 from globaleaks.models import l10n
 from globaleaks.models.config import NodeFactory
 from globaleaks.models.l10n import NodeL10NFactory
@@ -18,6 +22,8 @@ from globaleaks.rest.apicache import GLApiCache
 from globaleaks.settings import GLSettings
 from globaleaks.utils.sets import disjoint_union
 from globaleaks.utils.structures import get_localized_values
+from globaleaks.utils.utility import log
+from storm.expr import In
 
 
 def db_serialize_node(store, language):
@@ -37,11 +43,11 @@ def db_serialize_node(store, language):
         'languages_supported': LANGUAGES_SUPPORTED,
         'configured': configured,
         'accept_submissions': GLSettings.accept_submissions,
-        'logo': db_get_file(store, u'logo'),
-        'favicon': db_get_file(store, u'favicon'),
-        'css': db_get_file(store, u'css'),
-        'homepage': db_get_file(store, u'homepage'),
-        'script': db_get_file(store, u'script')
+        'logo': db_get_node_asset_url(store, u'logo'),
+        'favicon': db_get_node_asset_url(store, u'favicon'),
+        'css': db_get_node_asset_url(store, u'css'),
+        'homepage': db_get_node_asset_url(store, u'homepage'),
+        'script': db_get_node_asset_url(store, u'script')
     }
 
     l10n_dict = NodeL10NFactory(store).localized_dict(language)
@@ -54,11 +60,96 @@ def serialize_node(store, language):
     return db_serialize_node(store, language)
 
 
-def serialize_context(store, context, language):
+def find_in(store, model, column, values, chunk_size=500):
+    """
+    Yields the objects of the model whose column has one of the values,
+    looking them up in chunks that do not exceed the number of variables
+    of a query
+    """
+    values = list(values)
+
+    for i in range(0, len(values), chunk_size):
+        for obj in store.find(model, In(column, values[i:i + chunk_size])):
+            yield obj
+
+
+class QuestionnaireTree(object):
+    """
+    In-memory indexes of the steps of a set of questionnaires, or of the
+    given steps or fields, and of all the fields below them with the
+    templates they refer to, their attributes and their options.
+
+    The fields are loaded level by level so that the tree is loaded with
+    a number of queries depending only on its depth, and the questionnaires,
+    the steps and the fields could be serialized without following the
+    references of each object.
+    """
+    def __init__(self, store, questionnaire_ids=(), step_ids=(), field_ids=()):
+        self.fields = {}
+        self.steps = defaultdict(list)
+        self.step_children = defaultdict(list)
+        self.field_children = defaultdict(list)
+        self.attrs = defaultdict(list)
+        self.options = defaultdict(list)
+        self.step_triggers = defaultdict(list)
+        self.field_triggers = defaultdict(list)
+
+        steps = {}
+        for step in find_in(store, models.Step, models.Step.questionnaire_id, questionnaire_ids):
+            steps[step.id] = step
+
+        for step in find_in(store, models.Step, models.Step.id, step_ids):
+            steps.setdefault(step.id, step)
+
+        for step in steps.values():
+            self.steps[step.questionnaire_id].append(step)
+
+        level = list(find_in(store, models.Field, models.Field.step_id, steps.keys()))
+        level += list(find_in(store, models.Field, models.Field.id, field_ids))
+
+        while level:
+            loaded = []
+            for field in level:
+                if field.id in self.fields:
+                    continue
+
+                self.fields[field.id] = field
+                loaded.append(field)
+
+                if field.step_id is not None:
+                    self.step_children[field.step_id].append(field)
+
+                if field.fieldgroup_id is not None:
+                    self.field_children[field.fieldgroup_id].append(field)
+
+            # the next level is made of the children of the fields loaded
+            # and of the templates they refer to
+            templates_ids = set(field.template_id for field in loaded
+                                if field.template_id is not None and field.template_id not in self.fields)
+
+            level = list(find_in(store, models.Field, models.Field.fieldgroup_id, [field.id for field in loaded]))
+            level += list(find_in(store, models.Field, models.Field.id, templates_ids))
+
+        for attr in find_in(store, models.FieldAttr, models.FieldAttr.field_id, self.fields.keys()):
+            self.attrs[attr.field_id].append(attr)
+
+        for option in find_in(store, models.FieldOption, models.FieldOption.field_id, self.fields.keys()):
+            self.options[option.field_id].append(option)
+
+        # the triggering options could belong to fields outside of the tree
+        for option in find_in(store, models.FieldOption, models.FieldOption.trigger_step, steps.keys()):
+            self.step_triggers[option.trigger_step].append(option)
+
+        for option in find_in(store, models.FieldOption, models.FieldOption.trigger_field, self.fields.keys()):
+            self.field_triggers[option.trigger_field].append(option)
+
+
+def serialize_context(store, context, language, tree=None):
     """
     Serialize context description
 
     @param context: a valid Storm object
+    @param tree: the QuestionnaireTree including the context questionnaire
     @return: a dict describing the contexts available for submission,
         (e.g. checks if almost one receiver is associated)
     """
@@ -78,22 +169,26 @@ def serialize_context(store, context, language):
         'enable_two_way_messages': context.enable_two_way_messages,
         'enable_attachments': context.enable_attachments,
         'show_receivers_in_alphabetical_order': context.show_receivers_in_alphabetical_order,
-        'questionnaire': serialize_questionnaire(store, context.questionnaire, language), 
+        'questionnaire': serialize_questionnaire(store, context.questionnaire, language, tree),
         'receivers': [r.id for r in context.receivers],
-        'picture': context.picture.data if context.picture is not None else ''
+        'picture': db_get_asset_url(context.picture)
     }
 
     return get_localized_values(ret_dict, context, context.localized_keys, language)
 
 
-def serialize_questionnaire(store, questionnaire, language):
+def serialize_questionnaire(store, questionnaire, language, tree=None):
     """
     Serialize the specified questionnaire
 
     :param store: the store on which perform queries.
     :param language: the language in which to localize data.
+    :param tree: the QuestionnaireTree including the questionnaire.
     :return: a dictionary representing the serialization of the questionnaire.
     """
+    if tree is None:
+        tree = QuestionnaireTree(store, [questionnaire.id])
+
     ret_dict = {
         'id': questionnaire.id,
         'key': questionnaire.key,
@@ -101,7 +196,7 @@ def serialize_questionnaire(store, questionnaire, language):
         'name': questionnaire.name,
         'show_steps_navigation_bar': questionnaire.show_steps_navigation_bar,
         'steps_navigation_requires_completion': questionnaire.steps_navigation_requires_completion,
-        'steps': [serialize_step(store, s, language) for s in questionnaire.steps]
+        'steps': [serialize_step(store, s, language, tree) for s in tree.steps[questionnaire.id]]
     }
 
     return get_localized_values(ret_dict, questionnaire, questionnaire.localized_keys, language)
@@ -149,31 +244,35 @@ def serialize_field_attr(attr, language):
     return ret_dict
 
 
-def serialize_field(store, field, language):
+def serialize_field(store, field, language, tree=None):
     """
     Serialize a field, localizing its content depending on the language.
 
     :param field: the field object to be serialized
     :param language: the language in which to localize data
+    :param tree: the QuestionnaireTree used to lookup the related objects
     :return: a serialization of the object
     """
+    if tree is None:
+        tree = QuestionnaireTree(store, field_ids=[field.id])
+
     # naif likes if we add reference links
     # this code is inspired by:
     #  - https://www.youtube.com/watch?v=KtNsUgKgj9g
 
-    if field.template:
-        f_to_serialize = field.template
+    if field.template_id:
+        f_to_serialize = tree.fields[field.template_id]
     else:
         f_to_serialize = field
 
     attrs = {}
-    for attr in store.find(models.FieldAttr, models.FieldAttr.field_id == f_to_serialize.id):
+    for attr in tree.attrs[f_to_serialize.id]:
         attrs[attr.name] = serialize_field_attr(attr, language)
 
     triggered_by_options = [{
         'field': trigger.field_id,
         'option': trigger.id
-    } for trigger in field.triggered_by_options]
+    } for trigger in tree.field_triggers[field.id]]
 
     ret_dict = {
         'id': field.id,
@@ -194,25 +293,29 @@ def serialize_field(store, field, language):
         'width': field.width,
         'triggered_by_score': field.triggered_by_score,
         'triggered_by_options': triggered_by_options,
-        'options': [serialize_field_option(o, language) for o in f_to_serialize.options],
-        'children': [serialize_field(store, f, language) for f in f_to_serialize.children]
+        'options': [serialize_field_option(o, language) for o in tree.options[f_to_serialize.id]],
+        'children': [serialize_field(store, f, language, tree) for f in tree.field_children[f_to_serialize.id]]
     }
 
     return get_localized_values(ret_dict, f_to_serialize, field.localized_keys, language)
 
 
-def serialize_step(store, step, language):
+def serialize_step(store, step, language, tree=None):
     """
     Serialize a step, localizing its content depending on the language.
 
     :param step: the step to be serialized.
     :param language: the language in which to localize data
+    :param tree: the QuestionnaireTree used to lookup the related objects
     :return: a serialization of the object
     """
+    if tree is None:
+        tree = QuestionnaireTree(store, step_ids=[step.id])
+
     triggered_by_options = [{
         'field': trigger.field_id,
         'option': trigger.id
-    } for trigger in step.triggered_by_options]
+    } for trigger in tree.step_triggers[step.id]]
 
     ret_dict = {
         'id': step.id,
@@ -220,7 +323,7 @@ def serialize_step(store, step, language):
         'presentation_order': step.presentation_order,
         'triggered_by_score': step.triggered_by_score,
         'triggered_by_options': triggered_by_options,
-        'children': [serialize_field(store, f, language) for f in step.children]
+        'children': [serialize_field(store, f, language, tree) for f in tree.step_children[step.id]]
     }
 
     return get_localized_values(ret_dict, step, step.localized_keys, language)
@@ -242,7 +345,7 @@ def serialize_receiver(receiver, language):
         'configuration': receiver.configuration,
         'presentation_order': receiver.presentation_order,
         'contexts': [c.id for c in receiver.contexts],
-        'picture': receiver.user.picture.data if receiver.user.picture is not None else ''
+        'picture': db_get_asset_url(receiver.user.picture)
     }
 
     # description and eventually other localized strings should be taken from user model
@@ -254,9 +357,12 @@ def serialize_receiver(receiver, language):
 def db_get_public_context_list(store, language):
     context_list = []
 
-    for context in store.find(models.Context):
-        if context.receivers.count():
-            context_list.append(serialize_context(store, context, language))
+    contexts = [c for c in store.find(models.Context) if c.receivers.count()]
+
+    tree = QuestionnaireTree(store, set(c.questionnaire_id for c in contexts))
+
+    for context in contexts:
+        context_list.append(serialize_context(store, context, language, tree))
 
     return context_list
 
@@ -281,7 +387,43 @@ def get_public_resources(store, language):
     }
 
 
+def get_cached_public_resources(language):
+    return GLApiCache.get('public', language,
+                          ['node', 'contexts', 'questionnaires', 'fields',
+                           'receivers', 'users', 'files', 'pictures'],
+                          get_public_resources, language)
+
+
+def warm_public_resources():
+    """
+    Computes the cached public resources for all the enabled languages so
+    that the first visitors do not wait for them.
+
+    The returned Deferred fires once they are all up to date, including
+    the stale ones served while the GLApiCache recomputes them after an
+    invalidation.
+    """
+    def failed(failure, language):
+        log.err("Unable to warm the public resources (%s): %s" %
+                (language, failure.getErrorMessage()))
+
+    dl = []
+
+    for language in GLSettings.memory_copy.languages_enabled:
+        dl.append(get_cached_public_resources(language).addErrback(failed, language))
+        dl.append(l10n_bundles.get(language).addErrback(failed, language))
+
+        if GLSettings.memory_copy.ahmia:
+            dl.append(get_cached_ahmia(language).addErrback(failed, language))
+
+    d = DeferredList(dl)
+    d.addCallback(lambda _: GLApiCache.wait_refreshes())
+    return d
+
+
 class PublicResource(BaseHandler):
+    query_budget = 50
+
     @BaseHandler.transport_security_check("unauth")
     @BaseHandler.unauthenticated
     @inlineCallbacks
@@ -289,6 +431,6 @@ class PublicResource(BaseHandler):
         """
         Get all the public resources.
         """
-        ret = yield GLApiCache.get('public', self.request.language,
-                                   get_public_resources, self.request.language)
-        self.write(ret)
+        ret = yield get_cached_public_resources(self.request.language)
+
+        self.write_cached_response(ret)
@@ -6,20 +6,21 @@
 # Used by receivers to update personal preferences and access to personal data
 
 from twisted.internet.defer import inlineCallbacks
-from storm.expr import And, In
+from storm.expr import And, Count, Desc, In, Or
 
 from globaleaks.orm import transact, transact_ro
 from globaleaks.handlers.user import db_user_update_user
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.handlers.rtip import db_postpone_expiration_date, db_delete_rtip
-from globaleaks.handlers.submission import db_get_archived_preview_schema
+from globaleaks.handlers.rtip import db_postpone_expiration_date, db_delete_itips
+from globaleaks.handlers.submission import db_get_archived_preview_schemas
 from globaleaks.handlers.user import user_serialize_user
-from globaleaks.models import Receiver, ReceiverTip
+from globaleaks.models import Comment, Context, InternalFile, InternalTip, Message, \
+    Receiver, ReceiverTip
 from globaleaks.rest import requests, errors
 from globaleaks.rest.apicache import GLApiCache
 from globaleaks.settings import GLSettings
 from globaleaks.utils.structures import Rosetta, get_localized_values
-from globaleaks.utils.utility import log, datetime_to_ISO8601
+from globaleaks.utils.utility import log, datetime_to_ISO8601, ISO8601_to_datetime
 
 # https://www.youtube.com/watch?v=BMxaLEGCVdg
 def receiver_serialize_receiver(receiver, language):
@@ -61,36 +62,140 @@ def update_receiver_settings(store, receiver_id, request, language):
     return receiver_serialize_receiver(receiver, language)
 
 
-@transact_ro
-def get_receivertip_list(store, receiver_id, language):
-    rtip_summary_list = []
+# columns by which the list of the tips of a receiver could be sorted
+rtip_list_sort_keys = {
+    'creation_date': InternalTip.creation_date,
+    'update_date': InternalTip.update_date,
+    'expiration_date': InternalTip.expiration_date,
+    'progressive': InternalTip.progressive,
+    'total_score': InternalTip.total_score,
+    'last_access': ReceiverTip.last_access,
+    'label': ReceiverTip.label
+}
+
+
+def db_get_count_by(store, column, group_by, where):
+    return dict(store.find((group_by, Count(column)), *where).group_by(group_by))
+
+
+def db_get_receivertip_list(store, receiver_id, language,
+                            sort='creation_date', order='asc', cursor=None, limit=None,
+                            context_id=None, label=None, min_score=None,
+                            start_date=None, end_date=None):
+    """
+    Returns the summary of the tips of a receiver using a constant number of
+    queries independently of the number of the tips.
+
+    The list is sorted by the sort key and by the id of the tips so that
+    it could be paginated by passing as cursor the id of the last tip of
+    the previous page.
+
+    :return: the list of the summaries and the cursor of the next page
+    """
+    if sort not in rtip_list_sort_keys or order not in ['asc', 'desc']:
+        raise errors.InvalidInputFormat("Invalid sort key")
+
+    sort_key = rtip_list_sort_keys[sort]
+
+    where = [ReceiverTip.receiver_id == receiver_id,
+             ReceiverTip.internaltip_id == InternalTip.id]
+
+    if context_id is not None:
+        where.append(InternalTip.context_id == context_id)
+
+    if label is not None:
+        where.append(ReceiverTip.label == label)
+
+    if min_score is not None:
+        where.append(InternalTip.total_score >= min_score)
+
+    if start_date is not None:
+        where.append(InternalTip.creation_date >= start_date)
+
+    if end_date is not None:
+        where.append(InternalTip.creation_date <= end_date)
+
+    if cursor is not None:
+        value = store.find(sort_key, *(where + [ReceiverTip.id == cursor])).one()
+        if value is None:
+            raise errors.TipIdNotFound
+
+        if order == 'asc':
+            where.append(Or(sort_key > value, And(sort_key == value, ReceiverTip.id > cursor)))
+        else:
+            where.append(Or(sort_key < value, And(sort_key == value, ReceiverTip.id < cursor)))
+
+    tips = store.find((ReceiverTip, InternalTip), *where)
+
+    if order == 'asc':
+        tips = tips.order_by(sort_key, ReceiverTip.id)
+    else:
+        tips = tips.order_by(Desc(sort_key), Desc(ReceiverTip.id))
+
+    if limit is not None:
+        tips = list(tips[:limit + 1])
+    else:
+        tips = list(tips)
 
-    for rtip in store.find(ReceiverTip, ReceiverTip.receiver_id == receiver_id):
-        mo = Rosetta(rtip.internaltip.context.localized_keys)
-        mo.acquire_storm_object(rtip.internaltip.context)
+    next_cursor = None
+    if limit is not None and len(tips) > limit:
+        tips = tips[:limit]
+        next_cursor = tips[-1][0].id
 
+    # the counters are grouped over the same selection of the tips instead
+    # of their ids that could exceed the number of the variables of a query
+    file_counters = db_get_count_by(store, InternalFile.id, InternalTip.id,
+                                    where + [InternalFile.internaltip_id == InternalTip.id])
+    comment_counters = db_get_count_by(store, Comment.id, InternalTip.id,
+                                       where + [Comment.internaltip_id == InternalTip.id])
+    message_counters = db_get_count_by(store, Message.id, ReceiverTip.id,
+                                       where + [Message.receivertip_id == ReceiverTip.id])
+
+    context_names = {}
+    for context in store.find(Context, In(Context.id, list(set(itip.context_id for _, itip in tips)))):
+        mo = Rosetta(context.localized_keys)
+        mo.acquire_storm_object(context)
+        context_names[context.id] = mo.dump_localized_key('name', language)
+
+    # the preview schemas are shared by all the tips with the same questionnaire
+    preview_schemas = db_get_archived_preview_schemas(store, set(itip.questionnaire_hash for _, itip in tips), language)
+
+    rtip_summary_list = []
+
+    for rtip, itip in tips:
         rtip_summary_list.append({
             'id': rtip.id,
-            'creation_date': datetime_to_ISO8601(rtip.internaltip.creation_date),
+            'creation_date': datetime_to_ISO8601(itip.creation_date),
             'last_access': datetime_to_ISO8601(rtip.last_access),
-            'update_date': datetime_to_ISO8601(rtip.internaltip.update_date),
-            'expiration_date': datetime_to_ISO8601(rtip.internaltip.expiration_date),
-            'progressive': rtip.internaltip.progressive,
-            'new': rtip.access_counter == 0 or rtip.last_access < rtip.internaltip.update_date,
-            'context_name': mo.dump_localized_key('name', language),
+            'update_date': datetime_to_ISO8601(itip.update_date),
+            'expiration_date': datetime_to_ISO8601(itip.expiration_date),
+            'progressive': itip.progressive,
+            'new': rtip.access_counter == 0 or rtip.last_access < itip.update_date,
+            'context_id': itip.context_id,
+            'context_name': context_names.get(itip.context_id, u''),
             'access_counter': rtip.access_counter,
-            'file_counter': rtip.internaltip.internalfiles.count(),
-            'comment_counter': rtip.internaltip.comments.count(),
-            'message_counter': rtip.messages.count(),
-            'tor2web': rtip.internaltip.tor2web,
-            'questionnaire_hash': rtip.internaltip.questionnaire_hash,
-            'preview_schema': db_get_archived_preview_schema(store, rtip.internaltip.questionnaire_hash, language),
-            'preview': rtip.internaltip.preview,
-            'total_score': rtip.internaltip.total_score,
+            'file_counter': file_counters.get(itip.id, 0),
+            'comment_counter': comment_counters.get(itip.id, 0),
+            'message_counter': message_counters.get(rtip.id, 0),
+            'tor2web': itip.tor2web,
+            'questionnaire_hash': itip.questionnaire_hash,
+            'preview_schema': preview_schemas[itip.questionnaire_hash],
+            'preview': itip.preview,
+            'total_score': itip.total_score,
             'label': rtip.label
         })
 
-    return rtip_summary_list
+    return rtip_summary_list, next_cursor
+
+
+@transact_ro
+def get_receivertip_list(store, receiver_id, language, **kwargs):
+    return db_get_receivertip_list(store, receiver_id, language, **kwargs)[0]
+
+
+@transact_ro
+def get_receivertip_page(store, receiver_id, language, **kwargs):
+    return db_get_receivertip_list(store, receiver_id, language, **kwargs)
 
 
 @transact
@@ -113,8 +218,7 @@ def perform_tips_operation(store, receiver_id, operation, rtips_ids):
         if not can_delete_submission:
             raise errors.ForbiddenOperation
 
-        for rtip in rtips:
-            db_delete_rtip(store, rtip)
+        db_delete_itips(store, [rtip.internaltip_id for rtip in rtips])
 
     log.debug("Multiple %s of %d Tips completed" % (operation, len(rtips_ids)))
 
@@ -159,7 +263,7 @@ class ReceiverInstance(BaseHandler):
                                                          request,
                                                          self.request.language)
 
-        GLApiCache.invalidate()
+        GLApiCache.invalidate('receivers')
 
         self.write(receiver_status)
 
@@ -169,16 +273,55 @@ class TipsCollection(BaseHandler):
     This interface return the summary list of the Tips available for the authenticated Receiver
     GET /tips
     """
+    query_budget = 10
+
+    def get_list_arguments(self):
+        arguments = {'limit': GLSettings.receiver_tip_list_limit}
+
+        for key in ['sort', 'order', 'cursor', 'context_id', 'label', 'limit', 'min_score', 'start_date', 'end_date']:
+            if key not in self.request.arguments:
+                continue
+
+            value = self.request.arguments[key][0]
+
+            try:
+                if key in ['limit', 'min_score']:
+                    value = int(value)
+                    if key == 'limit' and value < 1:
+                        raise ValueError
+                elif key in ['start_date', 'end_date']:
+                    value = ISO8601_to_datetime(value)
+                else:
+                    value = value.decode('utf-8')
+            except ValueError:
+                raise errors.InvalidInputFormat(key)
+
+            arguments[key] = value
+
+        arguments['limit'] = min(arguments['limit'], GLSettings.receiver_tip_list_limit)
+
+        return arguments
+
     @BaseHandler.transport_security_check('receiver')
     @BaseHandler.authenticated('receiver')
     @inlineCallbacks
     def get(self):
         """
+        Parameters: sort, order, cursor, limit, context_id, label, min_score,
+                    start_date, end_date (all optional)
         Response: receiverTipList
-        Errors: InvalidAuthentication
+        Errors: InvalidAuthentication, InvalidInputFormat, TipIdNotFound
+
+        The limit defaults to and could not exceed receiver_tip_list_limit;
+        the cursor of the next page, if any, is returned in the X-Next-Cursor
+        header.
         """
-        answer = yield get_receivertip_list(self.current_user.user_id,
-                                            self.request.language)
+        answer, next_cursor = yield get_receivertip_page(self.current_user.user_id,
+                                                         self.request.language,
+                                                         **self.get_list_arguments())
+
+        if next_cursor is not None:
+            self.set_header('X-Next-Cursor', next_cursor)
 
         self.write(answer)
 
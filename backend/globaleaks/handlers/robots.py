@@ -38,6 +38,10 @@ def serialize_ahmia(store, language):
     }
 
 
+def get_cached_ahmia(language):
+    return GLApiCache.get('ahmia', language, ['node'], serialize_ahmia, language)
+
+
 class AhmiaDescriptionHandler(BaseHandler):
     @BaseHandler.transport_security_check("unauth")
     @BaseHandler.unauthenticated
@@ -51,10 +55,9 @@ class AhmiaDescriptionHandler(BaseHandler):
             self.set_status(404)
             return
 
-        ret = yield GLApiCache.get('ahmia', self.request.language,
-                                   serialize_ahmia, self.request.language)
+        ret = yield get_cached_ahmia(self.request.language)
 
-        self.write(ret)
+        self.write_cached_response(ret)
 
 
 class RobotstxtHandler(BaseHandler):
@@ -8,6 +8,7 @@
 
 import os
 
+from storm.expr import And, In, Not, Select, Union
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.orm import transact, transact_ro
@@ -15,9 +16,10 @@ from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.custodian import serialize_identityaccessrequest
 from globaleaks.handlers.submission import serialize_usertip
 from globaleaks.models import Comment, Message, \
-    ReceiverFile, ReceiverTip, InternalTip, ArchivedSchema, \
+    InternalFile, ReceiverFile, ReceiverTip, InternalTip, ArchivedSchema, \
     SecureFileDelete, IdentityAccessRequest
 from globaleaks.rest import errors, requests
+from globaleaks.rest.apicache import QuestionnaireCache
 from globaleaks.settings import GLSettings
 from globaleaks.utils.utility import log, utc_future_date, datetime_now, \
     datetime_to_ISO8601, datetime_to_pretty_str
@@ -41,6 +43,7 @@ def receiver_serialize_file(internalfile, receiverfile, receivertip_id):
             'content_type': internalfile.content_type,
             'creation_date': datetime_to_ISO8601(internalfile.creation_date),
             'size': receiverfile.size,
+            'sha256': internalfile.sha256,
             'downloads': receiverfile.downloads
         }
 
@@ -55,6 +58,7 @@ def receiver_serialize_file(internalfile, receiverfile, receivertip_id):
             'content_type': internalfile.content_type,  # original content size
             'creation_date': datetime_to_ISO8601(internalfile.creation_date),  # original creation_date
             'size': int(internalfile.size),  # original filesize
+            'sha256': internalfile.sha256,  # original digest
             'downloads': unicode(receiverfile.downloads)  # this counter is always valid
         }
 
@@ -150,40 +154,65 @@ def db_mark_file_for_secure_deletion(store, relpath):
         store.add(secure_file_delete)
 
 
-def db_delete_itip_files(store, itip):
-    log.debug("Removing files associated to InternalTip %s" % itip.id)
-    for ifile in itip.internalfiles:
-        log.debug("Marking internalfile %s for secure deletion" % ifile.file_path)
+def db_delete_itips_files(store, itips_ids):
+    """
+    Marks for secure deletion the files of the given tips resolving all
+    their paths with a single query.
 
-        db_mark_file_for_secure_deletion(store, ifile.file_path)
+    The paths of the receiverfiles referencing the plaintext file (no E2E)
+    are the ones of their internalfiles and are marked only once.
+    """
+    ifiles = Select(InternalFile.file_path,
+                    In(InternalFile.internaltip_id, itips_ids))
 
-        for rfile in store.find(ReceiverFile, ReceiverFile.internalfile_id == ifile.id):
-            # The following code must be bypassed if rfile.file_path == ifile.filepath,
-            # this mean that is referenced the plaintext file instead having E2E.
-            if rfile.file_path == ifile.file_path:
-                continue
+    rfiles = Select(ReceiverFile.file_path,
+                    And(ReceiverFile.internalfile_id == InternalFile.id,
+                        In(InternalFile.internaltip_id, itips_ids)))
 
-            log.debug("Marking receiverfile %s for secure deletion" % rfile.file_path)
+    for file_path, in store.execute(Union(ifiles, rfiles)):
+        log.debug("Marking file %s for secure deletion" % file_path)
 
-            db_mark_file_for_secure_deletion(store, rfile.file_path)
+        db_mark_file_for_secure_deletion(store, file_path)
 
 
-def db_delete_itip(store, itip):
-    log.debug("Removing InternalTip %s" % itip.id)
+def db_delete_itips(store, itips_ids):
+    """
+    Deletes the given tips with set based statements relying on the
+    cascade of the foreign keys for the deletion of the related rows.
+
+    The archived questionnaires no more referenced by any tip are deleted
+    as well.
+
+    :return: the number of rows deleted
+    """
+    if not itips_ids:
+        return 0
 
-    db_delete_itip_files(store, itip)
+    log.debug("Removing InternalTips %s" % ', '.join(itips_ids))
 
-    store.remove(itip)
+    db_delete_itips_files(store, itips_ids)
 
-    if store.find(InternalTip, InternalTip.questionnaire_hash == itip.questionnaire_hash).count() == 0:
-        store.find(ArchivedSchema, ArchivedSchema.hash == itip.questionnaire_hash).remove()
+    store.flush()
 
+    total_changes = store.execute("SELECT total_changes()").get_one()[0]
 
-def db_delete_itips(store, itips):
-    for itip in itips:
-        db_delete_itip_files(store, itip)
+    hashes = list(store.find(InternalTip.questionnaire_hash,
+                             In(InternalTip.id, itips_ids)).config(distinct=True))
 
-    itips.remove()
+    store.find(InternalTip, In(InternalTip.id, itips_ids)).remove()
+
+    store.find(ArchivedSchema,
+               And(In(ArchivedSchema.hash, hashes),
+                   Not(In(ArchivedSchema.hash,
+                          Select(InternalTip.questionnaire_hash, distinct=True))))).remove()
+
+    QuestionnaireCache.unset_archived(hashes)
+
+    return store.execute("SELECT total_changes()").get_one()[0] - total_changes
+
+
+def db_delete_itip(store, itip):
+    return db_delete_itips(store, [itip.id])
 
 
 def db_delete_rtip(store, rtip):
@@ -348,6 +377,8 @@ class RTipInstance(BaseHandler):
     """
     This interface exposes the Receiver's Tip
     """
+    query_budget = 60
+
     @BaseHandler.transport_security_check('receiver')
     @BaseHandler.authenticated('receiver')
     @inlineCallbacks
@@ -13,14 +13,16 @@ from twisted.internet import defer
 from globaleaks import models
 from globaleaks.handlers.admin.context import db_get_context_steps
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.orm import transact
+from globaleaks.orm import transact, db_executemany
 from globaleaks.rest import errors, requests
+from globaleaks.rest.apicache import QuestionnaireCache
 from globaleaks.security import hash_password, sha256, generateRandomReceipt
 from globaleaks.settings import GLSettings
 from globaleaks.utils.structures import Rosetta, get_localized_values
+from globaleaks.utils.lrucache import LRUCache, freeze
 from globaleaks.utils.token import TokenList
-from globaleaks.utils.utility import log, utc_future_date, datetime_now, datetime_to_ISO8601
-from storm.expr import And, In
+from globaleaks.utils.utility import log, utc_future_date, datetime_now, datetime_to_ISO8601, uuid4
+from storm.expr import In
 
 
 def get_submission_sequence_number(itip):
@@ -67,17 +69,34 @@ def _db_get_archived_field_recursively(field, language):
     return get_localized_values(field, field, models.Field.localized_keys, language)
 
 
+# Archived schemas never change once written and so their localized
+# versions are cached and shared frozen between all the users
+archived_schema_cache = LRUCache(GLSettings.archived_schema_cache_size)
+
+
+def _cache_archived_questionnaire_schema(aqs, language):
+    questionnaire = freeze(_localize_archived_questionnaire_schema(copy.deepcopy(aqs.schema), aqs.type, language))
+    archived_schema_cache.set((aqs.hash, aqs.type, language), questionnaire, len(json.dumps(questionnaire)))
+    return questionnaire
+
+
 def _db_get_archived_questionnaire_schema(store, hash, type, language):
+    questionnaire = archived_schema_cache.get((hash, type, language))
+    if questionnaire is not None:
+        return questionnaire
+
     aqs = store.find(models.ArchivedSchema,
                      models.ArchivedSchema.hash == hash,
                      models.ArchivedSchema.type == type).one()
 
     if not aqs:
         log.err("Unable to find questionnaire schema with hash %s" % hash)
-        questionnaire = []
-    else:
-        questionnaire = copy.deepcopy(aqs.schema)
+        return []
+
+    return _cache_archived_questionnaire_schema(aqs, language)
+
 
+def _localize_archived_questionnaire_schema(questionnaire, type, language):
     if type == 'questionnaire':
         for step in questionnaire:
             for field in step['children']:
@@ -100,24 +119,81 @@ def db_get_archived_preview_schema(store, hash, language):
     return _db_get_archived_questionnaire_schema(store, hash, u'preview', language)
 
 
-def db_serialize_questionnaire_answers_recursively(answers):
+def db_get_archived_preview_schemas(store, hashes, language):
+    """
+    Returns a dictionary of the localized preview schemas with the given
+    hashes loading the ones not cached with a single query
+    """
     ret = {}
+    missing = []
+
+    for hash in hashes:
+        ret[hash] = archived_schema_cache.get((hash, u'preview', language))
+        if ret[hash] is None:
+            missing.append(hash)
 
-    for answer in answers:
-        if answer.is_leaf:
-            ret[answer.key] = answer.value
+    if missing:
+        for aqs in store.find(models.ArchivedSchema,
+                              In(models.ArchivedSchema.hash, missing),
+                              models.ArchivedSchema.type == u'preview'):
+            ret[aqs.hash] = _cache_archived_questionnaire_schema(aqs, language)
+
+    for hash in missing:
+        if ret[hash] is None:
+            log.err("Unable to find questionnaire schema with hash %s" % hash)
+            ret[hash] = []
+
+    return ret
+
+
+def serialize_questionnaire_answers_recursively(answers, groups, group_id):
+    ret = {}
+
+    for answer_id, key, is_leaf, value in answers.get(group_id, []):
+        if is_leaf:
+            ret[key] = value
         else:
-            ret[answer.key] = [db_serialize_questionnaire_answers_recursively(group.fieldanswers)
-                               for group in answer.groups.order_by(models.FieldAnswerGroup.number)]
+            ret[key] = [serialize_questionnaire_answers_recursively(answers, groups, child_group_id)
+                        for _, child_group_id in sorted(groups.get(answer_id, []))]
+
     return ret
 
 
+def db_get_questionnaire_answers_tree(store, internaltip_id, keys):
+    """
+    Returns the answers of an internaltip to the fields with the given keys
+    loading all its answers and answer groups with two queries
+    """
+    answers = {}
+    groups = {}
+
+    for answer_id, group_id, key, is_leaf, value in store.find((models.FieldAnswer.id,
+                                                                models.FieldAnswer.fieldanswergroup_id,
+                                                                models.FieldAnswer.key,
+                                                                models.FieldAnswer.is_leaf,
+                                                                models.FieldAnswer.value),
+                                                               models.FieldAnswer.internaltip_id == internaltip_id):
+        if group_id is None and key not in keys:
+            continue
+
+        answers.setdefault(group_id, []).append((answer_id, key, is_leaf, value))
+
+    for group_id, answer_id, number in store.find((models.FieldAnswerGroup.id,
+                                                   models.FieldAnswerGroup.fieldanswer_id,
+                                                   models.FieldAnswerGroup.number),
+                                                  models.FieldAnswerGroup.fieldanswer_id == models.FieldAnswer.id,
+                                                  models.FieldAnswer.internaltip_id == internaltip_id):
+        groups.setdefault(answer_id, []).append((number, group_id))
+
+    return serialize_questionnaire_answers_recursively(answers, groups, None)
+
+
 def db_serialize_questionnaire_answers(store, usertip):
     internaltip = usertip.internaltip
 
     questionnaire = db_get_archived_questionnaire_schema(store, internaltip.questionnaire_hash, GLSettings.memory_copy.default_language)
 
-    answers_ids = []
+    answers_ids = set()
     filtered_answers_ids = []
     for s in questionnaire:
         for f in s['children']:
@@ -125,47 +201,50 @@ def db_serialize_questionnaire_answers(store, usertip):
                 if isinstance(usertip, models.WhistleblowerTip) or \
                    f['attrs']['visibility_subject_to_authorization']['value'] == False or \
                    (isinstance(usertip, models.ReceiverTip) and usertip.can_access_whistleblower_identity):
-                    answers_ids.append(f['id'])
+                    answers_ids.add(f['id'])
                 else:
                     filtered_answers_ids.append(f['id'])
             else:
-                answers_ids.append(f['id'])
-
-    answers = store.find(models.FieldAnswer, And(models.FieldAnswer.internaltip_id == internaltip.id,
-                                                 In(models.FieldAnswer.key, answers_ids)))
+                answers_ids.add(f['id'])
 
-    return db_serialize_questionnaire_answers_recursively(answers)
+    return db_get_questionnaire_answers_tree(store, internaltip.id, answers_ids)
 
 
 def db_save_questionnaire_answers(store, internaltip_id, entries):
-    ret = []
-
-    for key, value in entries.iteritems():
-        field_answer = models.FieldAnswer({
-            'internaltip_id': internaltip_id,
-            'key': key
-        })
-        store.add(field_answer)
-        if isinstance(value, list):
-            field_answer.is_leaf = False
-            field_answer.value = ""
-            n = 0
-            for entries in value:
-                group = models.FieldAnswerGroup({
-                  'fieldanswer_id': field_answer.id,
-                  'number': n
-                })
-                store.add(group)
-                group_elems = db_save_questionnaire_answers(store, internaltip_id, entries)
-                for group_elem in group_elems:
-                    group.fieldanswers.add(group_elem)
-                n += 1
-        else:
-            field_answer.is_leaf = True
-            field_answer.value = unicode(value)
-        ret.append(field_answer)
+    """
+    Saves the answers of an internaltip flattening the answers tree in
+    levels; the answers and the groups of each level are inserted with a
+    single statement each after the ones of the level containing them.
+    """
+    level = [(None, entries)]
+
+    while level:
+        answers = []
+        groups = []
+        next_level = []
+
+        for group_id, group_entries in level:
+            for key, value in group_entries.iteritems():
+                answer_id = uuid4()
+                key = unicode(key)
+
+                if isinstance(value, list):
+                    answers.append((answer_id, internaltip_id, group_id, key, False, u''))
+                    for n, child_entries in enumerate(value):
+                        child_group_id = uuid4()
+                        groups.append((child_group_id, answer_id, n))
+                        next_level.append((child_group_id, child_entries))
+                else:
+                    answers.append((answer_id, internaltip_id, group_id, key, True, unicode(value)))
 
-    return ret
+        db_executemany(store, 'INSERT INTO fieldanswer (id, internaltip_id, fieldanswergroup_id, '
+                              'key, is_leaf, value) VALUES (?, ?, ?, ?, ?, ?)', answers)
+
+        if groups:
+            db_executemany(store, 'INSERT INTO fieldanswergroup (id, fieldanswer_id, number) '
+                                  'VALUES (?, ?, ?)', groups)
+
+        level = next_level
 
 
 def extract_answers_preview(questionnaire, answers):
@@ -177,10 +256,35 @@ def extract_answers_preview(questionnaire, answers):
     return preview
 
 
+def db_get_questionnaire_snapshot(store, context_id):
+    """
+    Returns the questionnaire of the context as archived on submission
+    together with its hash
+    """
+    snapshot = QuestionnaireCache.get(context_id)
+
+    if snapshot is None:
+        version = QuestionnaireCache.version
+
+        questionnaire = db_get_context_steps(store, context_id, None)
+        snapshot = (questionnaire, unicode(sha256(json.dumps(questionnaire))))
+
+        QuestionnaireCache.set(context_id, version, snapshot)
+
+    return snapshot
+
+
 def db_archive_questionnaire_schema(store, questionnaire, questionnaire_hash):
-    if store.find(models.ArchivedSchema, 
-                  models.ArchivedSchema.hash == questionnaire_hash).count() <= 0:
+    # the hash is remembered only once found in the database as the
+    # transaction archiving it could still be rolled back
+    if QuestionnaireCache.is_archived(questionnaire_hash):
+        return
 
+    if store.find(models.ArchivedSchema,
+                  models.ArchivedSchema.hash == questionnaire_hash).count() > 0:
+        QuestionnaireCache.set_archived(questionnaire_hash)
+
+    else:
         aqs = models.ArchivedSchema()
         aqs.hash = questionnaire_hash
         aqs.type = u'questionnaire'
@@ -344,8 +448,7 @@ def db_create_submission(store, token_id, request, t2w, language):
         submission.identity_provided_date = datetime_now()
 
     try:
-        questionnaire = db_get_context_steps(store, context.id, None)
-        questionnaire_hash = unicode(sha256(json.dumps(questionnaire)))
+        questionnaire, questionnaire_hash = db_get_questionnaire_snapshot(store, context.id)
 
         submission.questionnaire_hash = questionnaire_hash
         submission.preview = extract_answers_preview(questionnaire, answers)
@@ -366,6 +469,7 @@ def db_create_submission(store, token_id, request, t2w, language):
             new_file.description = ""
             new_file.content_type = filedesc['content_type']
             new_file.size = filedesc['body_len']
+            new_file.sha256 = filedesc['sha256']
             new_file.internaltip_id = submission.id
             new_file.submission = filedesc['submission']
             new_file.file_path = filedesc['encrypted_path']
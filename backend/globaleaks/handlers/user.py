@@ -8,6 +8,7 @@ from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import models
 from globaleaks.orm import transact, transact_ro
+from globaleaks.handlers.assets import db_get_asset_url
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.rest import requests, errors
 from globaleaks.security import change_password, parse_pgp_key
@@ -70,7 +71,7 @@ def user_serialize_user(user, language):
         'pgp_key_public': user.pgp_key_public,
         'pgp_key_expiration': datetime_to_ISO8601(user.pgp_key_expiration),
         'pgp_key_remove': False,
-        'picture': user.picture.data if user.picture is not None else ''
+        'picture': db_get_asset_url(user.picture)
     }
 
     return get_localized_values(ret_dict, user, user.localized_keys, language)
@@ -148,6 +148,7 @@ class WBTipInstance(BaseHandler):
     Whistleblower can discuss about the submission, comments, collaborative voting, forward,
     promote, and perform other operations in this protected environment.
     """
+    query_budget = 30
 
     @BaseHandler.transport_security_check('whistleblower')
     @BaseHandler.authenticated('whistleblower')
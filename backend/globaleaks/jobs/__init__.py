@@ -5,5 +5,6 @@ __all__ = [
     'statistics_sched',
     'cleaning_sched',
     'session_management_sched',
-    'pgp_check_sched'
+    'pgp_check_sched',
+    'vacuum_sched'
 ]
@@ -7,7 +7,9 @@ import time
 from twisted.internet import task, defer, reactor
 
 from globaleaks.handlers.base import TimingStatsHandler
+from globaleaks.settings import GLSettings
 from globaleaks.utils.mailutils import send_exception_email,  extract_exception_traceback_and_send_email
+from globaleaks.utils.sqltracers import QueryStats, record_query_stats, run_with_query_stats
 from globaleaks.utils.utility import log
 
 
@@ -24,6 +26,7 @@ class GLJob(object):
     low_time = -1
     high_time = -1
     mean_time = -1
+    query_stats = None
 
     monitor_time = DEFAULT_JOB_MONITOR_TIME
 
@@ -83,6 +86,9 @@ class GLJob(object):
         self.start_time = time.time()
         self.job_runs += 1
 
+        if GLSettings.query_counter:
+            self.query_stats = QueryStats(self.name)
+
         self.monitor.start(self.monitor_time, False)
 
     def stats_collection_end(self):
@@ -103,14 +109,20 @@ class GLJob(object):
 
         log.time_debug("Job %s ended with an execution time of %.4f seconds" % (self.name, current_run_time))
 
-        TimingStatsHandler.log_measured_timing("JOB", self.name, self.start_time, current_run_time)
+        if self.query_stats is not None:
+            record_query_stats("JOB", self.query_stats)
+
+        TimingStatsHandler.log_measured_timing("JOB", self.name, self.start_time, current_run_time, self.query_stats)
+
+        self.query_stats = None
 
     @defer.inlineCallbacks
     def _operation(self):
         self.stats_collection_start()
 
         try:
-            yield self.operation()
+            # the queries of the transactions started by the job are accounted to it
+            yield run_with_query_stats(self.query_stats, self.operation)
         except Exception as e:
             log.err("Exception while performing scheduled operation %s: %s" % \
                     (type(self).__name__, e))
@@ -49,13 +49,41 @@ class CleaningSchedule(GLJob):
         db_clean_expired_wbtips(store)
 
     @transact
-    def clean_expired_itips(self, store):
+    def delete_expired_itips_chunk(self, store):
+        """
+        Deletes a chunk of the expired InternalTips along with all the
+        related DB entries.
+
+        :return: the number of tips and of rows deleted
+        """
+        itips_ids = list(store.find(models.InternalTip.id,
+                                    models.InternalTip.expiration_date < datetime_now())[:GLSettings.tips_deletion_chunk_size])
+
+        return len(itips_ids), db_delete_itips(store, itips_ids)
+
+    @inlineCallbacks
+    def clean_expired_itips(self):
         """
         This function, checks all the InternalTips and their expiration date.
         if expired InternalTips are found, it removes that along with
         all the related DB entries comment and tip related.
         """
-        db_delete_itips(store, store.find(models.InternalTip, models.InternalTip.expiration_date < datetime_now()))
+        start_time = time.time()
+        tips = rows = 0
+
+        while True:
+            chunk_tips, chunk_rows = yield self.delete_expired_itips_chunk()
+
+            tips += chunk_tips
+            rows += chunk_rows
+
+            if chunk_tips < GLSettings.tips_deletion_chunk_size:
+                break
+
+        if tips:
+            run_time = time.time() - start_time
+            log.info("Deleted %d expired tips (%d rows) in %.2f seconds (%.0f rows/sec)" %
+                     (tips, rows, run_time, rows / run_time if run_time else rows))
 
     @transact
     def check_for_expiring_submissions(self, store):
@@ -10,6 +10,7 @@
 # Call also the FileProcess working point, in order to verify which
 # kind of file has been submitted.
 
+import hashlib
 import os
 from twisted.internet.defer import inlineCallbacks
 
@@ -78,6 +79,7 @@ def receiverfile_planning(store):
                   'ifile_id': ifile.id,
                   'ifile_path': ifile.file_path,
                   'ifile_size': ifile.size,
+                  'ifile_sha256': ifile.sha256,
                   'rfiles': []
                 }
 
@@ -169,14 +171,22 @@ def process_files(receiverfiles_maps):
                 with open(plain_path, "wb") as plaintext_f, GLSecureFile(ifile_path) as encrypted_file:
                     chunk_size = 4096
                     written_size = 0
+                    written_hash = hashlib.sha256()
                     while True:
                         chunk = encrypted_file.read(chunk_size)
                         if len(chunk) == 0:
                             if written_size != receiverfiles_map['ifile_size']:
                                 log.err("Integrity error on rfile write for ifile %s; ifile_size(%d), rfile_size(%d)" %
                                         (ifile_id, receiverfiles_map['ifile_size'], written_size))
+
+                            # the digest is missing for the files uploaded before it was computed
+                            if receiverfiles_map['ifile_sha256'] and \
+                               written_hash.hexdigest() != receiverfiles_map['ifile_sha256']:
+                                log.err("Integrity error on rfile write for ifile %s; ifile_sha256(%s), rfile_sha256(%s)" %
+                                        (ifile_id, receiverfiles_map['ifile_sha256'], written_hash.hexdigest()))
                             break
                         written_size += len(chunk)
+                        written_hash.update(chunk)
                         plaintext_f.write(chunk)
 
                 receiverfiles_map['ifile_path'] = plain_path
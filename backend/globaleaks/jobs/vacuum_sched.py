@@ -0,0 +1,115 @@
+# -*- coding: UTF-8
+#
+#   vacuum_sched
+#   ************
+#
+# Implementation of the database maintenance reclaiming the free pages
+# left by the deletions in small bounded steps (incremental vacuum)
+import time
+
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks.anomaly import Alarm
+from globaleaks.jobs.base import GLJob
+from globaleaks.orm import transact, transact_ro
+from globaleaks.settings import GLSettings
+from globaleaks.utils.utility import log, datetime_now, datetime_to_ISO8601
+
+
+__all__ = ['VacuumSchedule']
+
+
+vacuum_report = {
+    'auto_vacuum': 0,
+    'page_size': 0,
+    'page_count': 0,
+    'freelist_count': 0,
+    'fragmentation': 0.0,
+    'last_run': None,
+    'last_reclaimed_pages': 0,
+    'last_time': 0.0,
+    'total_reclaimed_pages': 0,
+    'total_time': 0.0
+}
+
+
+def get_vacuum_report():
+    return dict(vacuum_report)
+
+
+def db_get_pages_stats(store):
+    auto_vacuum = store.execute("PRAGMA auto_vacuum").get_one()[0]
+    page_size = store.execute("PRAGMA page_size").get_one()[0]
+    page_count = store.execute("PRAGMA page_count").get_one()[0]
+    freelist_count = store.execute("PRAGMA freelist_count").get_one()[0]
+
+    return {
+        'auto_vacuum': auto_vacuum,
+        'page_size': page_size,
+        'page_count': page_count,
+        'freelist_count': freelist_count,
+        'fragmentation': float(freelist_count) / page_count if page_count else 0.0
+    }
+
+
+@transact_ro
+def get_pages_stats(store):
+    return db_get_pages_stats(store)
+
+
+@transact
+def incremental_vacuum(store, pages):
+    """
+    Reclaims at most the specified number of free pages.
+
+    :return: the number of pages reclaimed
+    """
+    freelist_count = store.execute("PRAGMA freelist_count").get_one()[0]
+
+    # the pragma frees a page at each step and so its result should be consumed
+    store.execute("PRAGMA incremental_vacuum(%d)" % pages).get_all()
+
+    return freelist_count - store.execute("PRAGMA freelist_count").get_one()[0]
+
+
+class VacuumSchedule(GLJob):
+    name = "Vacuum"
+
+    def is_quiet_time(self):
+        return datetime_now().hour in GLSettings.vacuum_quiet_hours and \
+               Alarm.stress_levels['activity'] == 0
+
+    @inlineCallbacks
+    def operation(self):
+        vacuum_report.update((yield get_pages_stats()))
+
+        # databases created without auto_vacuum get it enabled only by
+        # the full rewrite performed by a migration
+        if vacuum_report['auto_vacuum'] != 2:
+            log.debug("Incremental vacuum is not enabled on the database")
+            return
+
+        if not vacuum_report['freelist_count'] or not self.is_quiet_time():
+            return
+
+        start_time = time.time()
+        reclaimed_pages = 0
+
+        while time.time() - start_time < GLSettings.vacuum_time_limit:
+            pages = yield incremental_vacuum(GLSettings.vacuum_step_pages)
+            if not pages:
+                break
+
+            reclaimed_pages += pages
+
+        elapsed_time = time.time() - start_time
+
+        vacuum_report.update((yield get_pages_stats()))
+        vacuum_report['last_run'] = datetime_to_ISO8601(datetime_now())
+        vacuum_report['last_reclaimed_pages'] = reclaimed_pages
+        vacuum_report['last_time'] = elapsed_time
+        vacuum_report['total_reclaimed_pages'] += reclaimed_pages
+        vacuum_report['total_time'] += elapsed_time
+
+        log.debug("Vacuum reclaimed %d pages (%d bytes) in %.2f seconds" %
+                  (reclaimed_pages, reclaimed_pages * vacuum_report['page_size'], elapsed_time))
@@ -349,6 +349,9 @@ class InternalFile(ModelWithID):
     content_type = Unicode()
     size = Int()
 
+    # the hex SHA-256 digest of the plaintext of the file
+    sha256 = Unicode(default=u'')
+
     new = Int(default=True)
     
     submission = Int(default = False)
@@ -2,13 +2,19 @@
 # orm: contains main hooks to storm ORM
 # ******
 import sys
+import threading
+import time
+
 from twisted.internet import reactor
+from twisted.internet.defer import Deferred, succeed
 from twisted.internet.threads import deferToThreadPool
 
 import storm.databases.sqlite
 import transaction
 from globaleaks.rest.errors import DatabaseIntegrityError
 from globaleaks.settings import GLSettings
+from globaleaks.utils.sqltracers import get_current_query_stats, resume_with_query_stats, set_current_transaction
+from globaleaks.utils.utility import log
 from storm import exceptions, tracer
 from storm.databases.sqlite import sqlite
 from storm.zope.zstorm import ZStorm
@@ -26,16 +32,22 @@ class SQLite(storm.databases.sqlite.Database):
         self._journal_mode = uri.options.get("journal_mode")
         self._foreign_keys = uri.options.get("foreign_keys")
 
-        self.raw_connect().execute("VACUUM")
-
     def raw_connect(self):
+        # connections are kept open by the worker threads and are closed by
+        # the StoreManager on shutdown, so they are not bound to a thread
         raw_connection = sqlite.connect(self._filename, timeout=self._timeout,
-                                        isolation_level=None)
+                                        isolation_level=None,
+                                        check_same_thread=False)
 
         if self._synchronous is not None:
             raw_connection.execute("PRAGMA synchronous = %s" %
                                    (self._synchronous,))
 
+        # auto_vacuum could be enabled only before the database file gets
+        # initialized and so it should precede the setup of the journal mode;
+        # free pages are then reclaimed by the VacuumSchedule job
+        raw_connection.execute("PRAGMA auto_vacuum = INCREMENTAL") # = 2
+
         if self._journal_mode is not None:
             raw_connection.execute("PRAGMA journal_mode = %s" %
                                    (self._journal_mode,))
@@ -53,15 +65,172 @@ storm.databases.sqlite.create_from_uri = SQLite
 # XXX. END MONKEYPATCH
 
 
+class ThreadPoolStats(object):
+    """
+    Keeps track of the usage of one of the thread pools used by the ORM
+    in order to make visible the queueing of the transactions.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.transactions = 0
+            self.max_queue_depth = 0
+            self.wait_time = 0.0
+            self.max_wait_time = 0.0
+
+    def record_enqueue(self, queue_depth):
+        with self.lock:
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+
+    def record_wait(self, wait_time):
+        with self.lock:
+            self.transactions += 1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def serialize(self, threadpool):
+        with self.lock:
+            return {
+                'threads': threadpool.max,
+                'working': len(threadpool.working),
+                'queue_depth': threadpool.q.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'transactions': self.transactions,
+                'mean_wait_time': self.wait_time / self.transactions if self.transactions else 0.0,
+                'max_wait_time': self.max_wait_time
+            }
+
+
+class StoreManager(object):
+    """
+    Keeps a warm Storm store for each of the threads executing transactions
+    in order to avoid to open a new connection for each of them.
+
+    The store of a thread gets recycled after a failure or when the
+    database it refers to is changed.
+    """
+    def __init__(self):
+        self.zstorm = ZStorm()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.stores = set()
+        self.opened = 0
+        self.reused = 0
+        self.recycled = 0
+
+    def get_store(self):
+        store = getattr(self.local, 'store', None)
+
+        if store is not None:
+            if self.local.uri == GLSettings.db_uri and not store._connection._closed:
+                with self.lock:
+                    self.reused += 1
+
+                return store
+
+            self.release_store()
+
+        self.zstorm.set_default_uri(GLSettings.store_name, GLSettings.db_uri)
+
+        store = self.zstorm.get(GLSettings.store_name)
+
+        self.local.store = store
+        self.local.uri = GLSettings.db_uri
+
+        with self.lock:
+            self.stores.add(store)
+            self.opened += 1
+
+        return store
+
+    def release_store(self):
+        store = getattr(self.local, 'store', None)
+        if store is None:
+            return
+
+        self.local.store = None
+
+        with self.lock:
+            self.stores.discard(store)
+
+        self.zstorm.remove(store)
+        store.close()
+
+    def recycle_store(self):
+        self.release_store()
+
+        with self.lock:
+            self.recycled += 1
+
+    def close_stores(self):
+        """
+        Close the stores of all the threads; each thread will open a new
+        one on its next transaction.
+
+        This should be called only when no transaction is running, that is
+        once the thread pools are stopped or transact.wait_transactions()
+        has fired.
+        """
+        with self.lock:
+            for store in self.stores:
+                try:
+                    store.rollback()
+                    store.close()
+                except Exception as excep:
+                    log.err("Unable to close the store: %s" % excep)
+
+            self.stores.clear()
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'open': len(self.stores),
+                'opened': self.opened,
+                'reused': self.reused,
+                'recycled': self.recycled
+            }
+
+
+store_manager = StoreManager()
+
+
+def shutdown_orm():
+    """
+    Stops the thread pools, waiting for the running transactions, and then
+    closes the stores of their threads
+    """
+    GLSettings.orm_tp.stop()
+    GLSettings.orm_ro_tp.stop()
+    store_manager.close_stores()
+
+reactor.addSystemEventTrigger('after', 'shutdown', shutdown_orm)
+
+
 class transact(object):
     """
     Class decorator for managing transactions.
     Because Storm sucks.
+
+    Read/write transactions are serialized on a single writer thread while
+    readonly transactions (transact_ro) are spread on a pool of readers.
+
+    A readonly transaction is started only after the completion of all the
+    writes requested before it, so that it always observes their effects.
     """
     readonly = False
+    stats = ThreadPoolStats()
+
+    writes_requested = 0
+    writes_completed = 0
+    waiting_readers = []
+
+    running = 0
+    waiting_idle = []
 
     def __init__(self, method):
-        self.store = None
         self.method = method
         self.instance = None
         self.debug = GLSettings.orm_debug
@@ -74,59 +243,179 @@ class transact(object):
         return self
 
     def __call__(self, *args, **kwargs):
-        return self.run(self._wrap, self.method, *args, **kwargs)
+        # the instance is bound here as the same decorator object is shared
+        # by all the calls that may be queued at the same time; the same
+        # applies to the request or job the queries will be accounted to
+        query_stats = get_current_query_stats() if GLSettings.query_counter else None
+
+        transact.running += 1
+
+        d = self.run(self._wrap, time.time(), query_stats, self.method, self.instance, *args, **kwargs)
+        d.addBoth(transact.transaction_completed)
+
+        if query_stats is not None:
+            d = resume_with_query_stats(d, query_stats)
+
+        return d
 
     @staticmethod
-    def run(function, *args, **kwargs):
+    def transaction_completed(result):
+        transact.running -= 1
+
+        if not transact.running:
+            waiting_idle, transact.waiting_idle = transact.waiting_idle, []
+            for d in waiting_idle:
+                d.callback(None)
+
+        return result
+
+    @staticmethod
+    def wait_transactions():
         """
-        Defer provided function to thread
+        Returns a Deferred fired when no transaction is running
         """
-        return deferToThreadPool(reactor, GLSettings.orm_tp,
-                                 function, *args, **kwargs)
+        if not transact.running:
+            return succeed(None)
 
-    @staticmethod
-    def get_store():
+        d = Deferred()
+        transact.waiting_idle.append(d)
+        return d
+
+    @classmethod
+    def get_threadpool(cls):
+        return GLSettings.orm_tp
+
+    @classmethod
+    def defer(cls, function, *args, **kwargs):
         """
-        Returns a reference to Storm Store
+        Defer provided function to the thread pool
         """
-        zstorm = ZStorm()
-        zstorm.set_default_uri(GLSettings.store_name, GLSettings.db_uri)
+        threadpool = cls.get_threadpool()
+        d = deferToThreadPool(reactor, threadpool, function, *args, **kwargs)
+        cls.stats.record_enqueue(threadpool.q.qsize())
+        return d
+
+    @classmethod
+    def run(cls, function, *args, **kwargs):
+        transact.writes_requested += 1
+        return cls.defer(function, *args, **kwargs).addBoth(transact.write_completed)
+
+    @staticmethod
+    def write_completed(result):
+        transact.writes_completed += 1
+
+        while transact.waiting_readers and \
+                transact.waiting_readers[0][0] <= transact.writes_completed:
+            transact.waiting_readers.pop(0)[1].callback(None)
 
-        return zstorm.get(GLSettings.store_name)
+        return result
+
+    @classmethod
+    def get_stats(cls):
+        return cls.stats.serialize(cls.get_threadpool())
 
-    def _wrap(self, function, *args, **kwargs):
+    def _wrap(self, enqueue_time, query_stats, function, instance, *args, **kwargs):
         """
         Wrap provided function calling it inside a thread and
         passing the store to it.
         """
-        self.store = self.get_store()
+        self.stats.record_wait(time.time() - enqueue_time)
+
+        store = store_manager.get_store()
+
+        set_current_transaction('%s.%s' % (function.__module__, function.__name__), query_stats)
 
         try:
-            if self.instance:
-                result = function(self.instance, self.store, *args, **kwargs)
+            if instance:
+                result = function(instance, store, *args, **kwargs)
             else:
-                result = function(self.store, *args, **kwargs)
+                result = function(store, *args, **kwargs)
+
+            if query_stats is not None:
+                query_stats.check_budget()
 
             if not self.readonly:
-                self.store.commit()
+                store.commit()
             else:
-                self.store.flush()
-                self.store.invalidate()
+                store.flush()
+                store.rollback()
+
+            # the store is kept for the next transaction of the thread
+            # but the objects loaded by this one are released
+            store.reset()
 
         except exceptions.DisconnectionError as e:
             transaction.abort()
+            store_manager.recycle_store()
             result = None
         except exceptions.IntegrityError as e:
             transaction.abort()
+            store_manager.recycle_store()
             raise DatabaseIntegrityError(str(e))
         except Exception:
             transaction.abort()
+            store_manager.recycle_store()
             raise
         finally:
-            self.store.close()
+            set_current_transaction(None, None)
 
         return result
 
 
 class transact_ro(transact):
     readonly = True
+    stats = ThreadPoolStats()
+
+    @classmethod
+    def run(cls, function, *args, **kwargs):
+        if transact.writes_completed == transact.writes_requested:
+            return cls.defer(function, *args, **kwargs)
+
+        d = Deferred()
+        transact.waiting_readers.append((transact.writes_requested, d))
+        return d.addCallback(lambda _: cls.defer(function, *args, **kwargs))
+
+    @classmethod
+    def get_threadpool(cls):
+        return GLSettings.orm_ro_tp
+
+
+def db_executemany(store, statement, params):
+    """
+    Executes a statement for each of the given sequences of parameters
+    with a single executemany call on the connection of the store; this
+    is intended for bulk inserts avoiding the construction of the objects.
+
+    The pending changes of the store are flushed before and the statement
+    is run inside the transaction of the store.
+    """
+    store.flush()
+
+    connection = store._connection
+    connection._ensure_connected()
+
+    # storm begins the transactions manually on the first statement
+    if not connection._in_transaction:
+        connection._in_transaction = True
+        connection._raw_connection.execute("BEGIN")
+
+    raw_cursor = connection.build_raw_cursor()
+
+    tracer.trace("connection_raw_execute", connection, raw_cursor, statement, ())
+    try:
+        raw_cursor.executemany(statement, params)
+    except Exception as error:
+        tracer.trace("connection_raw_execute_error", connection, raw_cursor, statement, (), error)
+        raise
+    else:
+        tracer.trace("connection_raw_execute_success", connection, raw_cursor, statement, ())
+
+    return raw_cursor.rowcount
+
+
+def get_orm_stats():
+    return {
+        'writer': transact.get_stats(),
+        'readers': transact_ro.get_stats(),
+        'stores': store_manager.get_stats()
+    }
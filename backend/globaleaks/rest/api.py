@@ -16,7 +16,7 @@ from globaleaks.handlers import exception, \
                                 files, authentication, token, \
                                 export, l10n, wizard, \
                                 base, user, shorturl, \
-                                robots
+                                robots, assets
 
 from globaleaks.handlers.admin import node as admin_node
 from globaleaks.handlers.admin import user as admin_user
@@ -33,6 +33,7 @@ from globaleaks.handlers.admin import overview as admin_overview
 from globaleaks.handlers.admin import shorturl as admin_shorturl
 from globaleaks.handlers.admin import statistics as admin_statistics
 from globaleaks.handlers.admin import notification as admin_notification
+from globaleaks.handlers.admin import performance as admin_performance
 
 from globaleaks.utils.utility import randbits
 
@@ -123,12 +124,15 @@ spec = [
     (r'/admin/staticfiles/([a-zA-Z0-9_\-\/\.]*)', admin_staticfiles.StaticFileInstance),
     (r'/admin/overview/tips', admin_overview.Tips),
     (r'/admin/overview/files', admin_overview.Files),
+    (r'/admin/performance', admin_performance.PerformanceInstance),
+    (r'/admin/performance/slowqueries', admin_performance.SlowQueriesCollection),
     (r'/wizard', wizard.Wizard),
 
     ## Special Files Handlers##
     (r'/robots.txt', robots.RobotstxtHandler),
     (r'/sitemap.xml', robots.SitemapHandler),
     (r'/description.json', robots.AhmiaDescriptionHandler),
+    (r'/assets/([a-f0-9]{64})', assets.AssetInstance),
     (r'/s/(.*)', base.BaseStaticFileHandler, {'path': GLSettings.static_path}),
     (r'/static/(.*)', base.BaseStaticFileHandler), # still here for backward compatibility
     (r'/l10n/(' + '|'.join(LANGUAGES_SUPPORTED_CODES) + ')', l10n.L10NHandler),
@@ -1,36 +1,286 @@
-from twisted.internet.defer import inlineCallbacks, returnValue
+import gzip
+import hashlib
+import threading
+
+from cyclone.escape import json_encode
+from io import BytesIO
+from twisted.internet.defer import Deferred, DeferredList, maybeDeferred, succeed
+from twisted.python.failure import Failure
+
+from globaleaks.settings import GLSettings
+from globaleaks.utils.lrucache import LRUCache
+from globaleaks.utils.utility import log
+
+
+class CachedResponse(object):
+    """
+    The final representation of a cached resource: the UTF-8 JSON body as
+    it would be written by cyclone, its gzip compressed variant and the
+    strong ETags identifying them.
+    """
+    def __init__(self, value):
+        self.body = json_encode(value)
+        if isinstance(self.body, unicode):
+            self.body = self.body.encode('utf-8')
+
+        gzip_body = BytesIO()
+        with gzip.GzipFile(fileobj=gzip_body, mode='wb', compresslevel=9, mtime=0) as f:
+            f.write(self.body)
+
+        self.gzip_body = gzip_body.getvalue()
+
+        digest = hashlib.sha256(self.body).hexdigest()
+
+        # the representations differ by content encoding and so do their etags
+        self.etag = '"%s"' % digest
+        self.gzip_etag = '"%s-gzip"' % digest
+
+    def match(self, if_none_match):
+        """
+        Returns True if the If-None-Match header refers to this resource
+        """
+        etags = [etag.strip() for etag in if_none_match.split(',')]
+        etags = [etag[2:] if etag.startswith('W/') else etag for etag in etags]
+
+        return '*' in etags or self.etag in etags or self.gzip_etag in etags
 
 
 class GLApiCache(object):
-    memory_cache_dict = {}
+    """
+    Cache of the responses to the API requests that are the same for all
+    the users, kept for each resource and language as a CachedResponse.
+
+    Each resource declares the tags of the models or of the configuration
+    groups it depends on, and the writers invalidate only the resources
+    depending on the tags they modify; a resource is tagged also with its
+    own name. The cache is bounded by the overall size of the responses.
+
+    An invalidated response is kept as stale and served while it is
+    recomputed in background (stale-while-revalidate), so that the clients
+    do not wait for its computation.
+
+    Concurrent requests of a resource not cached wait for the same
+    computation, and a computation started before an invalidation of the
+    resource is returned but not cached.
+    """
+    cache = LRUCache(GLSettings.api_cache_size)
+    tags = {}
+    versions = {}
+    recipes = {}
+    stale = set()
+    pending = {}
+    stats = {}
+
+    @classmethod
+    def get_resource_stats(cls, resource_name):
+        if resource_name not in cls.stats:
+            cls.stats[resource_name] = {
+                'hits': 0,
+                'stale_hits': 0,
+                'misses': 0,
+                'evictions': 0,
+                'invalidations': 0,
+                'refreshes': 0
+            }
+
+        return cls.stats[resource_name]
+
+    @classmethod
+    def get(cls, resource_name, language, tags, function, *args, **kwargs):
+        key = (resource_name, language)
+
+        cls.tags[resource_name] = set(tags) | set([resource_name])
+        cls.recipes[key] = (function, args, kwargs)
+
+        response = cls.cache.get(key)
+        if response is not None:
+            if key in cls.stale:
+                cls.get_resource_stats(resource_name)['stale_hits'] += 1
+                if key not in cls.pending:
+                    cls.refresh(key)
+            else:
+                cls.get_resource_stats(resource_name)['hits'] += 1
+
+            return succeed(response)
+
+        cls.get_resource_stats(resource_name)['misses'] += 1
+
+        if key in cls.pending:
+            d = Deferred()
+            cls.pending[key].append(d)
+            return d
+
+        return cls.compute(key, function, *args, **kwargs)
 
     @classmethod
-    @inlineCallbacks
-    def get(cls, resource_name, language, function, *args, **kwargs):
-        if resource_name in cls.memory_cache_dict \
-                and language in cls.memory_cache_dict[resource_name]:
-            returnValue(cls.memory_cache_dict[resource_name][language])
+    def compute(cls, key, function, *args, **kwargs):
+        resource_name, language = key
+
+        waiters = cls.pending[key] = []
+        version = cls.versions.get(resource_name, 0)
+
+        def computed(result):
+            if cls.pending.get(key) is waiters:
+                del cls.pending[key]
+
+            if not isinstance(result, Failure):
+                if version == cls.versions.get(resource_name, 0):
+                    result = cls.set(resource_name, language, result)
+                else:
+                    result = CachedResponse(result)
+
+            for d in waiters:
+                if isinstance(result, Failure):
+                    d.errback(result)
+                else:
+                    d.callback(result)
+
+            return result
+
+        return maybeDeferred(function, *args, **kwargs).addBoth(computed)
+
+    @classmethod
+    def refresh(cls, key):
+        """
+        Recomputes in background the response of a resource requested before
+        """
+        function, args, kwargs = cls.recipes[key]
+
+        cls.get_resource_stats(key[0])['refreshes'] += 1
+
+        def failed(failure):
+            log.err("Unable to refresh the cached resource %s (%s): %s" %
+                    (key[0], key[1], failure.getErrorMessage()))
 
-        value = yield function(*args, **kwargs)
-        if resource_name not in cls.memory_cache_dict:
-            cls.memory_cache_dict[resource_name] = {}
-        cls.memory_cache_dict[resource_name][language] = value
-        returnValue(value)
+        return cls.compute(key, function, *args, **kwargs).addErrback(failed)
 
     @classmethod
     def set(cls, resource_name, language, value):
-        if resource_name not in GLApiCache.memory_cache_dict:
-            cls.memory_cache_dict[resource_name] = {}
+        key = (resource_name, language)
 
-        cls.memory_cache_dict[resource_name][language] = value
+        response = CachedResponse(value)
+
+        size = len(response.body) + len(response.gzip_body)
+
+        cls.stale.discard(key)
+
+        for evicted in cls.cache.set(key, response, size):
+            cls.stale.discard(evicted)
+            cls.recipes.pop(evicted, None)
+            cls.get_resource_stats(evicted[0])['evictions'] += 1
+
+        return response
 
     @classmethod
-    def invalidate(cls, resource_name=None):
+    def invalidate(cls, *tags):
         """
-        When a function has an update, all the language need to be
-        invalidated, because the change is still effective
+        Invalidates all the languages of the resources depending on any of
+        the given tags, recomputing them in background.
+
+        If no tag is given all the resources are dropped.
         """
-        if resource_name is None:
-            cls.memory_cache_dict = {}
-        else:
-            cls.memory_cache_dict.pop(resource_name, None)
+        if not tags:
+            cls.cache.invalidate()
+            cls.recipes.clear()
+            cls.stale.clear()
+            cls.pending.clear()
+            for resource_name in cls.tags:
+                cls.versions[resource_name] = cls.versions.get(resource_name, 0) + 1
+
+            return
+
+        tags = set(tags)
+
+        resources = set(tags)
+        for resource_name, resource_tags in cls.tags.iteritems():
+            if resource_tags & tags:
+                resources.add(resource_name)
+
+        for resource_name in resources:
+            cls.versions[resource_name] = cls.versions.get(resource_name, 0) + 1
+
+        keys = set(key for key in cls.cache.keys() + cls.pending.keys() if key[0] in resources)
+
+        for key in keys:
+            cls.pending.pop(key, None)
+            cls.get_resource_stats(key[0])['invalidations'] += 1
+
+            if key in cls.recipes:
+                cls.stale.add(key)
+                cls.refresh(key)
+            else:
+                cls.cache.delete(key)
+
+    @classmethod
+    def wait_refreshes(cls):
+        """
+        Returns a Deferred fired when all the running computations complete
+        """
+        dl = []
+        for waiters in cls.pending.values():
+            d = Deferred()
+            waiters.append(d)
+            dl.append(d)
+
+        return DeferredList(dl, consumeErrors=True)
+
+    @classmethod
+    def get_stats(cls):
+        stats = cls.cache.get_stats()
+
+        entries = {}
+        for key in cls.cache.keys():
+            entries[key[0]] = entries.get(key[0], 0) + 1
+
+        stats['stale'] = len(cls.stale)
+        stats['resources'] = {}
+        for resource_name, resource_stats in cls.stats.iteritems():
+            stats['resources'][resource_name] = dict(resource_stats,
+                                                     entries=entries.get(resource_name, 0),
+                                                     tags=sorted(cls.tags.get(resource_name, [])))
+
+        return stats
+
+
+class QuestionnaireCache(object):
+    """
+    Keeps for each context the snapshot of its questionnaire as archived on
+    submission together with its hash, and the set of the hashes known to
+    be already archived.
+
+    The snapshots are invalidated by the admin handlers modifying contexts,
+    questionnaires, steps and fields; the version prevents a snapshot
+    computed before an invalidation to be stored after it.
+    """
+    lock = threading.Lock()
+    version = 0
+    snapshots = {}
+    archived_hashes = set()
+
+    @classmethod
+    def get(cls, context_id):
+        return cls.snapshots.get(context_id)
+
+    @classmethod
+    def set(cls, context_id, version, snapshot):
+        with cls.lock:
+            if version == cls.version:
+                cls.snapshots[context_id] = snapshot
+
+    @classmethod
+    def invalidate(cls):
+        with cls.lock:
+            cls.version += 1
+            cls.snapshots = {}
+
+    @classmethod
+    def is_archived(cls, questionnaire_hash):
+        return questionnaire_hash in cls.archived_hashes
+
+    @classmethod
+    def set_archived(cls, questionnaire_hash):
+        cls.archived_hashes.add(questionnaire_hash)
+
+    @classmethod
+    def unset_archived(cls, questionnaire_hashes):
+        cls.archived_hashes.difference_update(questionnaire_hashes)
@@ -354,7 +354,33 @@ class SubmissionDisabled(GLException):
     status_code = 503  # Service not available
 
 
-# UNUSED ERROR CODE 53, 54, 55, 56, 57 HERE!
+class UploadQuotaExceeded(GLException):
+    """
+    Raised when a new upload would exceed the quotas of the uploads in progress
+    """
+    error_code = 54
+    status_code = 413  # Request Entity Too Large
+
+    def __init__(self, wrong_source):
+        self.reason = "Upload quota exceeded [%s]" % wrong_source
+        self.arguments = [wrong_source]
+
+
+class UploadBudgetExceeded(GLException):
+    """
+    Raised when a new upload could not be admitted within the budget of
+    the uploads in progress
+    """
+    reason = "Too many uploads in progress, retry later"
+    error_code = 55
+    status_code = 503  # Service not available
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        self.arguments = [retry_after]
+
+
+# UNUSED ERROR CODE 56, 57 HERE!
 
 
 class FieldIdNotFound(GLException):
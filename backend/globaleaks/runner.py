@@ -8,10 +8,14 @@ from twisted.scripts._twistd_unix import UnixApplicationRunner
 
 from globaleaks.db import init_db, clean_untracked_files, \
     refresh_memory_variables
+from globaleaks.handlers.base import precompress_client_files
+from globaleaks.handlers.public import warm_public_resources
 from globaleaks.jobs import session_management_sched, statistics_sched, \
     notification_sched, delivery_sched, cleaning_sched, \
-    pgp_check_sched
+    pgp_check_sched, vacuum_sched
 from globaleaks.settings import GLSettings
+from globaleaks.utils.sqltracers import install_index_advisor, install_query_counter, \
+    install_slow_query_log
 from globaleaks.utils.utility import log, datetime_now
 
 test_reactor = None
@@ -55,6 +59,11 @@ class GlobaLeaksRunner(UnixApplicationRunner):
         delay = 3600 - (current_time.minute * 60) - current_time.second
         stats = statistics_sched.StatisticsSchedule().schedule(3600, delay)
 
+        # Scheduling the Vacuum schedule to be executed every hour at the half hour;
+        # the job reclaims the free pages only during the quiet hours
+        delay = (3600 + 1800 - (current_time.minute * 60) - current_time.second) % 3600
+        vacuum_sched.VacuumSchedule().schedule(3600, delay)
+
     @defer.inlineCallbacks
     def start_globaleaks(self):
         try:
@@ -62,6 +71,14 @@ class GlobaLeaksRunner(UnixApplicationRunner):
             GLSettings.drop_privileges()
             GLSettings.check_directories()
 
+            install_slow_query_log()
+
+            if GLSettings.index_advisor:
+                install_index_advisor()
+
+            if GLSettings.query_counter:
+                install_query_counter()
+
             if GLSettings.initialize_db:
                 yield init_db()
 
@@ -71,6 +88,11 @@ class GlobaLeaksRunner(UnixApplicationRunner):
 
             self.start_asynchronous_jobs()
 
+            # the cached public resources are computed in background
+            warm_public_resources()
+
+            precompress_client_files()
+
         except Exception as excep:
             log.err("ERROR: Cannot start GlobaLeaks; please manually check the error.")
             log.err("EXCEPTION: %s" % excep)
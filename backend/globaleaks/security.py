@@ -144,6 +144,9 @@ class GLSecureTemporaryFile(_TemporaryFileWrapper):
         self.create_key()
         self.encryptor_finalized = False
 
+        # the digest of the plaintext is computed while it is encrypted
+        self.hash = hashes.Hash(hashes.SHA256(), backend=crypto_backend)
+
         # XXX remind enhance file name with incremental number
         self.filepath = os.path.join(filedir, "%s.aes" % self.key_id)
 
@@ -195,6 +198,26 @@ class GLSecureTemporaryFile(_TemporaryFileWrapper):
         log.debug("Avoid delete on: %s " % self.filepath)
         self.delete = False
 
+    def get_encryptor(self, offset=0):
+        """
+        Returns an encryptor of the content of the file starting at the
+        given offset; in CTR mode the keystream of any offset is obtained
+        by advancing the counter of the nonce.
+        """
+        counter = (int(binascii.hexlify(self.key_counter_nonce), 16) + offset // 16) % (1 << 128)
+        counter_block = binascii.unhexlify('%032x' % counter)
+
+        encryptor = Cipher(algorithms.AES(self.key), modes.CTR(counter_block), backend=crypto_backend).encryptor()
+        encryptor.update('\0' * (offset % 16))
+
+        return encryptor
+
+    def get_sha256(self):
+        """
+        Returns the hex SHA-256 digest of the plaintext written to the file
+        """
+        return unicode(binascii.b2a_hex(self.hash.copy().finalize()))
+
     def write(self, data):
         """
         The last action is kept track because the internal status
@@ -208,6 +231,7 @@ class GLSecureTemporaryFile(_TemporaryFileWrapper):
             if isinstance(data, unicode):
                 data = data.encode('utf-8')
 
+            self.hash.update(data)
             self.file.write(self.encryptor.update(data))
         except Exception as wer:
             log.err("Unable to write() in GLSecureTemporaryFile: %s" % wer.message)
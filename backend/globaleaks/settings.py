@@ -12,7 +12,6 @@ import pwd
 import re
 from distutils import dir_util
 from optparse import OptionParser
-from twisted.internet import reactor
 from twisted.python.threadpool import ThreadPool
 
 from cyclone.util import ObjectDict as OD
@@ -65,9 +64,18 @@ class GLSettingsClass(object):
         # daemon
         self.nodaemon = False
 
-        # thread pool size of 1
+        # thread pool size of 1 used by read/write transactions
         self.orm_tp = ThreadPool(0, 1)
 
+        # thread pool used by readonly transactions
+        self.orm_readers = 4
+        self.orm_ro_tp = ThreadPool(0, self.orm_readers)
+
+        # queries taking more than slow_query_threshold seconds are kept
+        # in a ring of slow_query_log_size entries
+        self.slow_query_threshold = 0.5
+        self.slow_query_log_size = 100
+
         self.bind_addresses = '127.0.0.1'
 
         # bind port
@@ -81,6 +89,11 @@ class GLSettingsClass(object):
 
         # debug defaults
         self.orm_debug = False
+        self.index_advisor = False
+        self.index_advisor_threshold = 1000
+        self.query_counter = False
+        self.query_budget_strict = False
+        self.n_plus_one_threshold = 10
         self.log_requests_responses = -1
         self.requests_counter = 0
         self.loglevel = "CRITICAL"
@@ -148,6 +161,53 @@ class GLSettingsClass(object):
         self.notification_limit = 30
         self.jobs_operation_limit = 20
 
+        # the free pages of the database are reclaimed in small steps
+        # only during the hours in which the node is expected to be quiet
+        self.vacuum_quiet_hours = [1, 2, 3, 4, 5]
+        self.vacuum_step_pages = 256
+        self.vacuum_time_limit = 60 # seconds
+
+        # expired tips are deleted in chunks each committed separately
+        # so that the writer is not held for the whole deletion
+        self.tips_deletion_chunk_size = 100
+
+        # default and maximum number of tips returned by a page of the
+        # receiver tip list
+        self.receiver_tip_list_limit = 1000
+
+        # localized archived questionnaire schemas are cached up to this
+        # overall size of their json serialization
+        self.archived_schema_cache_size = 16 * 1024 * 1024 # 16MB
+
+        # the responses of the GLApiCache are cached up to this overall size
+        self.api_cache_size = 32 * 1024 * 1024 # 32MB
+
+        # the static files up to the threshold size are kept in memory up to
+        # the overall size of the cache while the bigger ones are streamed
+        self.static_file_cache_size = 16 * 1024 * 1024 # 16MB
+        self.static_file_cache_threshold = 256 * 1024 # 256KB
+
+        # the names of the fingerprinted client files contain the hash of
+        # their content (e.g. scripts.1a2b3c4d.js) and could be kept forever
+        self.static_fingerprint_regexp = re.compile(r'\.[a-f0-9]{8,}\.[a-z0-9]+$')
+
+        # the chunked uploads are discarded after this number of seconds
+        # without new chunks; the quotas bound the number of the uploads in
+        # progress and the overall size declared for their files
+        self.upload_flow_ttl = 1800
+        self.upload_flows_limit = 1000
+        self.upload_flows_limit_per_owner = 20
+        self.upload_disk_quota = 4 * 1024 * 1024 * 1024 # 4GB
+        self.upload_disk_quota_per_owner = 512 * 1024 * 1024 # 512MB
+
+        # the new uploads beyond the budget of the bytes reserved by the
+        # uploads in progress wait to be admitted up to the queue size and
+        # timeout and are then refused asking to retry after some seconds
+        self.upload_admission_budget = 1024 * 1024 * 1024 # 1GB
+        self.upload_admission_queue_size = 100
+        self.upload_admission_queue_timeout = 60
+        self.upload_admission_retry_after = 30
+
         self.user = getpass.getuser()
         self.group = getpass.getuser()
         self.uid = os.getuid()
@@ -199,8 +259,8 @@ class GLSettingsClass(object):
         self.mail_timeout = 15 # seconds
         self.mail_attempts_limit = 3 # per mail limit
 
-        reactor.addSystemEventTrigger('after', 'shutdown', self.orm_tp.stop)
         self.orm_tp.start()
+        self.orm_ro_tp.start()
 
     def get_mail_counter(self, receiver_id):
         return self.mail_counters.get(receiver_id, 0)
@@ -220,6 +280,7 @@ class GLSettingsClass(object):
         self.static_path = os.path.abspath(os.path.join(self.files_path, 'static'))
         self.static_db_source = os.path.abspath(os.path.join(self.root_path, 'globaleaks', 'db'))
         self.torhs_path = os.path.abspath(os.path.join(self.working_path, 'torhs'))
+        self.client_cache_path = os.path.abspath(os.path.join(self.working_path, 'client_cache'))
 
         self.db_schema = os.path.join(self.static_db_source, 'sqlite.sql')
         self.db_file_name = 'glbackend-%d.db' % DATABASE_VERSION
@@ -328,6 +389,14 @@ class GLSettingsClass(object):
 
         self.side_channels_guard = self.cmdline_options.side_channels_guard / 1000.0
 
+        if self.cmdline_options.orm_readers < 1:
+            self.print_msg("Invalid number of ORM readers: at least one is needed")
+            quit(-1)
+        self.orm_readers = self.cmdline_options.orm_readers
+        self.orm_ro_tp.adjustPoolsize(0, self.orm_readers)
+
+        self.slow_query_threshold = self.cmdline_options.slow_query_threshold / 1000.0
+
         if self.cmdline_options.ramdisk:
             self.ramdisk_path = self.cmdline_options.ramdisk
 
@@ -374,6 +443,8 @@ class GLSettingsClass(object):
             self.developer_name = unicode(self.cmdline_options.developer_name)
             self.set_devel_mode()
             self.orm_debug = self.cmdline_options.orm_debug
+            self.index_advisor = self.cmdline_options.index_advisor
+            self.query_counter = self.cmdline_options.query_counter
             self.log_timing_stats = self.cmdline_options.log_timing_stats
             self.log_requests_responses = self.cmdline_options.log_requests_responses
 
@@ -430,6 +501,7 @@ class GLSettingsClass(object):
                         self.submission_path,
                         self.tmp_upload_path,
                         self.torhs_path,
+                        self.client_cache_path,
                         self.log_path,
                         self.ramdisk_path,
                         self.static_path]:
@@ -544,7 +616,8 @@ class GLSettingsClass(object):
 
     @staticmethod
     def make_db_uri(db_file_path):
-        return 'sqlite:' + db_file_path + '?foreign_keys=ON'
+        # WAL journaling permits to the readers to proceed concurrently to the writer
+        return 'sqlite:' + db_file_path + '?foreign_keys=ON&journal_mode=WAL'
 
 # GLSettings is a singleton class exported once
 GLSettings = GLSettingsClass()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks import models
+from globaleaks.handlers.admin import performance
+from globaleaks.orm import transact_ro
+from globaleaks.tests import helpers
+from globaleaks.utils import sqltracers
+
+
+class TestPerformanceInstance(helpers.TestHandler):
+    _handler = performance.PerformanceInstance
+
+    @inlineCallbacks
+    def test_get(self):
+        handler = self.request({}, role='admin')
+        yield handler.get()
+
+        for pool in ['writer', 'readers']:
+            for k in ['threads', 'working', 'queue_depth', 'max_queue_depth',
+                      'transactions', 'mean_wait_time', 'max_wait_time']:
+                self.assertTrue(k in self.responses[0]['orm'][pool])
+
+
+class TestSlowQueriesCollection(helpers.TestHandler):
+    _handler = performance.SlowQueriesCollection
+
+    @transact_ro
+    def find_users(self, store):
+        for _ in range(20):
+            store.find(models.User, models.User.username == u'admin').count()
+
+    @inlineCallbacks
+    def test_get(self):
+        sqltracers.install_slow_query_log(0, 10)
+        self.addCleanup(sqltracers.remove_slow_query_log)
+
+        yield self.find_users()
+
+        handler = self.request({}, role='admin')
+        yield handler.get()
+
+        self.assertEqual(len(self.responses[0]), 10)
+        for k in ['statement', 'params', 'function', 'run_time', 'date', 'plan']:
+            self.assertTrue(k in self.responses[0][0])
+
+        # the most recent entry is the ROLLBACK of the transaction
+        self.assertEqual(self.responses[0][1]['params'], ['unicode(5)'])
+        self.assertTrue(self.responses[0][1]['function'].endswith('.find_users'))
+        self.assertTrue(len(self.responses[0][1]['plan']))
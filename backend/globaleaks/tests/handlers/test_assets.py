@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks.handlers import assets, public
+from globaleaks.handlers.admin import files
+from globaleaks.rest import errors
+from globaleaks.tests import helpers
+
+
+class TestAssetInstance(helpers.TestHandlerWithPopulatedDB):
+    _handler = assets.AssetInstance
+
+    @inlineCallbacks
+    def get_logo_url(self):
+        yield files.add_file('logo data', u'logo')
+
+        ret = yield public.serialize_node('en')
+
+        self.assertTrue(ret['logo'].startswith('assets/'))
+
+        self.asset_id = ret['logo'][len('assets/'):]
+
+    @inlineCallbacks
+    def test_get(self):
+        yield self.get_logo_url()
+
+        handler = self.request()
+        yield handler.get(self.asset_id)
+
+        self.assertEqual(self.responses[0], 'logo data')
+        self.assertEqual(handler._headers['Content-Type'], 'image/png')
+        self.assertEqual(handler._headers['Cache-control'], 'public, max-age=31536000, immutable')
+        self.assertNotIn('Pragma', handler._headers)
+
+    @inlineCallbacks
+    def test_get_not_modified(self):
+        yield self.get_logo_url()
+
+        handler = self.request(headers={'If-None-Match': '"%s"' % self.asset_id})
+        yield handler.get(self.asset_id)
+
+        self.assertEqual(handler.get_status(), 304)
+        self.assertEqual(len(self.responses), 0)
+
+    @inlineCallbacks
+    def test_get_changed_file(self):
+        yield self.get_logo_url()
+
+        yield files.add_file('new logo data', u'logo')
+
+        handler = self.request()
+        yield self.assertFailure(handler.get(self.asset_id), errors.FileIdNotFound)
+
+    def test_get_unknown_asset(self):
+        handler = self.request()
+        return self.assertFailure(handler.get('0' * 64), errors.FileIdNotFound)
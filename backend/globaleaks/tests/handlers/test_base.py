@@ -1,12 +1,21 @@
 # -*- coding: utf-8 -*-
 import json
-from twisted.internet.defer import inlineCallbacks
+import os
 
-from cyclone.web import HTTPError, HTTPAuthenticationRequired
-from globaleaks.handlers.base import GLSession, GLSessions, BaseHandler, BaseStaticFileHandler, TimingStatsHandler
-from globaleaks.rest.errors import InvalidInputFormat
+from twisted.internet.defer import inlineCallbacks
+from twisted.python.failure import Failure
+from twisted.test import proto_helpers
+
+from cyclone.web import Application, asynchronous, HTTPError, HTTPAuthenticationRequired
+from globaleaks.handlers.base import GLSession, GLSessions, BaseHandler, BaseStaticFileHandler, TimingStatsHandler, \
+    GLHTTPConnection, parse_byte_range
+from globaleaks.rest.errors import ForbiddenOperation, InvalidInputFormat, UploadBudgetExceeded, \
+    UploadQuotaExceeded
 from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
+from globaleaks.tests.utils.test_multipart import BOUNDARY, build_body
+from globaleaks.utils.compression import compress
+from globaleaks.utils.uploads import upload_flows
 
 
 FUTURE = 100
@@ -24,6 +33,19 @@ class BaseHandlerMock(BaseHandler):
         self.finish("test")
 
 
+class RejectingHandlerMock(BaseHandler):
+    @BaseHandler.unauthenticated
+    def post(self):
+        raise ForbiddenOperation
+
+
+class PendingHandlerMock(BaseHandler):
+    @BaseHandler.unauthenticated
+    @asynchronous
+    def post(self):
+        pass
+
+
 class TestBaseHandler(helpers.TestHandlerWithPopulatedDB):
     _handler = BaseHandlerMock
 
@@ -166,6 +188,14 @@ class TestBaseHandler(helpers.TestHandlerWithPopulatedDB):
         self.assertTrue(BaseHandler.validate_regexp('Foca', '\w+'))
         self.assertFalse(BaseHandler.validate_regexp('Foca', '\d+'))
 
+    def test_write_error_retry_after(self):
+        handler = self.request({})
+        handler.send_error(503, exception=UploadBudgetExceeded(30))
+
+        self.assertEqual(handler.get_status(), 503)
+        self.assertEqual(handler._headers['Retry-After'], '30')
+        self.assertEqual(self.responses[0]['error_code'], UploadBudgetExceeded.error_code)
+
     def test_validate_host(self):
         self.assertFalse(BaseHandler.validate_host(""))
         self.assertTrue(BaseHandler.validate_host("127.0.0.1"))
@@ -189,6 +219,270 @@ class TestBaseStaticFileHandler(helpers.TestHandler):
         handler = self.request(kwargs={'path': GLSettings.client_path})
         yield self.assertFailure(handler.get('unexistent'), HTTPError)
 
+    def write_static_file(self, name, data):
+        path = os.path.abspath(self.mktemp())
+        os.makedirs(path)
+
+        with open(os.path.join(path, name), 'wb') as f:
+            f.write(data)
+
+        return path
+
+    @inlineCallbacks
+    def test_get_not_modified(self):
+        path = self.write_static_file('file.txt', 'static content')
+
+        handler = self.request(kwargs={'path': path})
+        yield handler.get('file.txt')
+
+        self.assertEqual(self.responses[0], 'static content')
+        self.assertEqual(handler._headers['Cache-control'], 'no-cache')
+
+        for headers in [{'If-None-Match': handler._headers['Etag']},
+                        {'If-Modified-Since': handler._headers['Last-Modified']}]:
+            handler = self.request(headers=headers, kwargs={'path': path})
+            yield handler.get('file.txt')
+
+            self.assertEqual(handler.get_status(), 304)
+
+        self.assertEqual(len(self.responses), 1)
+
+    @inlineCallbacks
+    def test_get_fingerprinted(self):
+        path = self.write_static_file('scripts.0123abcd.js', 'static content')
+
+        handler = self.request(kwargs={'path': path})
+        yield handler.get('scripts.0123abcd.js')
+
+        self.assertEqual(handler._headers['Cache-control'], 'public, max-age=31536000, immutable')
+        self.assertNotIn('Pragma', handler._headers)
+
+    @inlineCallbacks
+    def test_get_range(self):
+        path = self.write_static_file('file.txt', 'static content')
+
+        handler = self.request(headers={'Range': 'bytes=7-'}, kwargs={'path': path})
+        yield handler.get('file.txt')
+
+        self.assertEqual(handler.get_status(), 206)
+        self.assertEqual(handler._headers['Content-Range'], 'bytes 7-13/14')
+        self.assertEqual(self.responses[0], 'content')
+
+        handler = self.request(headers={'Range': 'bytes=14-'}, kwargs={'path': path})
+        yield handler.get('file.txt')
+
+        self.assertEqual(handler.get_status(), 416)
+        self.assertEqual(handler._headers['Content-Range'], 'bytes */14')
+
+        handler = self.request(headers={'Range': 'bytes=7-', 'If-Range': '"outdated"'}, kwargs={'path': path})
+        yield handler.get('file.txt')
+
+        self.assertEqual(handler.get_status(), 200)
+        self.assertEqual(self.responses[1], 'static content')
+
+    @inlineCallbacks
+    def test_get_streamed(self):
+        self.patch(GLSettings, 'static_file_cache_threshold', 0)
+        self.patch(GLSettings, 'file_chunk_size', 4)
+
+        path = self.write_static_file('file.txt', 'static content')
+
+        handler = self.request(headers={'Range': 'bytes=2-11'}, kwargs={'path': path})
+        yield handler.get('file.txt')
+
+        self.assertEqual(handler._headers['Content-Length'], '10')
+        self.assertEqual(self.responses, ['atic', ' con', 'te'])
+
+    @inlineCallbacks
+    def test_get_precompressed(self):
+        path = self.write_static_file('file.css', 'body {}\n' * 100)
+
+        with open(os.path.join(path, 'file.css.gz'), 'wb') as f:
+            f.write(compress('body {}\n' * 100, 'gzip'))
+
+        handler = self.request(headers={'Accept-Encoding': 'gzip, deflate'}, kwargs={'path': path})
+        yield handler.get('file.css')
+
+        self.assertEqual(handler._headers['Content-Encoding'], 'gzip')
+        self.assertEqual(handler._headers['Vary'], 'Accept-Encoding')
+        self.assertTrue(handler._headers['Etag'].endswith('-gzip"'))
+        self.assertEqual(self.responses[0], compress('body {}\n' * 100, 'gzip'))
+
+        for headers in [{}, {'Accept-Encoding': 'gzip;q=0'}, {'Accept-Encoding': 'gzip', 'Range': 'bytes=0-6'}]:
+            handler = self.request(headers=headers, kwargs={'path': path})
+            yield handler.get('file.css')
+
+            self.assertNotIn('Content-Encoding', handler._headers)
+
+        self.assertEqual(self.responses[1:], ['body {}\n' * 100, 'body {}\n' * 100, 'body {}'])
+
+    def test_parse_byte_range(self):
+        self.assertEqual(parse_byte_range('bytes=0-499', 1000), (0, 499))
+        self.assertEqual(parse_byte_range('bytes=500-', 1000), (500, 999))
+        self.assertEqual(parse_byte_range('bytes=-200', 1000), (800, 999))
+        self.assertEqual(parse_byte_range('bytes=900-2000', 1000), (900, 999))
+        self.assertEqual(parse_byte_range('bytes=1000-', 1000), (1000, 999))
+        self.assertEqual(parse_byte_range('bytes=-0', 1000), (1000, 999))
+        self.assertIsNone(parse_byte_range('bytes=500-400', 1000))
+        self.assertIsNone(parse_byte_range('bytes=0-1,5-6', 1000))
+        self.assertIsNone(parse_byte_range('items=0-1', 1000))
+
+
+class RequestCollector(object):
+    settings = {}
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+
+
+class TestGLHTTPConnection(helpers.TestGL):
+    chunks = ['A' * 100000, 'B' * 50000]
+
+    def setUp(self):
+        self.collector = RequestCollector()
+        return helpers.TestGL.setUp(self)
+
+    def connect(self):
+        connection = GLHTTPConnection()
+        connection.factory = self.collector
+        connection.makeConnection(proto_helpers.StringTransport())
+        return connection
+
+    def get_request(self, chunk_number):
+        body = build_body([('flowIdentifier', 'antani'),
+                           ('flowChunkNumber', str(chunk_number)),
+                           ('flowChunkSize', str(len(self.chunks[0]))),
+                           ('flowTotalSize', str(sum(len(c) for c in self.chunks))),
+                           ('flowTotalChunks', str(len(self.chunks)))],
+                          [('file', 'antani.txt', self.chunks[chunk_number - 1])])
+
+        headers = 'POST /wbtip/upload HTTP/1.1\r\n' \
+                  'X-Session: session\r\n' \
+                  'Content-Type: multipart/form-data; boundary=%s\r\n' \
+                  'Content-Length: %d\r\n\r\n' % (BOUNDARY, len(body))
+
+        return headers + body
+
+    def get_unbound_request(self):
+        body = build_body([], [('file', 'antani.txt', self.chunks[0])])
+
+        headers = 'POST /upload HTTP/1.1\r\n' \
+                  'Host: 127.0.0.1\r\n' \
+                  'Content-Type: multipart/form-data; boundary=%s\r\n' \
+                  'Content-Length: %d\r\n\r\n' % (BOUNDARY, len(body))
+
+        return headers + body
+
+    def test_streamed_upload(self):
+        for i in [2, 1]:
+            data = self.get_request(i)
+
+            connection = self.connect()
+            for j in range(0, len(data), 1000):
+                connection.dataReceived(data[j:j + 1000])
+
+            request = self.collector.requests[-1]
+            self.assertEqual(request.arguments['flowChunkNumber'], [str(i)])
+            self.assertEqual(request.files['file'][0]['size'], len(self.chunks[i - 1]))
+            self.assertEqual(request.body, '')
+
+        flow = self.collector.requests[-1].files['file'][0]['body'].flow
+        self.assertTrue(flow.is_complete())
+        self.assertEqual(upload_flows.complete(flow).read(), ''.join(self.chunks))
+
+    def test_interrupted_upload_is_discarded(self):
+        self.connect().dataReceived(self.get_request(1))
+
+        data = self.get_request(2)
+        connection = self.connect()
+        connection.dataReceived(data[:len(data) / 2])
+        connection.connectionLost(Failure(Exception("Connection lost")))
+
+        self.assertEqual(len(self.collector.requests), 1)
+
+        flow = self.collector.requests[0].files['file'][0]['body'].flow
+        self.assertFalse(flow.is_complete())
+        self.assertEqual(upload_flows.get_stats()['bytes_in_flight'], 0)
+
+        self.connect().dataReceived(data)
+
+        self.assertEqual(len(self.collector.requests), 2)
+        self.assertTrue(flow.is_complete())
+        self.assertEqual(upload_flows.complete(flow).read(), ''.join(self.chunks))
+
+    def test_upload_rejected_by_the_handler_is_discarded(self):
+        self.collector = Application([(r'/upload', RejectingHandlerMock)])
+
+        connection = self.connect()
+        connection.dataReceived(self.get_unbound_request())
+
+        self.assertIn('HTTP/1.1 403', connection.transport.value())
+        self.assertEqual(len(upload_flows.unbound), 0)
+        self.assertEqual(upload_flows.get_reserved(), 0)
+        self.assertEqual(os.listdir(GLSettings.tmp_upload_path), [])
+
+    def test_upload_of_a_lost_connection_is_discarded(self):
+        self.collector = Application([(r'/upload', PendingHandlerMock)])
+
+        connection = self.connect()
+        connection.dataReceived(self.get_unbound_request())
+
+        self.assertNotEqual(upload_flows.get_reserved(), 0)
+
+        # the handler never finishes the request
+        connection.connectionLost(Failure(Exception("Connection lost")))
+
+        self.assertEqual(upload_flows.get_reserved(), 0)
+        self.assertEqual(os.listdir(GLSettings.tmp_upload_path), [])
+
+    def test_upload_quota_exceeded(self):
+        self.patch(GLSettings, 'upload_disk_quota_per_owner', 1000)
+
+        self.connect().dataReceived(self.get_request(1))
+
+        request = self.collector.requests[0]
+        self.assertTrue(isinstance(request.upload_error, UploadQuotaExceeded))
+        self.assertEqual(request.files['file'][0]['body'], None)
+        self.assertEqual(len(upload_flows), 0)
+
+    def test_upload_admission(self):
+        self.patch(GLSettings, 'upload_admission_budget', 200000)
+
+        self.connect().dataReceived(self.get_request(1))
+        flow = self.collector.requests[0].files['file'][0]['body'].flow
+
+        # the upload of another file waits for the first one
+        self.chunks = ['C' * 100000]
+        connection = self.connect()
+        connection.dataReceived(self.get_request(1).replace('antani', 'antani2'))
+
+        self.assertEqual(connection.transport.producerState, 'paused')
+        self.assertEqual(len(self.collector.requests), 1)
+
+        upload_flows.discard(flow)
+
+        self.assertEqual(connection.transport.producerState, 'producing')
+        self.assertEqual(len(self.collector.requests), 2)
+
+        flow = self.collector.requests[1].files['file'][0]['body'].flow
+        self.assertTrue(flow.is_complete())
+        self.assertEqual(upload_flows.complete(flow).read(), self.chunks[0])
+
+    def test_upload_admission_refused(self):
+        self.patch(GLSettings, 'upload_admission_budget', 200000)
+        self.patch(GLSettings, 'upload_admission_queue_size', 0)
+
+        self.connect().dataReceived(self.get_request(1))
+
+        self.connect().dataReceived(self.get_request(1).replace('antani', 'antani2'))
+
+        request = self.collector.requests[1]
+        self.assertTrue(isinstance(request.upload_error, UploadBudgetExceeded))
+        self.assertEqual(request.files['file'][0]['body'], None)
+
 
 class TestTimingStats(helpers.TestHandler):
     _handler = TimingStatsHandler
@@ -213,7 +507,7 @@ class TestTimingStats(helpers.TestHandler):
 
         self.assertEqual(len(splits), 2)
 
-        self.assertEqual(splits[0], "category,method,uri,start_time,run_time")
+        self.assertEqual(splits[0], "category,method,uri,start_time,run_time,queries,sql_time")
         self.assertEqual(splits[1], "")
 
     @inlineCallbacks
@@ -234,13 +528,13 @@ class TestTimingStats(helpers.TestHandler):
 
         self.assertEqual(len(splits), 8)
 
-        self.assertEqual(splits[0], "category,method,uri,start_time,run_time")
-        self.assertEqual(splits[1], "uncategorized,JOB,Session Management,1443252274.44,0")
-        self.assertEqual(splits[2], "uncategorized,GET,/styles/main.css,1443252277.68,0")
-        self.assertEqual(splits[3], "delivery,JOB,Delivery,1443252279.0,0")
-        self.assertEqual(splits[4], "token,POST,/token,1443252280.0,0")
-        self.assertEqual(splits[5], "submission,PUT,/submission/XXA82cSXFHTOoVroWlOGqg2VF8XtJQ57QIYM09YanY,1443252281.0,0")
-        self.assertEqual(splits[6], "comment,POST,/wbtip/comments,1443252282.0,0")
+        self.assertEqual(splits[0], "category,method,uri,start_time,run_time,queries,sql_time")
+        self.assertEqual(splits[1], "uncategorized,JOB,Session Management,1443252274.44,0,0,0.0000")
+        self.assertEqual(splits[2], "uncategorized,GET,/styles/main.css,1443252277.68,0,0,0.0000")
+        self.assertEqual(splits[3], "delivery,JOB,Delivery,1443252279.0,0,0,0.0000")
+        self.assertEqual(splits[4], "token,POST,/token,1443252280.0,0,0,0.0000")
+        self.assertEqual(splits[5], "submission,PUT,/submission/XXA82cSXFHTOoVroWlOGqg2VF8XtJQ57QIYM09YanY,1443252281.0,0,0,0.0000")
+        self.assertEqual(splits[6], "comment,POST,/wbtip/comments,1443252282.0,0,0,0.0000")
         self.assertEqual(splits[7], "")
 
     @inlineCallbacks
@@ -257,5 +551,5 @@ class TestTimingStats(helpers.TestHandler):
 
         self.assertEqual(len(splits), 2)
 
-        self.assertEqual(splits[0], "category,method,uri,start_time,run_time")
+        self.assertEqual(splits[0], "category,method,uri,start_time,run_time,queries,sql_time")
         self.assertEqual(splits[1], "")
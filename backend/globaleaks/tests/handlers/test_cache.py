@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
-from twisted.internet.defer import inlineCallbacks
+import gzip
+import json
+from io import BytesIO
+
+from twisted.internet.defer import Deferred, inlineCallbacks
 
 from globaleaks.orm import transact
 from globaleaks.rest.apicache import GLApiCache
 from globaleaks.tests import helpers
+from globaleaks.utils.lrucache import LRUCache
 
 
 class TestGLApiCache(helpers.TestGL):
@@ -13,38 +18,144 @@ class TestGLApiCache(helpers.TestGL):
 
         GLApiCache.invalidate()
 
+        self.patch(GLApiCache, 'stats', {})
+
     @staticmethod
     @transact
     def mario(store, arg1, arg2, arg3):
         return arg1 + " " + arg2 + " " + arg3
 
+    def get_cached(self, resource_name, language):
+        return GLApiCache.cache.entries.get((resource_name, language))
+
     @inlineCallbacks
     def test_get(self):
-        self.assertTrue("passante_di_professione" not in GLApiCache.memory_cache_dict)
-        pdp_it = yield GLApiCache.get("passante_di_professione", "it", self.mario, "come", "una", "catapulta!")
-        pdp_en = yield GLApiCache.get("passante_di_professione", "en", self.mario, "like", "a", "catapult!")
-        self.assertTrue("passante_di_professione" in GLApiCache.memory_cache_dict)
-        self.assertTrue("it" in GLApiCache.memory_cache_dict['passante_di_professione'])
-        self.assertTrue("en" in GLApiCache.memory_cache_dict['passante_di_professione'])
-        self.assertEqual(pdp_it, "come una catapulta!")
-        self.assertEqual(pdp_en, "like a catapult!")
+        self.assertIsNone(self.get_cached("passante_di_professione", "it"))
+        pdp_it = yield GLApiCache.get("passante_di_professione", "it", [], self.mario, "come", "una", "catapulta!")
+        pdp_en = yield GLApiCache.get("passante_di_professione", "en", [], self.mario, "like", "a", "catapult!")
+        self.assertIsNotNone(self.get_cached("passante_di_professione", "it"))
+        self.assertIsNotNone(self.get_cached("passante_di_professione", "en"))
+        self.assertEqual(json.loads(pdp_it.body), "come una catapulta!")
+        self.assertEqual(json.loads(pdp_en.body), "like a catapult!")
+        self.assertNotEqual(pdp_it.etag, pdp_en.etag)
 
     @inlineCallbacks
     def test_set(self):
-        self.assertTrue("passante_di_professione" not in GLApiCache.memory_cache_dict)
-        pdp_it = yield GLApiCache.get("passante_di_professione", "it", self.mario, "come", "una", "catapulta!")
-        self.assertTrue("passante_di_professione" in GLApiCache.memory_cache_dict)
-        self.assertTrue(pdp_it == "come una catapulta!")
+        self.assertIsNone(self.get_cached("passante_di_professione", "it"))
+        pdp_it = yield GLApiCache.get("passante_di_professione", "it", [], self.mario, "come", "una", "catapulta!")
+        self.assertIsNotNone(self.get_cached("passante_di_professione", "it"))
+        self.assertEqual(json.loads(pdp_it.body), "come una catapulta!")
         yield GLApiCache.set("passante_di_professione", "it", "ma io ho visto tutto!")
-        self.assertTrue("passante_di_professione" in GLApiCache.memory_cache_dict)
-        pdp_it = yield GLApiCache.get("passante_di_professione", "it", self.mario, "already", "cached")
-        self.assertEqual(pdp_it, "ma io ho visto tutto!")
+        self.assertIsNotNone(self.get_cached("passante_di_professione", "it"))
+        pdp_it = yield GLApiCache.get("passante_di_professione", "it", [], self.mario, "already", "cached")
+        self.assertEqual(json.loads(pdp_it.body), "ma io ho visto tutto!")
 
     @inlineCallbacks
     def test_invalidate(self):
-        self.assertTrue("passante_di_professione" not in GLApiCache.memory_cache_dict)
-        pdp_it = yield GLApiCache.get("passante_di_professione", "it", self.mario, "come", "una", "catapulta!")
-        self.assertTrue("passante_di_professione" in GLApiCache.memory_cache_dict)
-        self.assertEqual(pdp_it, "come una catapulta!")
-        yield GLApiCache.invalidate("passante_di_professione")
-        self.assertTrue("passante_di_professione" not in GLApiCache.memory_cache_dict)
+        self.assertIsNone(self.get_cached("passante_di_professione", "it"))
+        pdp_it = yield GLApiCache.get("passante_di_professione", "it", [], self.mario, "come", "una", "catapulta!")
+        self.assertIsNotNone(self.get_cached("passante_di_professione", "it"))
+        self.assertEqual(json.loads(pdp_it.body), "come una catapulta!")
+        yield GLApiCache.invalidate()
+        self.assertIsNone(self.get_cached("passante_di_professione", "it"))
+
+    @inlineCallbacks
+    def test_invalidate_tags(self):
+        yield GLApiCache.get("passante_di_professione", "it", ['node'], self.mario, "come", "una", "catapulta!")
+        yield GLApiCache.get("passante_di_professione", "en", ['node'], self.mario, "like", "a", "catapult!")
+        yield GLApiCache.get("mario", "it", ['contexts'], self.mario, "a", "b", "c")
+
+        GLApiCache.invalidate('users')
+        self.assertEqual(GLApiCache.stale, set())
+
+        GLApiCache.invalidate('node')
+        self.assertEqual(GLApiCache.stale, set([("passante_di_professione", "it"),
+                                                ("passante_di_professione", "en")]))
+
+        yield GLApiCache.wait_refreshes()
+        self.assertEqual(GLApiCache.stale, set())
+
+        stats = GLApiCache.get_stats()['resources']
+        self.assertEqual(stats['passante_di_professione']['invalidations'], 2)
+        self.assertEqual(stats['passante_di_professione']['refreshes'], 2)
+        self.assertEqual(stats['passante_di_professione']['misses'], 2)
+        self.assertEqual(stats['mario']['entries'], 1)
+
+    @inlineCallbacks
+    def test_stale_while_revalidate(self):
+        values = ["old"]
+        computations = []
+
+        def function():
+            computations.append(Deferred())
+            return computations[-1].addCallback(lambda _: values[0])
+
+        d = GLApiCache.get("passante_di_professione", "it", ['node'], function)
+        computations[-1].callback(None)
+        yield d
+
+        values[0] = "new"
+        GLApiCache.invalidate('node')
+        self.assertEqual(len(computations), 2)
+
+        # the stale response is served while the new one is computed
+        response = yield GLApiCache.get("passante_di_professione", "it", ['node'], function)
+        self.assertEqual(json.loads(response.body), "old")
+        self.assertEqual(len(computations), 2)
+
+        computations[-1].callback(None)
+        response = yield GLApiCache.get("passante_di_professione", "it", ['node'], function)
+        self.assertEqual(json.loads(response.body), "new")
+        self.assertEqual(GLApiCache.get_stats()['resources']['passante_di_professione']['stale_hits'], 1)
+
+    @inlineCallbacks
+    def test_concurrent_misses(self):
+        calls = []
+        computations = []
+
+        def function():
+            calls.append(None)
+            computations.append(Deferred())
+            return computations[-1]
+
+        d1 = GLApiCache.get("passante_di_professione", "it", [], function)
+        d2 = GLApiCache.get("passante_di_professione", "it", [], function)
+        self.assertEqual(len(calls), 1)
+
+        # a computation started before an invalidation is not cached
+        GLApiCache.invalidate("passante_di_professione")
+        d3 = GLApiCache.get("passante_di_professione", "it", [], function)
+        self.assertEqual(len(calls), 2)
+
+        computations[0].callback("stale")
+        self.assertEqual(json.loads((yield d1).body), "stale")
+        self.assertEqual(json.loads((yield d2).body), "stale")
+        self.assertIsNone(self.get_cached("passante_di_professione", "it"))
+
+        computations[1].callback("fresh")
+        self.assertEqual(json.loads((yield d3).body), "fresh")
+        self.assertIsNotNone(self.get_cached("passante_di_professione", "it"))
+
+    @inlineCallbacks
+    def test_size_bound(self):
+        self.patch(GLApiCache, 'cache', LRUCache(1000))
+
+        for i in range(10):
+            yield GLApiCache.get("passante_di_professione", str(i), [], self.mario, "x" * 100, "y", "z")
+
+        stats = GLApiCache.get_stats()
+        self.assertTrue(stats['size'] <= 1000)
+        self.assertTrue(stats['resources']['passante_di_professione']['evictions'] > 0)
+        self.assertIsNotNone(self.get_cached("passante_di_professione", "9"))
+        self.assertIsNone(self.get_cached("passante_di_professione", "0"))
+
+    @inlineCallbacks
+    def test_compressed_variant(self):
+        pdp_it = yield GLApiCache.get("passante_di_professione", "it", [], self.mario, "come", "una", "catapulta!")
+
+        self.assertEqual(gzip.GzipFile(fileobj=BytesIO(pdp_it.gzip_body)).read(), pdp_it.body)
+
+        self.assertTrue(pdp_it.match(pdp_it.etag))
+        self.assertTrue(pdp_it.match('"other", W/%s' % pdp_it.gzip_etag))
+        self.assertTrue(pdp_it.match('*'))
+        self.assertFalse(pdp_it.match('"other"'))
@@ -3,8 +3,10 @@ import os
 
 from twisted.internet.defer import inlineCallbacks
 
+from globaleaks import models
 from globaleaks.jobs.delivery_sched import DeliverySchedule
 from globaleaks.handlers import files
+from globaleaks.orm import transact_ro
 from globaleaks.rest import errors
 from globaleaks.tests import helpers
 from globaleaks.utils import token
@@ -79,3 +81,71 @@ class TestDownload(helpers.TestHandlerWithPopulatedDB):
             for rfile_desc in rfiles_desc:
                 handler = self.request(role='receiver', user_id = rtip_desc['receiver_id'])
                 yield handler.get(rtip_desc['id'], rfile_desc['id'])
+
+                downloads = yield self.get_downloads(rfile_desc['id'])
+                self.assertEqual(downloads, 1)
+
+    @inlineCallbacks
+    def test_get_resumed(self):
+        yield self.perform_full_submission_actions()
+        yield DeliverySchedule().operation()
+
+        rtip_desc = (yield self.get_rtips())[0]
+        rfile_desc = (yield self.get_rfiles(rtip_desc['id']))[0]
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'],
+                               headers={'Range': 'bytes=0-9'})
+        yield handler.get(rtip_desc['id'], rfile_desc['id'])
+
+        self.assertEqual(handler.get_status(), 206)
+        self.assertEqual(len(''.join(self.responses)), 10)
+
+        etag = handler._headers['Etag']
+        size = int(handler._headers['Content-Range'].split('/')[1])
+
+        # the download is counted only once its end is sent
+        downloads = yield self.get_downloads(rfile_desc['id'])
+        self.assertEqual(downloads, 0)
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'],
+                               headers={'Range': 'bytes=10-', 'If-Range': etag})
+        yield handler.get(rtip_desc['id'], rfile_desc['id'])
+
+        self.assertEqual(handler._headers['Content-Range'], 'bytes 10-%d/%d' % (size - 1, size))
+        self.assertEqual(len(''.join(self.responses)), size)
+
+        downloads = yield self.get_downloads(rfile_desc['id'])
+        self.assertEqual(downloads, 1)
+
+    @inlineCallbacks
+    def test_get_last_byte_only(self):
+        yield self.perform_full_submission_actions()
+        yield DeliverySchedule().operation()
+
+        rtip_desc = (yield self.get_rtips())[0]
+        rfile_desc = (yield self.get_rfiles(rtip_desc['id']))[0]
+
+        # the ranges requested alone do not make a download
+        for i in range(3):
+            handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'],
+                                   headers={'Range': 'bytes=-1'})
+            yield handler.get(rtip_desc['id'], rfile_desc['id'])
+
+        downloads = yield self.get_downloads(rfile_desc['id'])
+        self.assertEqual(downloads, 0)
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        yield handler.get(rtip_desc['id'], rfile_desc['id'])
+
+        # nor they are counted again once the download is complete
+        for i in range(3):
+            handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'],
+                                   headers={'Range': 'bytes=-1'})
+            yield handler.get(rtip_desc['id'], rfile_desc['id'])
+
+        downloads = yield self.get_downloads(rfile_desc['id'])
+        self.assertEqual(downloads, 1)
+
+    @transact_ro
+    def get_downloads(self, store, rfile_id):
+        return store.find(models.ReceiverFile, models.ReceiverFile.id == rfile_id).one().downloads
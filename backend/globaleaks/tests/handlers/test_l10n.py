@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
+import json
+import os
+
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.handlers import l10n
 from globaleaks.handlers.admin import l10n as admin_l10n
-from globaleaks.rest.apicache import GLApiCache
+from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
 
 
@@ -24,9 +27,39 @@ class TestL10NHandler(helpers.TestHandler):
 
         yield admin_l10n.update_custom_texts(u'en', custom_texts)
 
-        GLApiCache.invalidate('l10n')
+        l10n.l10n_bundles.set_custom_texts(u'en', custom_texts)
 
         yield handler.get(lang=u'en')
 
         self.assertIn('12345', self.responses[1])
         self.assertEqual('54321', self.responses[1]['12345'])
+
+    @inlineCallbacks
+    def test_get_requested_language(self):
+        handler = self.request(headers={'GL-Language': 'en'})
+
+        yield handler.get(lang=u'it')
+
+        with open(l10n.langfile_path('it'), 'rb') as f:
+            self.assertEqual(self.responses[0], json.loads(f.read()))
+
+    @inlineCallbacks
+    def test_reload_changed_file(self):
+        client_path = GLSettings.client_path
+        self.addCleanup(setattr, GLSettings, 'client_path', client_path)
+
+        GLSettings.client_path = os.path.abspath(self.mktemp())
+        os.makedirs(os.path.join(GLSettings.client_path, 'l10n'))
+
+        with open(l10n.langfile_path('en'), 'wb') as f:
+            f.write(json.dumps({'text': 'old'}))
+
+        bundle = yield l10n.l10n_bundles.get('en')
+        self.assertEqual(json.loads(bundle.body), {'text': 'old'})
+
+        with open(l10n.langfile_path('en'), 'wb') as f:
+            f.write(json.dumps({'text': 'new text'}))
+
+        bundle = yield l10n.l10n_bundles.get('en')
+        self.assertEqual(json.loads(bundle.body), {'text': 'new text'})
+        self.assertEqual(l10n.l10n_bundles.reloads, 1)
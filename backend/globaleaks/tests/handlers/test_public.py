@@ -1,12 +1,20 @@
 # -*- coding: utf-8 -*-
+import gzip
 import json
+from io import BytesIO
 
+from twisted.internet import defer
 from twisted.internet.defer import inlineCallbacks
 from globaleaks.rest import requests
 from globaleaks.tests import helpers
 from globaleaks.handlers import admin, public
+from globaleaks.handlers.l10n import l10n_bundles
+from globaleaks import models
 from globaleaks.models import config
+from globaleaks.orm import transact, transact_ro
+from globaleaks.rest.apicache import GLApiCache
 from globaleaks.settings import GLSettings
+from globaleaks.utils.sqltracers import QueryStats, run_with_query_stats
 
 
 class TestPublicResource(helpers.TestHandlerWithPopulatedDB):
@@ -19,3 +27,108 @@ class TestPublicResource(helpers.TestHandlerWithPopulatedDB):
 
         resp_desc = self.ss_serial_desc(config.NodeFactory.public_node, requests.PublicResourcesDesc)
         self._handler.validate_message(json.dumps(self.responses[0]), resp_desc)
+
+    @inlineCallbacks
+    def test_get_not_modified(self):
+        handler = self.request()
+        yield handler.get()
+
+        etag = handler._headers['Etag']
+
+        handler = self.request(headers={'If-None-Match': etag})
+        yield handler.get()
+
+        self.assertEqual(handler.get_status(), 304)
+        self.assertEqual(len(self.responses), 1)
+
+    @inlineCallbacks
+    def test_get_compressed(self):
+        handler = self.request(headers={'Accept-Encoding': 'gzip'})
+        handler.request.version = 'HTTP/1.1'
+        yield handler.get()
+
+        self.assertEqual(handler._headers['Content-Encoding'], 'gzip')
+        self.assertIn('node', json.loads(gzip.GzipFile(fileobj=BytesIO(self.responses[0])).read()))
+
+
+class TestWarmPublicResources(helpers.TestGLWithPopulatedDB):
+    @inlineCallbacks
+    def test_warm_public_resources(self):
+        GLApiCache.invalidate()
+
+        yield public.warm_public_resources()
+
+        for language in GLSettings.memory_copy.languages_enabled:
+            self.assertIsNotNone(GLApiCache.cache.get(('public', language)))
+            self.assertIn(language, l10n_bundles.bundles)
+
+    @inlineCallbacks
+    def test_warm_public_resources_waits_the_refreshes(self):
+        yield public.warm_public_resources()
+
+        GLApiCache.invalidate('node')
+
+        yield public.warm_public_resources()
+
+        self.assertEqual(GLApiCache.stale, set())
+        self.assertEqual(GLApiCache.pending, {})
+
+
+class TestQuestionnaireTree(helpers.TestGLWithPopulatedDB):
+    @transact_ro
+    def get_first_step_id(self, store):
+        context = store.find(models.Context, models.Context.id == self.dummyContext['id']).one()
+        return store.find(models.Step, models.Step.questionnaire_id == context.questionnaire_id)[0].id
+
+    @transact
+    def bind_field(self, store, field_id, step_id=None, fieldgroup_id=None):
+        field = store.find(models.Field, models.Field.id == field_id).one()
+        field.step_id = step_id
+        field.fieldgroup_id = fieldgroup_id
+
+    @inlineCallbacks
+    def create_bound_field(self, step_id=None, fieldgroup_id=None):
+        field_id = yield self.create_dummy_field()
+        yield self.bind_field(field_id, step_id, fieldgroup_id)
+        defer.returnValue(field_id)
+
+    @inlineCallbacks
+    def count_public_resources_queries(self):
+        query_stats = QueryStats('Test')
+        yield run_with_query_stats(query_stats, public.get_public_resources, 'en')
+        defer.returnValue(query_stats.count)
+
+    @inlineCallbacks
+    def test_queries_independent_from_questionnaire_size(self):
+        step_id = yield self.get_first_step_id()
+        field_id = yield self.create_bound_field(step_id=step_id)
+        yield self.create_bound_field(fieldgroup_id=field_id)
+
+        count = yield self.count_public_resources_queries()
+
+        # the queries depend only on the depth of the questionnaire
+        for i in range(5):
+            field_id = yield self.create_bound_field(step_id=step_id)
+            yield self.create_bound_field(fieldgroup_id=field_id)
+
+        self.assertEqual((yield self.count_public_resources_queries()), count)
+
+    @transact_ro
+    def get_tree_fields_ids(self, store, **kwargs):
+        return set(public.QuestionnaireTree(store, **kwargs).fields)
+
+    @inlineCallbacks
+    def test_tree_is_scoped(self):
+        step_id = yield self.get_first_step_id()
+        field_id = yield self.create_bound_field(step_id=step_id)
+        child_id = yield self.create_bound_field(fieldgroup_id=field_id)
+
+        # a field not bound to any questionnaire
+        other_id = yield self.create_dummy_field()
+
+        fields_ids = yield self.get_tree_fields_ids(field_ids=[field_id])
+        self.assertEqual(fields_ids, set([field_id, child_id]))
+
+        fields_ids = yield self.get_tree_fields_ids(step_ids=[step_id])
+        self.assertTrue(set([field_id, child_id]) <= fields_ids)
+        self.assertNotIn(other_id, fields_ids)
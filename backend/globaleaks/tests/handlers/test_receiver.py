@@ -2,6 +2,7 @@
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.handlers import receiver, admin
+from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
 
 
@@ -39,6 +40,65 @@ class TestTipsCollection(helpers.TestHandlerWithPopulatedDB):
         handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
         yield handler.get()
 
+    @inlineCallbacks
+    def test_get_paginated(self):
+        for _ in xrange(3):
+            yield self.perform_full_submission_actions()
+
+        ids = []
+        cursor = None
+        while True:
+            handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+            handler.request.arguments = {'sort': ['progressive'], 'order': ['desc'], 'limit': ['3']}
+            if cursor is not None:
+                handler.request.arguments['cursor'] = [cursor]
+
+            yield handler.get()
+
+            ids.extend(rtip['id'] for rtip in self.responses[-1])
+
+            cursor = handler._headers.get('X-Next-Cursor')
+            if cursor is None:
+                break
+
+        rtips = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en',
+                                                    sort='progressive', order='desc')
+
+        self.assertEqual(len(self.responses), 2)
+        self.assertEqual(ids, [rtip['id'] for rtip in rtips])
+
+        # the counters of a page are the ones of the whole list
+        for key in ['file_counter', 'comment_counter', 'message_counter']:
+            self.assertEqual([rtip[key] for rtip in self.responses[0] + self.responses[1]],
+                             [rtip[key] for rtip in rtips])
+
+    @inlineCallbacks
+    def test_get_limit_is_bounded(self):
+        for _ in xrange(2):
+            yield self.perform_full_submission_actions()
+
+        self.patch(GLSettings, 'receiver_tip_list_limit', 2)
+
+        for arguments in [{}, {'limit': ['100']}]:
+            handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+            handler.request.arguments = arguments
+            yield handler.get()
+
+            self.assertEqual(len(self.responses[-1]), 2)
+            self.assertIsNotNone(handler._headers.get('X-Next-Cursor'))
+
+    @inlineCallbacks
+    def test_get_filtered(self):
+        rtips = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
+
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        handler.request.arguments = {'context_id': [rtips[0]['context_id'].encode('utf-8')]}
+        yield handler.get()
+        self.assertEqual(len(self.responses[0]), len(rtips))
+
+        rtips = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en', min_score=1000)
+        self.assertEqual(rtips, [])
+
 
 class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
     _handler = receiver.TipsOperations
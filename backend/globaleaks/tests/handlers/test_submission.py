@@ -1,9 +1,15 @@
 # -*- encoding: utf-8 -*-
 from twisted.internet.defer import inlineCallbacks, returnValue
 
+from globaleaks import models
 from globaleaks.handlers import authentication, wbtip
-from globaleaks.handlers.submission import SubmissionInstance
+from globaleaks.handlers.rtip import db_delete_itips
+from globaleaks.handlers.submission import SubmissionInstance, archived_schema_cache, \
+    db_get_archived_questionnaire_schema, db_get_questionnaire_answers_tree, db_get_questionnaire_snapshot, \
+    db_save_questionnaire_answers
 from globaleaks.jobs import delivery_sched
+from globaleaks.orm import transact, transact_ro
+from globaleaks.rest.apicache import QuestionnaireCache
 from globaleaks.tests import helpers
 from globaleaks.utils.token import Token
 
@@ -133,3 +139,78 @@ class TestSubmissionPlaintextScenario(TestSubmissionEncryptedScenario):
         'encrypted': 0,
         'reference': 6
     }
+
+
+class TestQuestionnaireCache(helpers.TestGLWithPopulatedDB):
+    @transact_ro
+    def get_questionnaire_snapshot(self, store):
+        return db_get_questionnaire_snapshot(store, self.dummyContext['id'])
+
+    @transact_ro
+    def get_archived_questionnaire_schema(self, store, questionnaire_hash):
+        return db_get_archived_questionnaire_schema(store, questionnaire_hash, 'en')
+
+    @transact
+    def delete_itips(self, store):
+        db_delete_itips(store, list(store.find(models.InternalTip.id)))
+
+    @inlineCallbacks
+    def test_questionnaire_snapshot(self):
+        snapshot = yield self.get_questionnaire_snapshot()
+        self.assertTrue((yield self.get_questionnaire_snapshot()) is snapshot)
+
+        QuestionnaireCache.invalidate()
+        self.assertFalse((yield self.get_questionnaire_snapshot()) is snapshot)
+
+        # a snapshot computed before an invalidation is discarded
+        QuestionnaireCache.set(self.dummyContext['id'], QuestionnaireCache.version - 1, snapshot)
+        self.assertFalse((yield self.get_questionnaire_snapshot()) is snapshot)
+
+    @inlineCallbacks
+    def test_archived_hashes(self):
+        yield self.perform_full_submission_actions()
+        yield self.perform_full_submission_actions()
+
+        _, questionnaire_hash = yield self.get_questionnaire_snapshot()
+        self.assertTrue(QuestionnaireCache.is_archived(questionnaire_hash))
+
+        yield self.delete_itips()
+        self.assertFalse(QuestionnaireCache.is_archived(questionnaire_hash))
+
+    @inlineCallbacks
+    def test_archived_schema_cache(self):
+        yield self.perform_full_submission_actions()
+
+        _, questionnaire_hash = yield self.get_questionnaire_snapshot()
+
+        archived_schema_cache.invalidate()
+
+        hits = archived_schema_cache.get_stats()['hits']
+        schema = yield self.get_archived_questionnaire_schema(questionnaire_hash)
+        self.assertTrue((yield self.get_archived_questionnaire_schema(questionnaire_hash)) is schema)
+        self.assertEqual(archived_schema_cache.get_stats()['hits'], hits + 1)
+
+        self.assertRaises(TypeError, schema.append, {})
+
+
+class TestQuestionnaireAnswers(helpers.TestGLWithPopulatedDB):
+    @transact
+    def save_and_load_answers(self, store, answers, keys):
+        itip_id = store.find(models.InternalTip).any().id
+        db_save_questionnaire_answers(store, itip_id, answers)
+        return db_get_questionnaire_answers_tree(store, itip_id, keys)
+
+    @inlineCallbacks
+    def test_answers_tree(self):
+        yield self.perform_full_submission_actions()
+
+        answers = {
+            u'a': u'leaf',
+            u'b': [{u'c': unicode(i), u'd': [{u'e': unicode(j)} for j in range(3)]} for i in range(12)],
+            u'filtered': u'value'
+        }
+
+        ret = yield self.save_and_load_answers(answers, set([u'a', u'b']))
+
+        del answers[u'filtered']
+        self.assertEqual(ret, answers)
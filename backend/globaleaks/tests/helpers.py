@@ -17,14 +17,14 @@ from cyclone import httpserver
 from cyclone.web import Application
 from storm.twisted.testing import FakeThreadPool
 from twisted.internet import threads, defer, task
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import Deferred, inlineCallbacks
 from twisted.trial import unittest
 from twisted.test import proto_helpers
 
 from globaleaks import db, models, security, event, runner, jobs
 from globaleaks.anomaly import Alarm
 from globaleaks.db.appdata import load_appdata
-from globaleaks.orm import transact, transact_ro
+from globaleaks.orm import transact, transact_ro, store_manager
 from globaleaks.handlers import files, rtip, wbtip
 from globaleaks.handlers.base import GLHTTPConnection, BaseHandler, GLSessions, GLSession
 from globaleaks.handlers.admin.context import create_context, \
@@ -34,11 +34,15 @@ from globaleaks.handlers.admin.field import db_create_field
 from globaleaks.handlers.admin.step import create_step
 from globaleaks.handlers.admin.questionnaire import get_questionnaire
 from globaleaks.handlers.admin.user import create_admin_user, create_custodian_user
-from globaleaks.handlers.submission import create_submission, serialize_internalfile, serialize_receiverfile
-from globaleaks.rest.apicache import GLApiCache
+from globaleaks.handlers.l10n import l10n_bundles
+from globaleaks.handlers.submission import create_submission, serialize_internalfile, serialize_receiverfile, \
+    archived_schema_cache
+from globaleaks.rest.apicache import GLApiCache, QuestionnaireCache
 from globaleaks.settings import GLSettings
 from globaleaks.security import GLSecureTemporaryFile
-from globaleaks.utils import tempdict, token, utility
+from globaleaks.utils import tempdict, token, uploads, utility
+from globaleaks.utils.sqltracers import install_query_counter, resume_with_query_stats, \
+    run_with_query_stats
 from globaleaks.utils.structures import fill_localized_keys
 from globaleaks.utils.utility import datetime_null, datetime_now, datetime_to_ISO8601, \
     log, sum_dicts
@@ -90,6 +94,8 @@ def init_glsettings_for_unit_tests():
     GLSettings.logging = None
     GLSettings.scheduler_threadpool = FakeThreadPool()
     GLSettings.failed_login_attempts = 0
+    GLSettings.query_counter = True
+    GLSettings.query_budget_strict = True
     GLSettings.working_path = './working_path'
     GLSettings.ramdisk_path = os.path.join(GLSettings.working_path, 'ramdisk')
 
@@ -99,6 +105,8 @@ def init_glsettings_for_unit_tests():
 
     GLSessions.clear()
 
+    install_query_counter()
+
 
 def export_fixture(*models):
     """
@@ -135,6 +143,7 @@ def get_dummy_file(filename=None, content_type=None, content=None):
         'body': temporary_file,
         'body_len': len(content),
         'body_filepath': temporary_file.filepath,
+        'sha256': temporary_file.get_sha256(),
         'filename': filename,
         'content_type': content_type,
         'submission': False
@@ -158,8 +167,22 @@ class TestGL(unittest.TestCase):
         token.TokenList.reactor = self.test_reactor
         runner.test_reactor = self.test_reactor
         tempdict.test_reactor = self.test_reactor
+        uploads.test_reactor = self.test_reactor
         GLSessions.reactor = self.test_reactor
 
+        # the database of the previous test is going to be removed once
+        # the transactions still running in background are completed
+        yield GLApiCache.wait_refreshes()
+        yield transact.wait_transactions()
+        store_manager.close_stores()
+        QuestionnaireCache.invalidate()
+        QuestionnaireCache.archived_hashes.clear()
+        archived_schema_cache.invalidate()
+        l10n_bundles.reset()
+        uploads.upload_flows.clear_flows()
+        uploads.upload_flows.reset_stats()
+        uploads.upload_admission.reset_stats()
+
         init_glsettings_for_unit_tests()
 
         self.setUp_dummy()
@@ -603,6 +626,12 @@ class TestHandler(TestGLWithPopulatedDB):
             # called it contains *all* of the response message.
             #RequestHandler.finish(cls, response)
 
+            # the responses of the GLApiCache are written already encoded
+            if isinstance(response, str) and \
+                    cls._headers.get('Content-Type', '').startswith('application/json') and \
+                    cls._headers.get('Content-Encoding') != 'gzip':
+                response = json.loads(response)
+
             if response:
                 self.responses.append(response)
 
@@ -670,7 +699,29 @@ class TestHandler(TestGLWithPopulatedDB):
                                          remote_ip=remote_ip,
                                          connection=connection)
 
+        # the request and the output transforms are otherwise set by cyclone
+        # while parsing and executing the request
+        connection._request = request
+
         handler = self._handler(application, request, **kwargs)
+        handler._transforms = []
+
+        # the tests call the methods of the handler that are otherwise run
+        # by _execute_handler accounting their queries to the request; the
+        # test resumed once the method completes is not accounted to it
+        def account_queries(function):
+            def call(*args, **kwargs):
+                ret = run_with_query_stats(handler.query_stats, function, *args, **kwargs)
+                if isinstance(ret, Deferred):
+                    ret = resume_with_query_stats(ret, None)
+
+                return ret
+
+            return call
+
+        for method in ['get', 'post', 'put', 'delete']:
+            if hasattr(handler, method):
+                setattr(handler, method, account_queries(getattr(handler, method)))
 
         if user_id is None and role is not None:
             if role == 'admin':
@@ -87,3 +87,30 @@ class TestCleaningSched(helpers.TestGLWithPopulatedDB):
 
         # verify cascade deletion when tips expire
         yield self.check0()
+
+    @inlineCallbacks
+    def test_expired_tips_deletion_in_chunks(self):
+        self.patch(GLSettings, 'tips_deletion_chunk_size', 1)
+
+        yield self.perform_full_submission_actions()
+        yield self.perform_full_submission_actions()
+
+        yield self.force_itip_expiration()
+
+        job = cleaning_sched.CleaningSchedule()
+
+        chunks = []
+        delete_expired_itips_chunk = job.delete_expired_itips_chunk
+
+        def count_chunks():
+            chunks.append(None)
+            return delete_expired_itips_chunk()
+
+        job.delete_expired_itips_chunk = count_chunks
+
+        yield job.operation()
+
+        # two chunks of one tip and a last empty one
+        self.assertEqual(len(chunks), 3)
+
+        yield self.check0()
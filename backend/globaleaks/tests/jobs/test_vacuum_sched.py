@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks import models
+from globaleaks.jobs import vacuum_sched
+from globaleaks.orm import transact
+from globaleaks.tests import helpers
+
+
+class TestVacuumSchedule(helpers.TestGL):
+    initialize_test_database_using_archived_db = False
+
+    @transact
+    def fragment_db(self, store):
+        for _ in range(100):
+            store.add(models.Mail({
+                'address': u'evilaliv3@globaleaks.org',
+                'subject': u'',
+                'body': u'x' * 10000
+            }))
+
+        store.flush()
+
+        store.find(models.Mail).remove()
+
+    @inlineCallbacks
+    def test_vacuum_schedule(self):
+        yield self.fragment_db()
+
+        stats = yield vacuum_sched.get_pages_stats()
+        self.assertTrue(stats['freelist_count'] > 0)
+
+        job = vacuum_sched.VacuumSchedule()
+
+        # outside of the quiet hours the job does not reclaim pages
+        job.is_quiet_time = lambda: False
+        yield job.operation()
+        self.assertEqual(vacuum_sched.get_vacuum_report()['freelist_count'], stats['freelist_count'])
+
+        job.is_quiet_time = lambda: True
+        yield job.operation()
+
+        report = vacuum_sched.get_vacuum_report()
+        self.assertEqual(report['freelist_count'], 0)
+        self.assertEqual(report['last_reclaimed_pages'], stats['freelist_count'])
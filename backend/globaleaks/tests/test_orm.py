@@ -3,7 +3,8 @@ from storm import exceptions
 
 from globaleaks.tests import helpers
 
-from globaleaks.orm import transact, transact_ro
+from globaleaks.orm import transact, transact_ro, db_executemany, get_orm_stats, store_manager
+from globaleaks.settings import GLSettings
 from globaleaks.models import *
 from globaleaks.utils.utility import datetime_null
 
@@ -20,7 +21,8 @@ class TestORM(helpers.TestGL):
         # Verify setting enabled in the sqlite db
         self.assertEqual(store.execute("PRAGMA foreign_keys").get_one()[0], 1)  # ON
         self.assertEqual(store.execute("PRAGMA secure_delete").get_one()[0], 1) # ON
-        self.assertEqual(store.execute("PRAGMA auto_vacuum").get_one()[0], 1)   # FULL
+        self.assertEqual(store.execute("PRAGMA auto_vacuum").get_one()[0], 2)   # INCREMENTAL
+        self.assertEqual(store.execute("PRAGMA journal_mode").get_one()[0], u'wal')
 
     @transact
     def _transaction_with_commit_close(self, store):
@@ -92,13 +94,13 @@ class TestORM(helpers.TestGL):
     def test_transact_with_stuff(self):
         receiver_id = yield self._transact_with_stuff()
         # now check data actually written
-        store = transact.get_store()
+        store = store_manager.get_store()
         self.assertEqual(store.find(Receiver, Receiver.id == receiver_id).count(), 1)
 
     @inlineCallbacks
     def test_transact_with_stuff_failing(self):
         receiver_id = yield self._transact_with_stuff_failing()
-        store = transact.get_store()
+        store = store_manager.get_store()
         self.assertEqual(list(store.find(Receiver, Receiver.id == receiver_id)), [])
 
     @inlineCallbacks
@@ -117,3 +119,79 @@ class TestORM(helpers.TestGL):
     def test_transact_ro(self):
         created_id = yield self._transact_ro_add_mail()
         yield self._transact_ro_check_mail_not_exists(created_id)
+
+    @inlineCallbacks
+    def test_transact_ro_uses_readers_pool(self):
+        @transact_ro
+        def transaction(store):
+            return store.find(Mail).count()
+
+        readers = get_orm_stats()['readers']['transactions']
+        writer = get_orm_stats()['writer']['transactions']
+
+        yield transaction()
+
+        self.assertEqual(get_orm_stats()['readers']['transactions'], readers + 1)
+        self.assertEqual(get_orm_stats()['writer']['transactions'], writer)
+        self.assertEqual(get_orm_stats()['readers']['threads'], GLSettings.orm_readers)
+
+    @inlineCallbacks
+    def test_wait_transactions(self):
+        @transact_ro
+        def transaction(store):
+            return store.find(Mail).count()
+
+        d = transaction()
+
+        yield transact.wait_transactions()
+
+        self.assertTrue(d.called)
+        self.assertEqual(transact.running, 0)
+
+    @inlineCallbacks
+    def test_store_reuse(self):
+        @transact
+        def transaction(store):
+            return id(store)
+
+        store_id = yield transaction()
+        reused = store_manager.get_stats()['reused']
+
+        self.assertEqual((yield transaction()), store_id)
+        self.assertEqual(store_manager.get_stats()['reused'], reused + 1)
+
+    @inlineCallbacks
+    def test_store_recycled_after_failure(self):
+        @transact
+        def transaction(store):
+            return id(store)
+
+        yield transaction()
+        stats = store_manager.get_stats()
+
+        yield self.assertFailure(self._transaction_with_exception(), Exception)
+        yield transaction()
+
+        self.assertEqual(store_manager.get_stats()['recycled'], stats['recycled'] + 1)
+        self.assertEqual(store_manager.get_stats()['opened'], stats['opened'] + 1)
+
+    @inlineCallbacks
+    def test_executemany(self):
+        @transact
+        def transaction(store):
+            return db_executemany(store, 'INSERT INTO mail (id, creation_date, address, subject, body, processing_attempts) '
+                                         'VALUES (?, ?, ?, ?, ?, 0)',
+                                  [(unicode(i), u'', u'', u'', u'') for i in range(10)])
+
+        @transact
+        def failing_transaction(store):
+            db_executemany(store, 'INSERT INTO mail (id, creation_date, address, subject, body, processing_attempts) '
+                                  'VALUES (?, ?, ?, ?, ?, 0)',
+                           [(u'x', u'', u'', u'', u'')])
+            raise Exception
+
+        self.assertEqual((yield transaction()), 10)
+        yield self.assertFailure(failing_transaction(), Exception)
+
+        store = store_manager.get_store()
+        self.assertEqual(store.find(Mail).count(), 10)
@@ -1,4 +1,5 @@
 import binascii
+import hashlib
 import os
 from datetime import datetime
 from twisted.trial import unittest
@@ -95,6 +96,23 @@ class TestGLSecureFiles(helpers.TestGL):
         self.assertRaises(Exception, a.write, antani)
         a.close()
 
+    def test_temporary_file_get_encryptor(self):
+        a = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
+        antani = "0123456789" * 10000
+        a.write(antani[:50005])
+        a.file.write(a.get_encryptor(50005).update(antani[50005:]))
+        self.assertTrue(antani == a.read())
+        a.close()
+
+    def test_temporary_file_get_sha256(self):
+        a = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
+        antani = "0123456789" * 10000
+        a.write(antani[:50005])
+        self.assertEqual(a.get_sha256(), hashlib.sha256(antani[:50005]).hexdigest())
+        a.write(antani[50005:])
+        self.assertEqual(a.get_sha256(), hashlib.sha256(antani).hexdigest())
+        a.close()
+
     def test_temporary_file_avoid_delete(self):
         a = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
         a.avoid_delete()
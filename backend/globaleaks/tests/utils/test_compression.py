@@ -0,0 +1,49 @@
+import gzip
+import os
+from io import BytesIO
+
+from globaleaks.tests import helpers
+from globaleaks.utils import compression
+
+
+class TestCompression(helpers.TestGL):
+    def test_select_encoding(self):
+        encodings = {'gzip': None, 'br': None}
+
+        self.assertEqual(compression.select_encoding('gzip, deflate, br', encodings), 'br')
+        self.assertEqual(compression.select_encoding('gzip, br;q=0', encodings), 'gzip')
+        self.assertEqual(compression.select_encoding('*', {'gzip': None}), 'gzip')
+        self.assertEqual(compression.select_encoding('*, gzip;q=0', {'gzip': None}), None)
+        self.assertEqual(compression.select_encoding('deflate', encodings), None)
+        self.assertEqual(compression.select_encoding(None, encodings), None)
+
+    def test_precompress_files(self):
+        root = os.path.abspath(self.mktemp())
+        dest = os.path.abspath(self.mktemp())
+        os.makedirs(os.path.join(root, 'js'))
+
+        for name, data in [('js/scripts.js', 'var x;\n' * 100),
+                           ('small.css', 'body {}'),
+                           ('logo.png', '\x89PNG' * 100)]:
+            with open(os.path.join(root, name), 'wb') as f:
+                f.write(data)
+
+        self.assertEqual(compression.precompress_files(root, dest), len(compression.available_encodings()))
+
+        variant_path = os.path.join(dest, 'js', 'scripts.js.gz')
+        self.assertEqual(gzip.GzipFile(fileobj=BytesIO(open(variant_path, 'rb').read())).read(), 'var x;\n' * 100)
+
+        # the variants are generated only once
+        self.assertEqual(compression.precompress_files(root, dest), 0)
+
+        path = os.path.join(root, 'js', 'scripts.js')
+        variants = compression.find_variants(path, os.stat(path), root, dest)
+        self.assertEqual(variants['gzip'], (variant_path, os.path.getsize(variant_path)))
+
+        compression.compression_stats.reset()
+        compression.compression_stats.record(path, 800, variants, 'gzip')
+        compression.compression_stats.record(path, 800, variants, None)
+
+        report = compression.compression_stats.get_report()
+        self.assertEqual(report[0]['responses'], 2)
+        self.assertEqual(report[0]['bytes_saved'], 800 - os.path.getsize(variant_path))
@@ -0,0 +1,51 @@
+import copy
+
+from globaleaks.tests import helpers
+from globaleaks.utils.lrucache import LRUCache, freeze
+
+
+class TestLRUCache(helpers.TestGL):
+    def test_eviction(self):
+        cache = LRUCache(30)
+
+        for x in range(3):
+            cache.set(x, x, 10)
+
+        # makes 1 the least recently used entry
+        self.assertEqual(cache.get(0), 0)
+
+        self.assertEqual(cache.set(3, 3, 10), [1])
+        self.assertEqual(cache.get(1), None)
+        self.assertEqual(cache.get(0), 0)
+        self.assertEqual(cache.get(3), 3)
+
+        # values larger than the cache are not stored
+        cache.set(4, 4, 40)
+        self.assertEqual(cache.get(4), None)
+
+        stats = cache.get_stats()
+        self.assertEqual(stats['entries'], 3)
+        self.assertEqual(stats['size'], 30)
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['evictions'], 1)
+
+        cache.delete(3)
+        self.assertEqual(cache.keys(), [2, 0])
+        self.assertEqual(cache.get_stats()['size'], 20)
+
+        cache.invalidate()
+        self.assertEqual(cache.get_stats()['size'], 0)
+        self.assertEqual(cache.get(0), None)
+
+    def test_freeze(self):
+        obj = freeze({'a': [{'b': 1}]})
+
+        self.assertRaises(TypeError, obj.__setitem__, 'a', 1)
+        self.assertRaises(TypeError, obj['a'].append, 1)
+        self.assertRaises(TypeError, obj['a'][0].update, {'b': 2})
+
+        mutable = copy.deepcopy(obj)
+        mutable['a'][0]['b'] = 2
+        self.assertEqual(obj['a'][0]['b'], 1)
+        self.assertEqual(mutable, {'a': [{'b': 2}]})
@@ -0,0 +1,85 @@
+from StringIO import StringIO
+
+from globaleaks.tests import helpers
+from globaleaks.utils.multipart import MultipartError, MultipartParser
+
+
+BOUNDARY = '----WebKitFormBoundaryAntani'
+
+
+def build_body(fields, files):
+    body = ''
+
+    for name, value in fields:
+        body += '--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' % (BOUNDARY, name, value)
+
+    for name, filename, content in files:
+        body += '--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\n' \
+                'Content-Type: application/octet-stream\r\n\r\n%s\r\n' % (BOUNDARY, name, filename, content)
+
+    return body + '--%s--\r\n' % BOUNDARY
+
+
+class TestMultipartParser(helpers.TestGL):
+    def parse(self, body, chunk_size):
+        arguments, files, sinks = {}, {}, []
+
+        def open_file(name, filename, content_type):
+            sinks.append(StringIO())
+            return sinks[-1]
+
+        parser = MultipartParser(BOUNDARY, arguments, files, open_file)
+
+        for i in range(0, len(body), chunk_size):
+            parser.feed(body[i:i + chunk_size])
+
+        parser.close()
+
+        return arguments, files
+
+    def test_parse(self):
+        # the content contains line breaks and a prefix of the delimiter
+        content = ('\r\n--' + BOUNDARY[:-1] + '\r\n') * 1000
+        body = build_body([('flowIdentifier', 'antani'), ('flowChunkNumber', '1')],
+                          [('file', 'antani.txt', content)])
+
+        for chunk_size in [1, 7, len(BOUNDARY) + 3, 4096, len(body)]:
+            arguments, files = self.parse(body, chunk_size)
+
+            self.assertEqual(arguments, {'flowIdentifier': ['antani'], 'flowChunkNumber': ['1']})
+            self.assertEqual(files['file'][0]['filename'], 'antani.txt')
+            self.assertEqual(files['file'][0]['content_type'], 'application/octet-stream')
+            self.assertEqual(files['file'][0]['size'], len(content))
+            self.assertEqual(files['file'][0]['body'].getvalue(), content)
+
+    def test_parse_buffered_data_is_bounded(self):
+        parser = MultipartParser(BOUNDARY, {}, {}, lambda *args: StringIO())
+        body = build_body([], [('file', 'antani.txt', '')])
+        parser.feed(body[:body.index('\r\n\r\n') + 4])
+
+        for _ in range(100):
+            parser.feed('A' * 65536)
+            self.assertTrue(len(parser.buffer) < len(parser.delimiter))
+
+    def test_parse_invalid(self):
+        self.assertRaises(MultipartError, MultipartParser, '', {}, {}, None)
+
+        # missing final boundary
+        body = build_body([('antani', 'antani')], [])[:-(len(BOUNDARY) + 6)]
+        self.assertRaises(MultipartError, self.parse, body, 10)
+
+        # missing name
+        body = '--%s\r\nContent-Disposition: form-data\r\n\r\nantani\r\n--%s--\r\n' % (BOUNDARY, BOUNDARY)
+        self.assertRaises(MultipartError, self.parse, body, 10)
+
+        # field too long
+        body = build_body([('antani', 'A' * (MultipartParser.max_field_size + 1))], [])
+        self.assertRaises(MultipartError, self.parse, body, 4096)
+
+        # headers not encoded in utf-8
+        body = '--%s\r\nContent-Disposition: form-data; name="\xff"\r\n\r\nantani\r\n--%s--\r\n' % (BOUNDARY, BOUNDARY)
+        self.assertRaises(MultipartError, self.parse, body, 10)
+
+        # header without a value
+        body = '--%s\r\nContent-Disposition\r\n\r\nantani\r\n--%s--\r\n' % (BOUNDARY, BOUNDARY)
+        self.assertRaises(MultipartError, self.parse, body, 10)
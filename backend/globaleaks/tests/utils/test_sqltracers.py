@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks import models
+from globaleaks.orm import transact, transact_ro
+from globaleaks.settings import GLSettings
+from globaleaks.tests import helpers
+from globaleaks.utils import sqltracers
+
+
+class TestIndexAdvisorTracer(helpers.TestGL):
+    def setUp(self):
+        self.addCleanup(sqltracers.remove_index_advisor)
+        return helpers.TestGL.setUp(self)
+
+    @transact_ro
+    def scan_query(self, store):
+        return store.find(models.Mail, models.Mail.address == u'evilaliv3@globaleaks.org').count()
+
+    @transact
+    def scan_update(self, store):
+        store.find(models.Mail, models.Mail.address == u'evilaliv3@globaleaks.org').set(processing_attempts=1)
+
+    @transact
+    def scan_delete(self, store):
+        store.find(models.Mail, models.Mail.address == u'evilaliv3@globaleaks.org').remove()
+
+    @transact_ro
+    def search_query(self, store):
+        return store.find(models.User, models.User.username == u'admin').count()
+
+    @inlineCallbacks
+    def test_full_scan_is_flagged(self):
+        sqltracers.install_index_advisor(threshold=0)
+
+        yield self.search_query()
+        self.assertEqual(sqltracers.get_index_advisor_report(), [])
+
+        yield self.scan_query()
+        yield self.scan_query()
+
+        report = sqltracers.get_index_advisor_report()
+        self.assertEqual(len(report), 1)
+        self.assertEqual(report[0]['count'], 2)
+        self.assertTrue('mail' in report[0]['tables'])
+
+    @inlineCallbacks
+    def test_full_scan_of_update_and_delete_is_flagged(self):
+        sqltracers.install_index_advisor(threshold=0)
+
+        yield self.scan_update()
+        yield self.scan_delete()
+
+        report = sqltracers.get_index_advisor_report()
+        self.assertEqual(sorted(x['statement'].split()[0] for x in report), ['DELETE', 'UPDATE'])
+
+        for x in report:
+            self.assertTrue('mail' in x['tables'])
+
+    @inlineCallbacks
+    def test_threshold(self):
+        sqltracers.install_index_advisor(threshold=1000)
+
+        yield self.scan_query()
+
+        self.assertEqual(sqltracers.get_index_advisor_report(), [])
+
+
+class TestQueryCounterTracer(helpers.TestGL):
+    def setUp(self):
+        sqltracers.query_counter_report.clear()
+        return helpers.TestGL.setUp(self)
+
+    @transact
+    def n_plus_one_query(self, store):
+        for _ in range(10):
+            store.find(models.User, models.User.username == u'admin').count()
+
+    @inlineCallbacks
+    def n_plus_one_queries(self):
+        yield self.n_plus_one_query()
+
+        # the code resumed by a transaction is still accounted to the caller
+        yield self.n_plus_one_query()
+
+    @inlineCallbacks
+    def test_queries_are_accounted(self):
+        query_stats = sqltracers.QueryStats('Test')
+
+        yield sqltracers.run_with_query_stats(query_stats, self.n_plus_one_queries)
+
+        # the twenty lookups and the two COMMIT
+        self.assertEqual(query_stats.count, 22)
+        self.assertEqual(len(query_stats.get_repeated_statements(10)), 1)
+
+        sqltracers.record_query_stats('GET', query_stats)
+
+        report = sqltracers.get_query_counter_report()
+        self.assertEqual(report[0]['endpoint'], 'GET Test')
+        self.assertEqual(report[0]['queries'], 22)
+        self.assertEqual(len(report[0]['repeated_statements']), 1)
+
+    @inlineCallbacks
+    def test_query_budget(self):
+        query_stats = sqltracers.QueryStats('Test', 15)
+
+        # the budget is exceeded by the second transaction of the caller
+        yield self.assertFailure(sqltracers.run_with_query_stats(query_stats, self.n_plus_one_queries),
+                                 AssertionError)
+
+        self.patch(GLSettings, 'query_budget_strict', False)
+
+        query_stats = sqltracers.QueryStats('Test', 15)
+        yield sqltracers.run_with_query_stats(query_stats, self.n_plus_one_queries)
@@ -53,3 +53,19 @@ class TestTempDict(helpers.TestGL):
                 self.assertEqual(len(xxx), size_limit)
                 self.assertEqual(xxx.get(x - size_limit + 1).id, x - size_limit + 1)
                 self.assertEqual(xxx.get(x - size_limit), None)
+
+    def test_delete(self):
+        xxx = TempDict(timeout=10)
+
+        xxx.set(1, TestObject(1))
+        xxx.delete(1)
+
+        self.test_reactor.advance(5)
+
+        # the key set again is not expired by the timer of the deleted value
+        xxx.set(1, TestObject(1))
+        self.test_reactor.advance(5)
+        self.assertEqual(len(xxx), 1)
+
+        self.test_reactor.advance(5)
+        self.assertEqual(len(xxx), 0)
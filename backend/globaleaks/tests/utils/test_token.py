@@ -5,6 +5,7 @@ from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.anomaly import Alarm
 from globaleaks.rest import errors
+from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
 from globaleaks.tests.test_anomaly import pollute_events_for_testing
 from globaleaks.utils.token import Token, TokenList
@@ -67,6 +68,21 @@ class TestToken(helpers.TestGL):
             for f in file_list:
                 self.assertFalse(os.path.exists(f))
 
+    def test_human_captcha_on_uploads_stress(self):
+        self.patch(GLSettings.memory_copy, 'enable_captcha', True)
+
+        Alarm.reset()
+
+        st = Token('submission')
+        st.generate_token_challenge()
+        self.assertFalse(st.human_captcha)
+
+        Alarm.stress_levels['uploads'] = 1
+
+        st = Token('submission')
+        st.generate_token_challenge()
+        self.assertTrue(st.human_captcha)
+
     def test_token_update_right_answer(self):
         token = Token('submission')
 
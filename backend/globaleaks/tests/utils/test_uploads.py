@@ -0,0 +1,207 @@
+import hashlib
+import os
+
+from cyclone.httpserver import HTTPRequest
+from cyclone.httputil import HTTPHeaders
+
+from globaleaks.anomaly import Alarm
+from globaleaks.rest import errors
+from globaleaks.settings import GLSettings
+from globaleaks.tests import helpers
+from globaleaks.utils.uploads import UploadError, upload_admission, upload_flows
+
+
+def get_request(chunk_number, chunk_size, total_size, session='session', flow_identifier='antani'):
+    request = HTTPRequest('POST', '/wbtip/upload', headers=HTTPHeaders({'X-Session': session}))
+
+    request.arguments = {
+        'flowIdentifier': [flow_identifier],
+        'flowChunkNumber': [str(chunk_number)],
+        'flowChunkSize': [str(chunk_size)],
+        'flowTotalSize': [str(total_size)]
+    }
+
+    return request
+
+
+class TestUploadFlowManager(helpers.TestGL):
+    def test_out_of_order_and_parallel_chunks(self):
+        content = '0123456789' * 1000
+        chunk_size = 3000
+
+        chunks = []
+        for number in [4, 2, 1, 3]:
+            chunks.append(upload_flows.open_chunk(get_request(number, chunk_size, len(content))))
+
+        # the chunks are written interleaved as by concurrent requests
+        for i in range(0, chunk_size, 100):
+            for chunk in chunks:
+                chunk.write(content[chunk.offset + i:min(chunk.offset + i + 100, chunk.offset + chunk_size, len(content))])
+
+        stats = upload_flows.get_stats()
+        self.assertEqual(stats['active_flows'], 1)
+        self.assertEqual(stats['active_chunks'], 4)
+        self.assertEqual(stats['bytes_in_flight'], len(content))
+        self.assertEqual(stats['bytes_received'], 0)
+
+        flow = chunks[0].flow
+        for chunk in chunks:
+            self.assertFalse(flow.is_complete())
+            chunk.close()
+
+        self.assertTrue(flow.is_complete())
+        self.assertEqual(flow.get_sha256(), hashlib.sha256(content).hexdigest())
+        self.assertEqual(upload_flows.complete(flow).read(), content)
+
+        stats = upload_flows.get_stats()
+        self.assertEqual(stats['active_flows'], 0)
+        self.assertEqual(stats['bytes_in_flight'], 0)
+        self.assertEqual(stats['completed'], 1)
+
+    def test_hash_of_resent_chunks(self):
+        content = '0123456789' * 1000
+        chunk_size = 5000
+
+        chunk1 = upload_flows.open_chunk(get_request(1, chunk_size, len(content)))
+        chunk2 = upload_flows.open_chunk(get_request(2, chunk_size, len(content)))
+        chunk1.write('A' * chunk_size)
+        chunk2.write(content[chunk_size:])
+        chunk2.close()
+
+        # the plaintext of an interrupted chunk is not kept in the hash
+        chunk1.abort()
+
+        chunk1 = upload_flows.open_chunk(get_request(1, chunk_size, len(content)))
+        chunk1.write(content[:chunk_size])
+        chunk1.close()
+
+        flow = chunk1.flow
+        self.assertTrue(flow.is_complete())
+        self.assertEqual(flow.get_sha256(), hashlib.sha256(content).hexdigest())
+        self.assertEqual(upload_flows.complete(flow).read(), content)
+
+    def test_chunk_exceeding_total_size(self):
+        chunk = upload_flows.open_chunk(get_request(1, 10, 10))
+        self.assertRaises(UploadError, chunk.write, 'A' * 11)
+
+        self.assertRaises(errors.InvalidInputFormat, upload_flows.open_chunk, get_request(2, 10, 10))
+        self.assertRaises(errors.InvalidInputFormat, upload_flows.open_chunk, get_request(1, 10, 20))
+
+    def test_flows_are_bound_to_the_session(self):
+        chunk1 = upload_flows.open_chunk(get_request(1, 10, 20, session='session1'))
+        chunk2 = upload_flows.open_chunk(get_request(1, 10, 20, session='session2'))
+
+        self.assertNotEqual(chunk1.flow, chunk2.flow)
+
+    def test_quotas(self):
+        self.patch(GLSettings, 'upload_flows_limit_per_owner', 2)
+        self.patch(GLSettings, 'upload_disk_quota', 250)
+
+        upload_flows.open_chunk(get_request(1, 100, 100, flow_identifier='1'))
+        upload_flows.open_chunk(get_request(1, 100, 100, flow_identifier='2'))
+
+        self.assertRaises(errors.UploadQuotaExceeded, upload_flows.open_chunk,
+                          get_request(1, 100, 100, flow_identifier='3'))
+
+        self.assertRaises(errors.UploadQuotaExceeded, upload_flows.open_chunk,
+                          get_request(1, 100, 100, session='session2'))
+
+        upload_flows.open_chunk(get_request(1, 50, 50, session='session2'))
+
+        stats = upload_flows.get_stats()
+        self.assertEqual(stats['active_flows'], 3)
+        self.assertEqual(stats['bytes_reserved'], 250)
+        self.assertEqual(stats['rejected'], 2)
+
+    def test_expiration(self):
+        chunk = upload_flows.open_chunk(get_request(1, 10, 20))
+        filepath, keypath = chunk.flow.file.filepath, chunk.flow.file.keypath
+
+        # the expiration is postponed while a chunk is being received
+        self.test_reactor.advance(GLSettings.upload_flow_ttl)
+        self.assertEqual(len(upload_flows), 1)
+
+        chunk.close()
+
+        self.test_reactor.advance(GLSettings.upload_flow_ttl)
+        self.assertEqual(len(upload_flows), 0)
+        self.assertEqual(upload_flows.get_stats()['expired'], 1)
+
+        self.assertFalse(os.path.exists(filepath))
+        self.assertFalse(os.path.exists(keypath))
+
+    def test_flow_recreated_after_discard(self):
+        chunk = upload_flows.open_chunk(get_request(1, 10, 20))
+        upload_flows.discard(chunk.flow)
+
+        self.test_reactor.advance(GLSettings.upload_flow_ttl - 1)
+
+        # the flow sent again with the same identifier
+        chunk = upload_flows.open_chunk(get_request(1, 10, 20))
+        chunk.write('A' * 10)
+        chunk.close()
+
+        # is not expired by the timer of the discarded one
+        self.test_reactor.advance(1)
+        self.assertEqual(len(upload_flows), 1)
+        self.assertFalse(chunk.flow.closed)
+
+        self.test_reactor.advance(GLSettings.upload_flow_ttl - 1)
+        self.assertEqual(len(upload_flows), 0)
+        self.assertTrue(chunk.flow.closed)
+
+
+class TestUploadAdmissionController(helpers.TestGL):
+    def setUp(self):
+        self.patch(GLSettings, 'upload_admission_budget', 100)
+        self.patch(GLSettings, 'upload_admission_queue_size', 2)
+        return helpers.TestGL.setUp(self)
+
+    def test_admission(self):
+        request1 = get_request(1, 100, 80, flow_identifier='1')
+        request2 = get_request(1, 100, 50, flow_identifier='2')
+        request3 = get_request(1, 100, 10, flow_identifier='3')
+
+        self.assertEqual(upload_admission.admit(request1), None)
+        chunk = upload_flows.open_chunk(request1)
+        self.assertEqual(Alarm.stress_levels['uploads'], 0)
+
+        # the chunks of the flows in progress are always admitted
+        self.assertEqual(upload_admission.admit(get_request(2, 100, 80, flow_identifier='1')), None)
+
+        admitted = []
+        d2 = upload_admission.admit(request2)
+        d2.addCallback(lambda _: admitted.append(upload_flows.open_chunk(request2)))
+        self.assertEqual(Alarm.stress_levels['uploads'], 1)
+
+        # the uploads are admitted in order even if they would fit
+        d3 = upload_admission.admit(request3)
+        d3.addCallback(lambda _: admitted.append(upload_flows.open_chunk(request3)))
+        self.assertEqual(Alarm.stress_levels['uploads'], 2)
+
+        e = self.assertRaises(errors.UploadBudgetExceeded, upload_admission.admit,
+                              get_request(1, 100, 10, flow_identifier='4'))
+        self.assertEqual(e.retry_after, GLSettings.upload_admission_retry_after)
+
+        upload_flows.discard(chunk.flow)
+
+        self.assertEqual(len(admitted), 2)
+        self.assertEqual(Alarm.stress_levels['uploads'], 0)
+
+        stats = upload_admission.get_stats()
+        self.assertEqual(stats['bytes_reserved'], 60)
+        self.assertEqual(stats['admitted'], 4)
+        self.assertEqual(stats['queued'], 2)
+        self.assertEqual(stats['refused'], 1)
+        self.assertEqual(stats['max_queue_length'], 2)
+
+    def test_admission_timeout(self):
+        upload_flows.open_chunk(get_request(1, 100, 100, flow_identifier='1'))
+
+        d = upload_admission.admit(get_request(1, 100, 10, flow_identifier='2'))
+
+        self.test_reactor.advance(GLSettings.upload_admission_queue_timeout)
+
+        self.assertEqual(upload_admission.get_stats()['queue_length'], 0)
+
+        return self.assertFailure(d, errors.UploadBudgetExceeded)
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+#
+#   compression
+#   ***********
+#
+# Precompression of the static files served by the backend and negotiation
+# of the content encodings accepted by the clients.
+import gzip
+import mimetypes
+import os
+import threading
+from io import BytesIO
+
+try:
+    import brotli # optional, the brotli variants are otherwise not generated
+except ImportError:
+    brotli = None
+
+from globaleaks.utils.utility import log
+
+# extensions of the files holding the precompressed variants of a file
+# in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+COMPRESSIBLE_TYPES = set([
+    'text/plain', 'text/html', 'text/css', 'text/xml', 'text/javascript',
+    'application/javascript', 'application/x-javascript', 'application/json',
+    'application/xml', 'image/svg+xml', 'image/x-icon',
+    'application/vnd.ms-fontobject', 'application/x-font-ttf'
+])
+
+# smaller files do not gain from the compression
+MIN_LENGTH = 256
+
+
+def is_compressible(path):
+    return mimetypes.guess_type(path)[0] in COMPRESSIBLE_TYPES
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data)
+
+    output = BytesIO()
+    with gzip.GzipFile(fileobj=output, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(data)
+
+    return output.getvalue()
+
+
+def available_encodings():
+    return [(encoding, ext) for encoding, ext in ENCODINGS if encoding != 'br' or brotli is not None]
+
+
+def precompress_files(root, dest):
+    """
+    Writes in dest the missing or outdated precompressed variants of the
+    compressible files of root that do not have a sidecar file next to
+    them, keeping the relative paths of the files.
+
+    This is intended to be run once at startup out of the reactor thread.
+    """
+    count = 0
+
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+
+            if not is_compressible(path) or os.path.getsize(path) < MIN_LENGTH:
+                continue
+
+            data = None
+
+            for encoding, ext in available_encodings():
+                if os.path.exists(path + ext):
+                    continue
+
+                variant_path = os.path.join(dest, os.path.relpath(path, root)) + ext
+
+                if os.path.exists(variant_path) and \
+                   os.path.getmtime(variant_path) >= os.path.getmtime(path):
+                    continue
+
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+
+                if not os.path.isdir(os.path.dirname(variant_path)):
+                    os.makedirs(os.path.dirname(variant_path))
+
+                # the variant is written aside and then moved in place so
+                # that it is never served partially written
+                with open(variant_path + '.tmp', 'wb') as f:
+                    f.write(compress(data, encoding))
+
+                os.rename(variant_path + '.tmp', variant_path)
+
+                count += 1
+
+    log.debug("Precompressed %d variants of the files of %s" % (count, root))
+
+    return count
+
+
+def find_variants(path, st, root, dest):
+    """
+    Returns the paths of the precompressed variants of the given file that
+    are not older than it, looking for sidecar files next to it and then
+    for the files generated by precompress_files.
+    """
+    variants = {}
+
+    if not is_compressible(path):
+        return variants
+
+    for encoding, ext in ENCODINGS:
+        candidates = [path + ext]
+
+        if dest is not None and path.startswith(os.path.join(root, '')):
+            candidates.append(os.path.join(dest, os.path.relpath(path, root)) + ext)
+
+        for candidate in candidates:
+            try:
+                variant_st = os.stat(candidate)
+            except OSError:
+                continue
+
+            if variant_st.st_mtime >= st.st_mtime and variant_st.st_size < st.st_size:
+                variants[encoding] = (candidate, variant_st.st_size)
+                break
+
+    return variants
+
+
+def parse_accept_encoding(value):
+    """
+    Returns the set of the content encodings accepted by the client
+    """
+    accepted = set()
+    refused = set()
+
+    for item in value.split(','):
+        parts = item.strip().split(';')
+        encoding = parts[0].strip().lower()
+
+        q = 1.0
+        for param in parts[1:]:
+            name, _, param_value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(param_value)
+                except ValueError:
+                    q = 0.0
+
+        if encoding:
+            (accepted if q > 0 else refused).add(encoding)
+
+    if '*' in accepted:
+        accepted.update(encoding for encoding, _ in ENCODINGS)
+
+    return accepted - refused
+
+
+def select_encoding(value, encodings):
+    """
+    Returns the preferred of the given encodings that is accepted by the
+    client or None if the identity should be used
+    """
+    if not value:
+        return None
+
+    accepted = parse_accept_encoding(value)
+
+    for encoding, _ in ENCODINGS:
+        if encoding in encodings and encoding in accepted:
+            return encoding
+
+    return None
+
+
+class CompressionStats(object):
+    """
+    Keeps track for each static file of the size of its variants and of
+    the bytes saved by serving them.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.files = {}
+
+    def record(self, path, size, variants, encoding):
+        with self.lock:
+            entry = self.files.setdefault(path, {'responses': 0, 'compressed_responses': 0, 'bytes_saved': 0})
+
+            entry['size'] = size
+            entry['variants'] = dict((e, v[1]) for e, v in variants.items())
+            entry['responses'] += 1
+
+            if encoding is not None:
+                entry['compressed_responses'] += 1
+                entry['bytes_saved'] += size - variants[encoding][1]
+
+    def get_report(self):
+        with self.lock:
+            report = []
+
+            for path, entry in self.files.items():
+                report.append({
+                    'path': path,
+                    'size': entry['size'],
+                    'ratios': dict((e, float(s) / entry['size']) for e, s in entry['variants'].items()),
+                    'responses': entry['responses'],
+                    'compressed_responses': entry['compressed_responses'],
+                    'bytes_saved': entry['bytes_saved']
+                })
+
+            return sorted(report, key=lambda x: x['bytes_saved'], reverse=True)
+
+
+compression_stats = CompressionStats()
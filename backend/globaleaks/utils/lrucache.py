@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#   lrucache
+#   ********
+#
+# Least recently used cache bounded by the overall size of its values
+# and immutable containers for the values shared by its users
+import threading
+
+from collections import OrderedDict
+
+
+class ImmutableDict(dict):
+    """
+    Dictionary raising on any modification; a deepcopy of it returns a
+    mutable copy.
+    """
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("%s is immutable" % type(self).__name__)
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+
+class ImmutableList(list):
+    """
+    List raising on any modification; a deepcopy of it returns a mutable
+    copy.
+    """
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("%s is immutable" % type(self).__name__)
+
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = __iadd__ = __imul__ = \
+        append = extend = insert = pop = remove = reverse = sort = _immutable
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+
+def freeze(obj):
+    """
+    Returns an immutable copy of a structure of dicts and lists
+    """
+    if isinstance(obj, dict):
+        return ImmutableDict((k, freeze(v)) for k, v in obj.iteritems())
+
+    if isinstance(obj, list):
+        return ImmutableList(freeze(v) for v in obj)
+
+    return obj
+
+
+def thaw(obj):
+    """
+    Returns a mutable copy of a structure of dicts and lists
+    """
+    if isinstance(obj, dict):
+        return dict((k, thaw(v)) for k, v in obj.iteritems())
+
+    if isinstance(obj, list):
+        return [thaw(v) for v in obj]
+
+    return obj
+
+
+class LRUCache(object):
+    """
+    Cache evicting the least recently used entries when the overall size
+    of its values exceeds max_size; the size of each value is provided
+    by the caller.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            # move the entry to the end as the most recently used
+            self.entries[key] = entry
+            self.hits += 1
+
+            return entry[0]
+
+    def set(self, key, value, size):
+        """
+        Stores the value returning the keys of the entries evicted for it
+        """
+        evicted = []
+
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1]
+
+            if size > self.max_size:
+                return evicted
+
+            self.entries[key] = (value, size)
+            self.size += size
+
+            while self.size > self.max_size:
+                evicted_key, entry = self.entries.popitem(last=False)
+                self.size -= entry[1]
+                self.evictions += 1
+                evicted.append(evicted_key)
+
+        return evicted
+
+    def delete(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1]
+
+    def keys(self):
+        with self.lock:
+            return self.entries.keys()
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'size': self.size,
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
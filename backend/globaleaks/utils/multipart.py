@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+#   multipart
+#   *********
+#
+# Incremental parser of the multipart/form-data bodies that hands the
+# content of the file parts to a sink as soon as it is received, keeping
+# in memory only the fields and a tail as long as the boundary.
+from cyclone.httputil import HTTPHeaders, _parse_header
+
+
+class MultipartError(Exception):
+    pass
+
+
+class MultipartParser(object):
+    """
+    Parses a multipart/form-data body fed in chunks of any size.
+
+    The values of the fields are stored in arguments as cyclone does,
+    while for each file part open_file(name, filename, content_type) is
+    called to get the object whose write() receives its content or None
+    to discard it; the files are listed in files along with their size.
+
+    An exception raised by open_file leaves the part to be parsed again,
+    so that the parsing could be suspended and resumed by a later feed().
+    """
+    max_headers_size = 16 * 1024
+    max_field_size = 64 * 1024
+
+    def __init__(self, boundary, arguments, files, open_file):
+        if boundary.startswith('"') and boundary.endswith('"'):
+            boundary = boundary[1:-1]
+
+        if not boundary:
+            raise MultipartError("Missing multipart/form-data boundary")
+
+        self.delimiter = '\r\n--' + boundary
+        self.arguments = arguments
+        self.files = files
+        self.open_file = open_file
+
+        # the first delimiter is not preceded by a line break
+        self.buffer = '\r\n'
+        self.state = 'preamble'
+        self.part = None
+
+    def feed(self, data):
+        self.buffer += data
+
+        while self.buffer:
+            if self.state in ('preamble', 'body'):
+                idx = self.buffer.find(self.delimiter)
+                if idx == -1:
+                    # the tail could be the beginning of a delimiter
+                    keep = len(self.delimiter) - 1
+                    if len(self.buffer) > keep:
+                        self.write_part(self.buffer[:-keep])
+                        self.buffer = self.buffer[-keep:]
+                    return
+
+                self.write_part(self.buffer[:idx])
+                self.end_part()
+                self.buffer = self.buffer[idx + len(self.delimiter):]
+                self.state = 'delimiter'
+
+            elif self.state == 'delimiter':
+                if len(self.buffer) < 2:
+                    return
+
+                if self.buffer.startswith('--'):
+                    self.state = 'end'
+                elif self.buffer.startswith('\r\n'):
+                    self.state = 'headers'
+                else:
+                    raise MultipartError("Invalid multipart/form-data delimiter")
+
+                self.buffer = self.buffer[2:]
+
+            elif self.state == 'headers':
+                idx = self.buffer.find('\r\n\r\n')
+                if idx == -1:
+                    if len(self.buffer) > self.max_headers_size:
+                        raise MultipartError("multipart/form-data headers too long")
+                    return
+
+                self.start_part(self.buffer[:idx + 2])
+                self.buffer = self.buffer[idx + 4:]
+                self.state = 'body'
+
+            else:
+                # the epilogue is ignored
+                self.buffer = ''
+
+    def close(self):
+        if self.state != 'end':
+            raise MultipartError("Invalid multipart/form-data: no final boundary")
+
+    def start_part(self, data):
+        try:
+            headers = HTTPHeaders.parse(data.decode('utf-8'))
+        except ValueError:
+            # undecodable or malformed headers (UnicodeDecodeError is a ValueError)
+            raise MultipartError("Invalid multipart/form-data part headers")
+
+        disposition, params = _parse_header(headers.get('Content-Disposition', ''))
+
+        if disposition != 'form-data' or not params.get('name'):
+            raise MultipartError("Invalid multipart/form-data part")
+
+        self.part = {'name': params['name']}
+
+        if params.get('filename'):
+            content_type = headers.get('Content-Type', 'application/unknown')
+
+            self.part['file'] = {
+                'filename': params['filename'],
+                'content_type': content_type,
+                'body': self.open_file(params['name'], params['filename'], content_type),
+                'size': 0
+            }
+        else:
+            self.part['value'] = ''
+
+    def write_part(self, data):
+        if self.state != 'body' or not data:
+            return
+
+        if 'file' in self.part:
+            if self.part['file']['body'] is not None:
+                self.part['file']['body'].write(data)
+
+            self.part['file']['size'] += len(data)
+        else:
+            if len(self.part['value']) + len(data) > self.max_field_size:
+                raise MultipartError("multipart/form-data field too long")
+
+            self.part['value'] += data
+
+    def end_part(self):
+        if self.state != 'body':
+            return
+
+        if 'file' in self.part:
+            self.files.setdefault(self.part['name'], []).append(self.part['file'])
+        elif self.part['value']:
+            self.arguments.setdefault(self.part['name'], []).append(self.part['value'])
+
+        self.part = None
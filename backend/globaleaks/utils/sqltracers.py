@@ -0,0 +1,409 @@
+# -*- coding: UTF-8
+#   sqltracers
+#   **********
+#
+# Storm tracers used to analyze the queries issued by the backend
+import collections
+import re
+import threading
+import time
+
+from storm.tracer import install_tracer, remove_tracer_type
+from twisted.internet.defer import Deferred
+
+from globaleaks.settings import GLSettings
+from globaleaks.utils.utility import log, datetime_now, datetime_to_ISO8601
+
+
+class IndexAdvisorTracer(object):
+    """
+    Development tracer executing EXPLAIN QUERY PLAN on the issued queries
+    and flagging the ones performing a full scan of tables with more rows
+    than the configured threshold.
+    """
+    scan_regexp = re.compile(r'^SCAN (?:TABLE )?(\w+)$')
+
+    # the statements that could not be explained or that do not access tables
+    skipped_statements = ('BEGIN', 'COMMIT', 'END', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'PRAGMA', 'VACUUM')
+
+    # seconds for which the count of the rows of a table is reused
+    rows_count_ttl = 60
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.plans = {}
+        self.rows_count = {}
+        self.report = {}
+
+    def connection_raw_execute(self, connection, raw_cursor, statement, params):
+        words = statement.split(None, 1)
+        if not words or words[0].upper() in self.skipped_statements:
+            return
+
+        raw_connection = connection._raw_connection
+        params = tuple(connection.to_database(params))
+
+        try:
+            scanned_tables = self.get_scanned_tables(raw_connection, statement, params)
+
+            large_tables = {}
+            for table in scanned_tables:
+                rows = self.get_rows_count(raw_connection, table)
+                if rows >= self.threshold:
+                    large_tables[table] = rows
+        except Exception as excep:
+            log.debug("Index advisor unable to analyze query %s: %s" % (statement, excep))
+            return
+
+        if large_tables:
+            self.flag(statement, large_tables)
+
+    def get_scanned_tables(self, raw_connection, statement, params):
+        with self.lock:
+            if statement in self.plans:
+                return self.plans[statement]
+
+        scanned_tables = []
+        for row in raw_connection.execute("EXPLAIN QUERY PLAN " + statement, params):
+            # the detail of the step is always the last column
+            match = self.scan_regexp.match(row[-1])
+            if match:
+                scanned_tables.append(match.group(1))
+
+        with self.lock:
+            self.plans[statement] = scanned_tables
+
+        return scanned_tables
+
+    def get_rows_count(self, raw_connection, table):
+        now = time.time()
+
+        with self.lock:
+            if table in self.rows_count and now - self.rows_count[table][1] < self.rows_count_ttl:
+                return self.rows_count[table][0]
+
+        rows = raw_connection.execute("SELECT COUNT(*) FROM %s" % table).fetchone()[0]
+
+        with self.lock:
+            self.rows_count[table] = (rows, now)
+
+        return rows
+
+    def flag(self, statement, tables):
+        with self.lock:
+            if statement not in self.report:
+                log.info("Index advisor: full scan of %s in query: %s" %
+                         (', '.join('%s (%d rows)' % x for x in tables.iteritems()), statement))
+
+                self.report[statement] = {
+                    'statement': statement,
+                    'tables': {},
+                    'count': 0
+                }
+
+            self.report[statement]['tables'].update(tables)
+            self.report[statement]['count'] += 1
+
+    def get_report(self):
+        with self.lock:
+            return sorted([dict(x) for x in self.report.values()],
+                          key=lambda x: x['count'], reverse=True)
+
+
+index_advisor = None
+
+
+def install_index_advisor(threshold=None):
+    global index_advisor
+
+    if threshold is None:
+        threshold = GLSettings.index_advisor_threshold
+
+    remove_tracer_type(IndexAdvisorTracer)
+
+    index_advisor = IndexAdvisorTracer(threshold)
+    install_tracer(index_advisor)
+
+    return index_advisor
+
+
+def remove_index_advisor():
+    global index_advisor
+
+    remove_tracer_type(IndexAdvisorTracer)
+
+    index_advisor = None
+
+
+def get_index_advisor_report():
+    return index_advisor.get_report() if index_advisor is not None else []
+
+
+class QueryStats(object):
+    """
+    Keeps track of the queries issued on behalf of a request or of a job
+    """
+    def __init__(self, name, budget=None):
+        self.name = name
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.count = 0
+        self.time = 0.0
+        self.statements = {}
+
+    def record(self, statement, run_time):
+        with self.lock:
+            self.count += 1
+            self.time += run_time
+            self.statements[statement] = self.statements.get(statement, 0) + 1
+
+    def get_repeated_statements(self, threshold):
+        """
+        Returns the statements issued at least threshold times; these are
+        usually caused by references loaded lazily inside a loop (N+1)
+        """
+        with self.lock:
+            return sorted([(s, c) for s, c in self.statements.iteritems() if c >= threshold],
+                          key=lambda x: x[1], reverse=True)
+
+    def check_budget(self):
+        if GLSettings.query_budget_strict and \
+                self.budget is not None and self.count > self.budget:
+            raise AssertionError("%s exceeded its budget of %d queries with %d queries" %
+                                 (self.name, self.budget, self.count))
+
+
+# the transaction executed by a worker thread or, on the reactor thread,
+# the QueryStats of the request or job whose code is being run
+current = threading.local()
+
+
+def set_current_transaction(function, query_stats):
+    """
+    Binds to the current thread the transaction being executed so that
+    its queries could be accounted to it
+    """
+    current.function = function
+    current.query_stats = query_stats
+
+
+def get_current_query_stats():
+    return getattr(current, 'query_stats', None)
+
+
+def run_with_query_stats(query_stats, function, *args, **kwargs):
+    """
+    Runs the function accounting to the given QueryStats the queries of
+    the transactions it starts
+    """
+    previous = get_current_query_stats()
+    current.query_stats = query_stats
+
+    try:
+        return function(*args, **kwargs)
+    finally:
+        current.query_stats = previous
+
+
+def resume_with_query_stats(d, query_stats):
+    """
+    Returns a Deferred fired with the result of d whose callbacks are run
+    with the given QueryStats bound, so that the code resumed after a
+    transaction keeps accounting its queries to the same request or job
+    """
+    resumed = Deferred()
+    d.addBoth(lambda result: run_with_query_stats(query_stats, resumed.callback, result))
+    return resumed
+
+
+class TimingTracer(object):
+    """
+    Base class for the tracers measuring the execution time of the queries;
+    the subclasses override executed() that by default ignores the timings.
+    """
+    def __init__(self):
+        self.local = threading.local()
+
+    def connection_raw_execute(self, connection, raw_cursor, statement, params):
+        self.local.start_time = time.time()
+
+    def connection_raw_execute_success(self, connection, raw_cursor, statement, params):
+        self.executed(connection, statement, params, time.time() - self.local.start_time)
+
+    def connection_raw_execute_error(self, connection, raw_cursor, statement, params, error):
+        self.executed(connection, statement, params, time.time() - self.local.start_time)
+
+    def executed(self, connection, statement, params, run_time):
+        pass
+
+
+class QueryCounterTracer(TimingTracer):
+    """
+    Tracer attributing each query to the QueryStats of the transaction
+    being executed by the current thread.
+    """
+    def executed(self, connection, statement, params, run_time):
+        query_stats = getattr(current, 'query_stats', None)
+        if query_stats is not None:
+            query_stats.record(statement, run_time)
+
+
+query_counter_report = {}
+
+
+def install_query_counter():
+    remove_tracer_type(QueryCounterTracer)
+
+    install_tracer(QueryCounterTracer())
+
+
+def remove_query_counter():
+    remove_tracer_type(QueryCounterTracer)
+
+
+def record_query_stats(method, query_stats):
+    """
+    Accounts the queries of a completed request or job in the report of its
+    endpoint logging the statements repeated more than n_plus_one_threshold
+    times as they are likely N+1 patterns.
+    """
+    endpoint = '%s %s' % (method, query_stats.name)
+
+    if endpoint not in query_counter_report:
+        query_counter_report[endpoint] = {
+            'endpoint': endpoint,
+            'runs': 0,
+            'queries': 0,
+            'max_queries': 0,
+            'sql_time': 0.0,
+            'repeated_statements': {}
+        }
+
+    report = query_counter_report[endpoint]
+    report['runs'] += 1
+    report['queries'] += query_stats.count
+    report['max_queries'] = max(report['max_queries'], query_stats.count)
+    report['sql_time'] += query_stats.time
+
+    for statement, count in query_stats.get_repeated_statements(GLSettings.n_plus_one_threshold):
+        if statement not in report['repeated_statements']:
+            log.info("Query counter: %s issued %d times the query: %s" % (endpoint, count, statement))
+
+        report['repeated_statements'][statement] = max(count, report['repeated_statements'].get(statement, 0))
+
+
+def get_query_counter_report():
+    return sorted([{
+        'endpoint': x['endpoint'],
+        'runs': x['runs'],
+        'queries': x['queries'],
+        'mean_queries': float(x['queries']) / x['runs'],
+        'max_queries': x['max_queries'],
+        'sql_time': x['sql_time'],
+        'repeated_statements': [{'statement': s, 'count': c} for s, c in x['repeated_statements'].iteritems()]
+    } for x in query_counter_report.values()], key=lambda x: x['queries'], reverse=True)
+
+
+def get_param_shape(param):
+    """
+    Describes a bind parameter by its type and size without disclosing
+    its value
+    """
+    if param is None:
+        return 'NULL'
+
+    if isinstance(param, (str, unicode, buffer)):
+        return '%s(%d)' % (type(param).__name__, len(param))
+
+    return type(param).__name__
+
+
+class SlowQueryTracer(TimingTracer):
+    """
+    Tracer keeping in a bounded ring the queries that took more than the
+    configured threshold together with their query plan.
+
+    For SELECT queries the measured time is the one needed to produce the
+    first row as the following ones are fetched lazily by Storm.
+    """
+    def __init__(self, threshold, size):
+        TimingTracer.__init__(self)
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.plans = {}
+        self.log = collections.deque(maxlen=size)
+
+    def executed(self, connection, statement, params, run_time):
+        if run_time < self.threshold:
+            return
+
+        params = tuple(connection.to_database(params))
+
+        self.record({
+            'statement': statement,
+            'params': [get_param_shape(param) for param in params],
+            'function': getattr(current, 'function', None),
+            'run_time': run_time,
+            'date': datetime_to_ISO8601(datetime_now()),
+            'plan': self.get_plan(connection._raw_connection, statement, params)
+        })
+
+    def get_plan(self, raw_connection, statement, params):
+        with self.lock:
+            if statement in self.plans:
+                return self.plans[statement]
+
+        try:
+            plan = [row[-1] for row in raw_connection.execute("EXPLAIN QUERY PLAN " + statement, params)]
+        except Exception:
+            # statements like COMMIT could not be explained
+            plan = []
+
+        with self.lock:
+            self.plans[statement] = plan
+
+        return plan
+
+    def record(self, entry):
+        log.info("Slow query: %.4f seconds in %s: %s" %
+                 (entry['run_time'], entry['function'], entry['statement']))
+
+        with self.lock:
+            self.log.append(entry)
+
+    def get_log(self):
+        with self.lock:
+            return list(reversed(self.log))
+
+
+slow_query_log = None
+
+
+def install_slow_query_log(threshold=None, size=None):
+    global slow_query_log
+
+    if threshold is None:
+        threshold = GLSettings.slow_query_threshold
+
+    if size is None:
+        size = GLSettings.slow_query_log_size
+
+    remove_tracer_type(SlowQueryTracer)
+
+    slow_query_log = SlowQueryTracer(threshold, size)
+    install_tracer(slow_query_log)
+
+    return slow_query_log
+
+
+def remove_slow_query_log():
+    global slow_query_log
+
+    remove_tracer_type(SlowQueryTracer)
+
+    slow_query_log = None
+
+
+def get_slow_query_log():
+    return slow_query_log.get_log() if slow_query_log is not None else []
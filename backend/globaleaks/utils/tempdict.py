@@ -29,6 +29,9 @@ class TempDict(OrderedDict):
         return self.size_limit
 
     def set(self, key, value):
+        if key in self and self[key] is not value:
+            self._cancel_expire(self[key])
+
         timeout = self.get_timeout()
         if timeout is not None:
             if test_reactor is None:
@@ -53,18 +56,20 @@ class TempDict(OrderedDict):
 
     def delete(self, key):
         if key in self:
-            try:
-                self[key].expireCall.stop()
-            except:
-                pass
+            self._cancel_expire(self[key])
 
             del self[key]
 
+    def _cancel_expire(self, value):
+        # a call left pending would expire the value later set with the same key
+        if value.expireCall is not None and value.expireCall.active():
+            value.expireCall.cancel()
+
     def _check_size_limit(self):
         size_limit = self.get_size_limit()
         if size_limit is not None:
             while len(self) > size_limit:
-                self.popitem(last=False)
+                self._cancel_expire(self.popitem(last=False)[1])
 
     def _expire(self, key):
         if key in self:
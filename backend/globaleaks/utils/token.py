@@ -125,7 +125,8 @@ class Token(object):
                 'proof_of_work': False
             }
 
-            if Alarm.stress_levels['activity'] >= 1:
+            # the uploads waiting for their admission slow down the submissions too
+            if Alarm.stress_levels['activity'] >= 1 or Alarm.stress_levels['uploads'] >= 1:
                 challenges_dict['human_captcha'] = True and GLSettings.memory_copy.enable_captcha
 
             # a proof of work is always required (if enabled at node level)
@@ -0,0 +1,543 @@
+# -*- coding: utf-8 -*-
+#
+#   uploads
+#   *******
+#
+# Registry of the chunked upload flows (flow.js) whose files are assembled
+# encrypted on disk while their chunks are received, in any order and on
+# parallel requests, hashing their plaintext in the same pass.
+from collections import deque
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+
+from globaleaks.rest import errors
+from globaleaks.security import GLSecureTemporaryFile
+from globaleaks.settings import GLSettings
+from globaleaks.utils.tempdict import TempDict
+from globaleaks.utils.utility import log
+
+
+# needed in order to allow UT override
+test_reactor = None
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadPending(Exception):
+    """
+    Raised to suspend the parsing of a request whose upload waits to be
+    admitted
+    """
+    pass
+
+
+def get_upload_key(request, flow_identifier):
+    """
+    Returns the key of the upload flow of a request; the flows are bound
+    to the resource and to the session they are uploaded with so that a
+    chunk could not be appended to the flow of another user.
+    """
+    return request.path, request.headers.get('X-Session'), flow_identifier
+
+
+def get_upload_owner(key):
+    """
+    Returns the owner whose quotas are charged for the flow of the given
+    key, that is the session or, for the submissions, the token in the path.
+    """
+    return key[1] if key[1] is not None else key[0]
+
+
+def get_int_argument(request, name, default=None):
+    try:
+        return int(request.arguments[name][0])
+    except (KeyError, ValueError):
+        return default
+
+
+def get_upload_size(request):
+    """
+    Returns the size declared for the file uploaded with the request or
+    the size of the request itself that could not be exceeded
+    """
+    total_size = get_int_argument(request, 'flowTotalSize')
+    if total_size is None or 'flowIdentifier' not in request.arguments:
+        total_size = int(request.headers.get('Content-Length', 0))
+
+    return total_size
+
+
+class UploadChunk(object):
+    """
+    Encrypts the content of a chunk in the file of its flow at its offset
+    using its own file handle and keystream so that the chunks of a flow
+    could be received concurrently.
+    """
+    def __init__(self, flow, number, offset):
+        self.flow = flow
+        self.number = number
+        self.offset = offset
+        self.size = 0
+
+        # the state of the hash of the flow when it reached the chunk
+        self.checkpoint = None
+
+        self.file = open(flow.file.filepath, 'r+b')
+        self.file.seek(offset)
+        self.encryptor = flow.file.get_encryptor(offset)
+
+    def write(self, data):
+        if self.offset + self.size + len(data) > self.flow.total_size:
+            raise UploadError("Chunk exceeding the declared size of the upload")
+
+        if self.flow.hashed == self.offset + self.size:
+            # the chunk is at the end of the plaintext hashed so far
+            self.flow.enter_chunk(self)
+            self.flow.file.hash.update(data)
+            self.flow.hashed += len(data)
+
+        self.file.write(self.encryptor.update(data))
+        self.size += len(data)
+        self.flow.manager.bytes_in_flight += len(data)
+
+    def close(self):
+        """
+        Marks the chunk as received once the request has been completely read
+        """
+        if not self.file.closed:
+            self.file.close()
+            self.flow.chunk_closed(self, True)
+
+    def abort(self):
+        """
+        Discards the chunk of an interrupted request; its bytes are
+        overwritten when the chunk is sent again.
+        """
+        if not self.file.closed:
+            self.file.close()
+            self.flow.chunk_closed(self, False)
+
+
+class UploadFlow(object):
+    def __init__(self, manager, key, owner, total_size):
+        self.manager = manager
+        self.key = key
+        self.owner = owner
+        self.total_size = total_size
+
+        self.file = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
+
+        # the chunks received by number
+        self.chunks = {}
+        self.active_chunks = []
+        self.closed = False
+
+        # the length of the plaintext hashed from the beginning of the file
+        self.hashed = 0
+
+    @property
+    def received(self):
+        return sum(chunk.size for chunk in self.chunks.values())
+
+    def is_complete(self):
+        if self.active_chunks or not self.chunks:
+            return False
+
+        # the file of a request without flow is carried by a single chunk
+        return self.key is None or self.received == self.total_size
+
+    def open_chunk(self, number, offset):
+        if self.closed:
+            raise UploadError("Upload flow closed")
+
+        chunk = UploadChunk(self, number, offset)
+        self.active_chunks.append(chunk)
+        return chunk
+
+    def chunk_closed(self, chunk, received):
+        self.active_chunks.remove(chunk)
+        self.manager.bytes_in_flight -= chunk.size
+
+        if received and not self.closed:
+            self.chunks[chunk.number] = chunk
+            self.update_hash()
+        elif self.key is None:
+            # the file of a request without flow could not be resumed
+            self.close()
+        elif chunk.checkpoint is not None:
+            # the plaintext of the chunk has to be hashed again once resent
+            self.file.hash, self.hashed = chunk.checkpoint
+
+            for other in self.active_chunks:
+                if other.checkpoint is not None and other.checkpoint[1] > self.hashed:
+                    other.checkpoint = None
+
+            self.update_hash()
+
+    def enter_chunk(self, chunk):
+        if chunk.checkpoint is None and chunk in self.active_chunks:
+            chunk.checkpoint = (self.file.hash.copy(), self.hashed)
+
+    def get_chunk_at(self, offset):
+        for chunk in self.chunks.values() + self.active_chunks:
+            if chunk.offset <= offset < chunk.offset + chunk.size:
+                return chunk
+
+    def update_hash(self):
+        """
+        Hashes the plaintext following the one hashed so far that has been
+        received out of order, reading it back from the file.
+        """
+        while not self.closed:
+            chunk = self.get_chunk_at(self.hashed)
+            if chunk is None:
+                return
+
+            self.enter_chunk(chunk)
+
+            if not chunk.file.closed:
+                chunk.file.flush()
+
+            end = chunk.offset + chunk.size
+            decryptor = self.file.get_encryptor(self.hashed)
+
+            with open(self.file.filepath, 'rb') as f:
+                f.seek(self.hashed)
+                while self.hashed < end:
+                    data = f.read(min(end - self.hashed, GLSettings.file_chunk_size))
+                    if not data:
+                        raise UploadError("Upload file truncated")
+
+                    self.file.hash.update(decryptor.update(data))
+                    self.hashed += len(data)
+
+    def get_sha256(self):
+        """
+        Returns the hex SHA-256 digest of the plaintext of a complete flow
+        """
+        self.update_hash()
+
+        if self.hashed != self.received:
+            raise UploadError("Upload flow not completely hashed")
+
+        return self.file.get_sha256()
+
+    def close(self):
+        """
+        Deletes the file of the flow along with its key so that what could
+        be left on disk could not be decrypted anymore.
+        """
+        if self.closed:
+            return
+
+        self.closed = True
+
+        for chunk in list(self.active_chunks):
+            chunk.abort()
+
+        self.file.close()
+
+        self.manager.release(self)
+
+
+class UploadFlowManager(TempDict):
+    """
+    Keeps the upload flows until they are completed or expire after
+    upload_flow_ttl seconds without new chunks, charging the size declared
+    for their files and their number to the global and per owner quotas.
+    """
+    def __init__(self):
+        TempDict.__init__(self)
+
+        # the flows of the requests without flowIdentifier
+        self.unbound = set()
+
+        self.admission = UploadAdmissionController(self)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.bytes_in_flight = 0
+        self.completed = 0
+        self.expired = 0
+        self.rejected = 0
+
+    def get_timeout(self):
+        return GLSettings.upload_flow_ttl
+
+    def get_reserved(self):
+        return sum(flow.total_size for flow in self.values()) + \
+               sum(flow.total_size for flow in self.unbound)
+
+    def get_flow(self, request):
+        flow_identifier = request.arguments.get('flowIdentifier', [None])[0]
+        if flow_identifier is None:
+            return None
+
+        return self.get(get_upload_key(request, flow_identifier))
+
+    def check_quotas(self, owner, total_size):
+        flows = [flow for flow in self.values() if flow.owner == owner]
+
+        if len(self) >= GLSettings.upload_flows_limit or \
+           len(flows) >= GLSettings.upload_flows_limit_per_owner:
+            raise errors.UploadQuotaExceeded("Too many uploads in progress")
+
+        if sum(flow.total_size for flow in self.values()) + total_size > GLSettings.upload_disk_quota or \
+           sum(flow.total_size for flow in flows) + total_size > GLSettings.upload_disk_quota_per_owner:
+            raise errors.UploadQuotaExceeded("Not enough space for the upload")
+
+    def open_chunk(self, request):
+        """
+        Returns the chunk receiving the file uploaded with the request,
+        creating its flow on the first chunk.
+
+        The offset of each chunk is obtained from its number and the chunk
+        size declared by flow.js; a request without flowIdentifier carries
+        a whole file and gets a flow of its own that is not registered.
+        """
+        flow_identifier = request.arguments.get('flowIdentifier', [None])[0]
+        total_size = get_int_argument(request, 'flowTotalSize')
+        chunk_number = get_int_argument(request, 'flowChunkNumber', 1)
+        chunk_size = get_int_argument(request, 'flowChunkSize')
+
+        if flow_identifier is None or total_size is None:
+            flow = UploadFlow(self, None, None, get_upload_size(request))
+            self.unbound.add(flow)
+            return flow.open_chunk(1, 0)
+
+        if total_size / (1024 * 1024) > GLSettings.memory_copy.maximum_filesize:
+            raise errors.FileTooBig(GLSettings.memory_copy.maximum_filesize)
+
+        key = get_upload_key(request, flow_identifier)
+
+        flow = self.get(key)
+        if flow is None:
+            owner = get_upload_owner(key)
+
+            try:
+                self.check_quotas(owner, total_size)
+            except errors.UploadQuotaExceeded:
+                self.rejected += 1
+                raise
+
+            flow = UploadFlow(self, key, owner, total_size)
+            self.set(key, flow)
+        elif flow.total_size != total_size:
+            raise errors.InvalidInputFormat("Upload size mismatch")
+
+        if chunk_size is None:
+            # without the chunk size the chunks have to be sent in order
+            offset = sum(chunk.size for number, chunk in flow.chunks.items() if number < chunk_number)
+        else:
+            offset = (chunk_number - 1) * chunk_size
+
+        if chunk_number < 1 or offset >= max(total_size, 1):
+            raise errors.InvalidInputFormat("Invalid upload chunk")
+
+        return flow.open_chunk(chunk_number, offset)
+
+    def complete(self, flow):
+        """
+        Removes the flow once its file has been completely received and
+        hands it to the caller
+        """
+        if flow.key is not None:
+            self.delete(flow.key)
+            self.completed += 1
+
+        self.release(flow)
+
+        return flow.file
+
+    def release(self, flow):
+        """
+        Called when the bytes reserved by the flow are released
+        """
+        self.unbound.discard(flow)
+        self.admission.process_queue()
+
+    def discard(self, flow):
+        if flow.key is not None:
+            self.delete(flow.key)
+
+        flow.close()
+
+    def discard_unbound(self, flows):
+        """
+        Discards the given flows without flowIdentifier that have not been
+        completed once the request carrying their file is over
+        """
+        for flow in flows:
+            if flow in self.unbound:
+                flow.close()
+
+    def _expire(self, key):
+        if key in self and self[key].active_chunks:
+            # a chunk is still being received
+            self.set(key, self[key])
+            return
+
+        TempDict._expire(self, key)
+
+        self.admission.process_queue()
+
+    def expireCallback(self, flow):
+        log.debug("Upload flow expired: %s" % flow.file.filepath)
+        self.expired += 1
+        flow.close()
+
+    def clear_flows(self):
+        for key in self.keys():
+            self.discard(self[key])
+
+        for flow in list(self.unbound):
+            flow.close()
+
+        self.admission.clear_queue()
+
+    def get_stats(self):
+        return {
+            'active_flows': len(self),
+            'active_chunks': sum(len(flow.active_chunks) for flow in self.values()),
+            'bytes_reserved': self.get_reserved(),
+            'bytes_received': sum(flow.received for flow in self.values()),
+            'bytes_in_flight': self.bytes_in_flight,
+            'completed': self.completed,
+            'expired': self.expired,
+            'rejected': self.rejected,
+            'admission': self.admission.get_stats()
+        }
+
+
+class UploadAdmissionController(object):
+    """
+    Admits the new uploads while the bytes reserved by the flows in
+    progress are within upload_admission_budget.
+
+    The requests of the uploads beyond the budget are paused and queued up
+    to upload_admission_queue_size and upload_admission_queue_timeout
+    seconds, and then refused with a Retry-After; the chunks of the flows
+    in progress are always admitted as their bytes are already reserved.
+    """
+    def __init__(self, flows):
+        self.flows = flows
+        self.queue = deque()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.admitted = 0
+        self.queued = 0
+        self.refused = 0
+        self.max_queue_length = 0
+
+    def get_reactor(self):
+        return test_reactor if test_reactor is not None else reactor
+
+    def fits(self, size):
+        return self.flows.get_reserved() + size <= GLSettings.upload_admission_budget
+
+    def refuse(self):
+        self.refused += 1
+        return errors.UploadBudgetExceeded(GLSettings.upload_admission_retry_after)
+
+    def admit(self, request):
+        """
+        Returns None if the upload of the request could proceed or a
+        Deferred fired when it is admitted; raises UploadBudgetExceeded
+        when the queue is full.
+        """
+        size = get_upload_size(request)
+
+        if self.flows.get_flow(request) is not None or (not self.queue and self.fits(size)):
+            self.admitted += 1
+            return None
+
+        if len(self.queue) >= GLSettings.upload_admission_queue_size:
+            self.update_stress_level()
+            raise self.refuse()
+
+        d = Deferred()
+        entry = [request, size, d, None]
+        entry[3] = self.get_reactor().callLater(GLSettings.upload_admission_queue_timeout,
+                                                self.expire, entry)
+
+        self.queue.append(entry)
+        self.queued += 1
+        self.max_queue_length = max(self.max_queue_length, len(self.queue))
+        self.update_stress_level()
+
+        return d
+
+    def expire(self, entry):
+        self.queue.remove(entry)
+        self.update_stress_level()
+        entry[2].errback(self.refuse())
+
+    def cancel(self, d):
+        for entry in self.queue:
+            if entry[2] is d:
+                self.queue.remove(entry)
+                entry[3].cancel()
+                break
+
+        self.process_queue()
+
+    def clear_queue(self):
+        while self.queue:
+            self.queue.popleft()[3].cancel()
+
+        self.update_stress_level()
+
+    def process_queue(self):
+        """
+        Admits in order the queued uploads that fit in the budget; the
+        flow of an admitted upload is created synchronously by the callback.
+        """
+        while self.queue:
+            request, size, d, timeout = self.queue[0]
+
+            if self.flows.get_flow(request) is None and not self.fits(size):
+                break
+
+            self.queue.popleft()
+            timeout.cancel()
+            self.admitted += 1
+            d.callback(None)
+
+        self.update_stress_level()
+
+    def get_stress_level(self):
+        if len(self.queue) >= GLSettings.upload_admission_queue_size:
+            return 2
+
+        if self.queue or self.flows.get_reserved() >= GLSettings.upload_admission_budget * 0.8:
+            return 1
+
+        return 0
+
+    def update_stress_level(self):
+        # imported here as the anomaly module depends on the handlers
+        from globaleaks.anomaly import Alarm
+
+        stress_level = self.get_stress_level()
+        if Alarm.stress_levels['uploads'] != stress_level:
+            log.debug("Switching upload stress level to %d" % stress_level)
+            Alarm.stress_levels['uploads'] = stress_level
+
+    def get_stats(self):
+        return {
+            'budget': GLSettings.upload_admission_budget,
+            'bytes_reserved': self.flows.get_reserved(),
+            'queue_length': len(self.queue),
+            'max_queue_length': self.max_queue_length,
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'refused': self.refused
+        }
+
+
+upload_flows = UploadFlowManager()
+upload_admission = upload_flows.admission
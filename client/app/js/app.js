@@ -367,14 +367,18 @@ var GLClient = angular.module('GLClient', [
         chunkSize: 1024 * 1024,
         forceChunkSize: true,
         testChunks: false,
-        simultaneousUploads: 1,
+        simultaneousUploads: 3,
+        // the uploads refused while the backend is busy are retried
+        maxChunkRetries: 10,
+        chunkRetryInterval: 30000,
+        permanentErrors: [404, 406, 413, 415, 500, 501],
         generateUniqueIdentifier: function () {
           return Math.random() * 1000000 + 1000000;
         }
     };
 }]).
-  run(['$q', '$rootScope', '$http', '$route', '$routeParams', '$location',  '$filter', '$translate', '$uibModal', '$timeout', '$templateCache', 'Authentication', 'PublicResource', 'Utils', 'fieldUtilities', 'GLTranslate',
-      function($q, $rootScope, $http, $route, $routeParams, $location, $filter, $translate, $uibModal, $timeout, $templateCache, Authentication, PublicResource, Utils, fieldUtilities, GLTranslate) {
+  run(['$q', '$rootScope', '$http', '$route', '$routeParams', '$location',  '$filter', '$translate', '$uibModal', '$timeout', 'Authentication', 'PublicResource', 'Utils', 'fieldUtilities', 'GLTranslate',
+      function($q, $rootScope, $http, $route, $routeParams, $location, $filter, $translate, $uibModal, $timeout, Authentication, PublicResource, Utils, fieldUtilities, GLTranslate) {
 
     $rootScope.Authentication = Authentication;
     $rootScope.GLTranslate = GLTranslate;
@@ -430,10 +434,6 @@ var GLClient = angular.module('GLClient', [
       var deferred = $q.defer();
 
       PublicResource.get(function(result, getResponseHeaders) {
-        if (result.node.homepage) {
-          $templateCache.put('custom_homepage.html', atob(result.node.homepage));
-        }
-
         $rootScope.node = result.node;
         $rootScope.contexts = result.contexts;
         $rootScope.receivers = result.receivers;
@@ -842,8 +842,8 @@ factory("Access", ["$q", "Authentication", function ($q, Authentication) {
   factory('DefaultL10NResource', ['GLResource', function(GLResource) {
     return new GLResource('l10n/:lang.json', {lang: '@lang'});
 }]).
-  factory('Utils', ['$rootScope', '$location', '$filter', '$sce', '$uibModal', 'Authentication',
-  function($rootScope, $location, $filter, $sce, $uibModal, Authentication) {
+  factory('Utils', ['$rootScope', '$location', '$filter', '$uibModal', 'Authentication',
+  function($rootScope, $location, $filter, $uibModal, Authentication) {
     return {
       getXOrderProperty: function() {
         return 'x';
@@ -869,10 +869,6 @@ factory("Access", ["$q", "Authentication", function ($q, Authentication) {
         }
       },
 
-      base64ToTrustedScriptUrl: function(base64_data) {
-        return $sce.trustAsResourceUrl('data:application/javascript;base64,' + base64_data);
-      },
-
       update: function (model, cb, errcb) {
         var success = {};
         model.$update(function() {
@@ -891,12 +887,12 @@ factory("Access", ["$q", "Authentication", function ($q, Authentication) {
         return Math.random() * 1000000 + 1000000;
       },
 
-      imgDataUri: function(data) {
-        if (data === '') {
-          data = 'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8Xw8AAoMBgDTD2qgAAAAASUVORK5CYII=';
+      imgUrl: function(url) {
+        if (url === '') {
+          url = 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8Xw8AAoMBgDTD2qgAAAAASUVORK5CYII=';
         }
 
-        return 'data:image/png;base64,' + data;
+        return url;
       },
 
       isHomepage: function () {